@@ -100,7 +100,7 @@ class ExpressionParser:
         while self.match('KEYWORD', 'or'):
             self.consume('KEYWORD', 'or')
             right = self.parse_and_expression()
-            node = OperatorNode(self.operatorMap['or'], node, right)
+            node = make_operator_node(self.operatorMap['or'], node, right)
         return node
 
     def parse_and_expression(self) -> ExpressionNode:
@@ -109,7 +109,7 @@ class ExpressionParser:
         while self.match('KEYWORD', 'and'):
             self.consume('KEYWORD', 'and')
             right = self.parse_not_expression()
-            node = OperatorNode(self.operatorMap['and'], node, right)
+            node = make_operator_node(self.operatorMap['and'], node, right)
         return node
 
     def parse_not_expression(self) -> ExpressionNode:
@@ -117,7 +117,7 @@ class ExpressionParser:
         if self.match('KEYWORD', 'not'):
             self.consume('KEYWORD', 'not')
             operand = self.parse_not_expression()
-            node = OperatorNode(self.operatorMap['not'], operand)
+            node = make_operator_node(self.operatorMap['not'], operand)
             return node
         else:
             return self.parse_comparison()
@@ -129,7 +129,7 @@ class ExpressionParser:
             opToken = self.consume('OP')
             operatorFn = self.operatorMap[opToken[1]]
             right = self.parse_add_expr()
-            node = OperatorNode(operatorFn, node, right)
+            node = make_operator_node(operatorFn, node, right)
         return node
 
     def parse_add_expr(self) -> ExpressionNode:
@@ -139,7 +139,7 @@ class ExpressionParser:
             opToken = self.consume('OP')
             operatorFn = self.operatorMap[opToken[1]]
             right = self.parse_mul_expr()
-            node = OperatorNode(operatorFn, node, right)
+            node = make_operator_node(operatorFn, node, right)
         return node
 
     def parse_mul_expr(self) -> ExpressionNode:
@@ -149,7 +149,7 @@ class ExpressionParser:
             opToken = self.consume('OP')
             operatorFn = self.operatorMap[opToken[1]]
             right = self.parse_unary_expr()
-            node = OperatorNode(operatorFn, node, right)
+            node = make_operator_node(operatorFn, node, right)
         return node
 
     def parse_unary_expr(self) -> ExpressionNode:
@@ -158,7 +158,7 @@ class ExpressionParser:
             opToken = self.consume('OP')
             operatorFn = self.operatorMap[opToken[1]]
             operand = self.parse_unary_expr()
-            node = OperatorNode(operatorFn, operand)
+            node = make_operator_node(operatorFn, operand)
             return node
         else:
             return self.parse_postfix_expr()
@@ -171,7 +171,7 @@ class ExpressionParser:
                 opToken = self.consume('OP')
                 operatorFn = self.operatorMap[opToken[1]]
                 right = self.parse_primary()
-                node = OperatorNode(operatorFn, node, right)
+                node = make_operator_node(operatorFn, node, right)
             else:
                 break
         return node
@@ -0,0 +1,411 @@
+from typing import Callable, FrozenSet, List, Optional, Sequence, Set, Tuple
+from CARRI.problem import Problem, ACCESS_CONSTANT, ACCESS_ITEM
+from CARRI.expression import (ExpressionNode, ConstNode, ParameterNode, ValueIndexNode, ValueNode,
+                              ExistingExpressionNode, OperatorNode, Update, ConstUpdate, ExpressionIndexUpdate,
+                              ExpressionUpdate, ExpressionRemoveUpdate, ExpressionAddUpdate, ExpressionReplaceUpdate,
+                              ParameterUpdate, CaseUpdate, AllUpdate, RepeatUpdate, CostExpression, operatorStringMap)
+from CARRI.compiler import compile_expression
+from CARRI.itemAggregates import ItemAggregateNode
+
+# Kind of the target of entity accesses: ('entity', entityIndex). Adding, removing and replacing
+# items writes their entity and all their keys; existence checks and `all` loops read the entity.
+ENTITY_TARGET = 'entity'
+# Kind of the target of accesses through names that aren't bound to accessors: ('name', variableName).
+NAME_TARGET = 'name'
+
+
+class AnyIndex:
+    """The index of an access whose index isn't known statically - it may be any index."""
+    __slots__ = ()
+
+    def __repr__(self):
+        return "*"
+
+
+ANY = AnyIndex()
+
+
+class Access:
+    """
+    A symbolic access: a variable, items key or entity (the target) at an index expression.
+
+    The index is grounded by a function of (problem, state, slots) compiled from the expression,
+    or is ANY if it depends on parameters assigned while applying (NewVal and All parameters) or on unknown nodes.
+    """
+    __slots__ = ('target', 'name', 'index', 'indexReads', 'grounder')
+
+    def __init__(self, target: Tuple, name: str, index: Optional[ExpressionNode], indexReads: FrozenSet = frozenset(),
+                 grounder: Optional[Callable] = None):
+        """
+        Initialize an Access.
+
+        Args:
+            target (Tuple): An accessor (see Problem.resolve_accessor), (ENTITY_TARGET, entityIndex)
+                            or (NAME_TARGET, variableName).
+            name (str): The target's name, for display.
+            index (ExpressionNode, optional): The index expression, None for any index.
+            indexReads (FrozenSet): The targets the index expression reads.
+            grounder (Callable, optional): The compiled index expression, None for any index.
+        """
+        self.target = target
+        self.name = name
+        self.index = index
+        self.indexReads = indexReads
+        self.grounder = grounder
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __str__(self):
+        return "{}[{}]".format(self.name, "*" if self.index is None else format_index(self.index))
+
+    def __getstate__(self):
+        """
+        Pickle without the grounder - functions generated by compile() can't be pickled. Unpickled, it's ANY:
+        simulators re-analyze their accesses instead (see Simulator.__setstate__).
+        """
+        return self.target, self.name, self.index, self.indexReads
+
+    def __setstate__(self, state):
+        self.target, self.name, self.index, self.indexReads = state
+        self.grounder = None
+
+
+class AccessSets:
+    """
+    Symbolic read and write sets of a step - an action generator, environment step or iteration step.
+
+    Reads cover the preconditions, and the conditions, indexes and values of the effects and the cost;
+    writes cover the effects and the cost's updates. Branches are included whether or not they are taken.
+    """
+    __slots__ = ('reads', 'writes', 'unknown', 'writtenTargets')
+
+    def __init__(self, reads: List[Access], writes: List[Access], unknown: bool):
+        """
+        Initialize AccessSets.
+
+        Args:
+            reads (List[Access]): The reads.
+            writes (List[Access]): The writes.
+            unknown (bool): True if the step has nodes whose accesses aren't known - it may access anything.
+        """
+        self.reads = reads
+        self.writes = writes
+        self.unknown = unknown
+        self.writtenTargets = frozenset(access.target for access in writes)
+
+    def __str__(self):
+        return "reads {}; writes {}{}".format(", ".join(map(str, self.reads)), ", ".join(map(str, self.writes)),
+                                              "; unknown accesses" if self.unknown else "")
+
+    def ground(self, problem: Problem, slots: Sequence = (), state=None) -> 'GroundAccessSets':
+        """
+        Ground the accesses with parameter values.
+
+        Indexes reading the state are evaluated in state if it's given and the step doesn't write
+        what they read (applying the step can't change them), and are ANY otherwise.
+
+        Args:
+            problem (Problem): The problem.
+            slots (Sequence): The step's parameter values, in the order of its parameters.
+            state (State, optional): The state the step is validated and applied in.
+
+        Returns:
+            GroundAccessSets: The concrete accesses.
+        """
+        return GroundAccessSets(frozenset(self.ground_access(access, problem, slots, state) for access in self.reads),
+                                frozenset(self.ground_access(access, problem, slots, state) for access in self.writes),
+                                self.unknown)
+
+    def ground_access(self, access: Access, problem: Problem, slots: Sequence, state) -> Tuple:
+        """Return (target, index) of an access, see ground."""
+        if access.grounder is None:
+            return access.target, ANY
+        if access.indexReads and (state is None or access.indexReads & self.writtenTargets):
+            return access.target, ANY
+        try:
+            index = access.grounder(problem, state, slots)
+            hash(index)
+        except (LookupError, TypeError, ValueError, AttributeError):
+            # Left to fail when the step is validated or applied
+            return access.target, ANY
+        return access.target, index
+
+
+class GroundAccessSets:
+    """Concrete read and write sets of a grounded step: (target, index) pairs, index possibly ANY."""
+    __slots__ = ('reads', 'writes', 'unknown')
+
+    def __init__(self, reads: FrozenSet[Tuple], writes: FrozenSet[Tuple], unknown: bool):
+        self.reads = reads
+        self.writes = writes
+        self.unknown = unknown
+
+    def __str__(self):
+        return "reads {}; writes {}{}".format(sorted(map(str, self.reads)), sorted(map(str, self.writes)),
+                                              "; unknown accesses" if self.unknown else "")
+
+    def interferes(self, other: 'GroundAccessSets') -> bool:
+        """
+        Check if two grounded steps may interfere: one writes what the other reads or writes,
+        so their outcome or validity may depend on their order.
+
+        Args:
+            other (GroundAccessSets): The other step's accesses.
+
+        Returns:
+            bool: True if they may interfere, False if they're independent.
+        """
+        if self.unknown or other.unknown:
+            return True
+        return (overlaps(self.writes, other.writes) or overlaps(self.writes, other.reads)
+                or overlaps(other.writes, self.reads))
+
+
+def overlaps(first: FrozenSet[Tuple], second: FrozenSet[Tuple]) -> bool:
+    """Check if two sets of (target, index) accesses share an access, an ANY index matching every index."""
+    if not first or not second:
+        return False
+    if len(first) > len(second):
+        first, second = second, first
+    indexes = {}
+    for target, index in second:
+        indexes.setdefault(target, set()).add(index)
+    for target, index in first:
+        targetIndexes = indexes.get(target)
+        if targetIndexes is not None and (index is ANY or ANY in targetIndexes or index in targetIndexes):
+            return True
+    return False
+
+
+def format_index(node: ExpressionNode) -> str:
+    """Return a short text of an index expression: parameters as paramN, reads as name[index]."""
+    if isinstance(node, ConstNode):
+        return str(node.const)
+    if isinstance(node, ParameterNode):
+        return "param{}".format(node.index)
+    if isinstance(node, ValueIndexNode):
+        return "{}[{}]".format(node.variableName, node.index)
+    if isinstance(node, ValueNode):
+        return "{}[{}]".format(node.variableName, format_index(node.expression))
+    if isinstance(node, OperatorNode) and len(node.operands) == 2:
+        return "({} {} {})".format(format_index(node.operands[0]), operatorStringMap.get(node.operator, "?"),
+                                   format_index(node.operands[1]))
+    if isinstance(node, OperatorNode) and len(node.operands) == 1:
+        return "{} {}".format(operatorStringMap.get(node.operator, "?"), format_index(node.operands[0]))
+    return "*"
+
+
+class AccessAnalyzer:
+    """
+    Collects the symbolic accesses of a step's expression and update trees (see AccessSets).
+
+    Parameters given to the analyzer are the step's own (an action generator's); others met in the trees,
+    assigned while applying (NewVal and All parameters), make the indexes using them ANY.
+    """
+    def __init__(self, problem: Problem, parameters: Sequence[ParameterNode] = ()):
+        """
+        Initialize an AccessAnalyzer.
+
+        Args:
+            problem (Problem): The problem. Accessors should be bound (see bind_accessors).
+            parameters (Sequence[ParameterNode]): The step's parameters, read from slots when grounding.
+        """
+        self.problem = problem
+        self.parameters = parameters
+        self.parameterIds = {id(parameter) for parameter in parameters}
+        self.reads = []
+        self.writes = []
+        self.unknown = False
+        # (target, index text) of the collected reads and writes, to keep each access once
+        self.readKeys = set()
+        self.writeKeys = set()
+        # id of an index expression -> its compiled form, shared by its accesses
+        self.grounders = {}
+        # Per items index, {target: name} of its keys
+        self.itemKeys = {}
+        for name, (itemsIndex, keyIndex) in problem.itemKeysPositions.items():
+            self.itemKeys.setdefault(itemsIndex, {})[(ACCESS_ITEM, itemsIndex, keyIndex)] = name
+        self.entityNames = {entityIndex: name for name, (entityIndex, _) in problem.entities.items()}
+
+    def analyze(self, preconditions: Sequence[ExpressionNode] = (), updates: Sequence[Update] = (),
+                cost=None) -> AccessSets:
+        """
+        Collect the accesses of a step.
+
+        Args:
+            preconditions (Sequence[ExpressionNode]): The step's preconditions and conflicting preconditions.
+            updates (Sequence[Update]): The step's effects.
+            cost (ExpressionNode, optional): The step's cost - a CostExpression or another expression.
+
+        Returns:
+            AccessSets: The step's symbolic accesses.
+        """
+        for precondition in preconditions:
+            self.expression(precondition)
+        self.updates(updates)
+        if isinstance(cost, ItemAggregateNode):
+            # Reads what the cost it stands for reads
+            cost = cost.cost
+        if isinstance(cost, CostExpression):
+            self.updates(cost.updates)
+            self.expression(cost.costExpression)
+        elif cost is not None:
+            self.expression(cost)
+        return AccessSets(self.reads, self.writes, self.unknown)
+
+    def access(self, accesses: List[Access], keys: Set, target: Tuple, name: str, index: Optional[ExpressionNode]):
+        """Add an access of target at index (None for any index) to accesses, unless it's there."""
+        if index is not None and not self.groundable(index):
+            index = None
+        key = (target, None if index is None else format_index(index))
+        if key in keys:
+            return
+        keys.add(key)
+        if index is None:
+            accesses.append(Access(target, name, None))
+            return
+        indexReads = set()
+        self.index_reads(index, indexReads)
+        grounder = self.grounders.get(id(index))
+        if grounder is None:
+            grounder = compile_expression(index, self.problem, self.parameters)
+            self.grounders[id(index)] = grounder
+        accesses.append(Access(target, name, index, frozenset(indexReads), grounder))
+
+    def groundable(self, node: ExpressionNode) -> bool:
+        """Check if an index expression uses only the step's parameters and nodes the analysis knows."""
+        if isinstance(node, ConstNode):
+            return True
+        if isinstance(node, ParameterNode):
+            return id(node) in self.parameterIds
+        if isinstance(node, ValueIndexNode):
+            return node.accessor is not None
+        if isinstance(node, ValueNode):
+            return node.accessor is not None and self.groundable(node.expression)
+        if isinstance(node, ExistingExpressionNode):
+            return self.groundable(node.expression)
+        if isinstance(node, OperatorNode):
+            return all(self.groundable(operand) for operand in node.operands)
+        return False
+
+    def index_reads(self, node: ExpressionNode, targets: Set):
+        """Add the targets an index expression reads to targets."""
+        if isinstance(node, (ValueIndexNode, ValueNode)) and node.accessor[0] != ACCESS_CONSTANT:
+            targets.add(node.accessor)
+        elif isinstance(node, ExistingExpressionNode):
+            targets.add((ENTITY_TARGET, node.entityIndex))
+        if isinstance(node, (ValueNode, ExistingExpressionNode)):
+            self.index_reads(node.expression, targets)
+        elif isinstance(node, OperatorNode):
+            for operand in node.operands:
+                self.index_reads(operand, targets)
+
+    def target(self, accessor: Optional[Tuple], variableName: str) -> Tuple:
+        """Return the target of an access through an accessor, by name if it's unbound."""
+        return (NAME_TARGET, variableName) if accessor is None else accessor
+
+    def read(self, target: Tuple, name: str, index: Optional[ExpressionNode]):
+        """Add a read."""
+        self.access(self.reads, self.readKeys, target, name, index)
+
+    def write(self, target: Tuple, name: str, index: Optional[ExpressionNode]):
+        """Add a write."""
+        self.access(self.writes, self.writeKeys, target, name, index)
+
+    def read_entity(self, entityIndex: int, index: Optional[ExpressionNode]):
+        """Add the read of an entity's ids."""
+        self.read((ENTITY_TARGET, entityIndex), self.entityNames.get(entityIndex, str(entityIndex)), index)
+
+    def write_entity(self, entityIndex: int, index: Optional[ExpressionNode]):
+        """Add the writes of adding, removing or replacing an item: its entity and all its keys."""
+        self.write((ENTITY_TARGET, entityIndex), self.entityNames.get(entityIndex, str(entityIndex)), index)
+        itemKeys = self.itemKeys.get(self.problem.entityIdToItemId.get(entityIndex), {})
+        for target in sorted(itemKeys):
+            self.write(target, itemKeys[target], index)
+
+    def expression(self, node: ExpressionNode):
+        """Add the reads of an expression."""
+        if isinstance(node, (ConstNode, ParameterNode)):
+            return
+        if isinstance(node, ValueIndexNode):
+            if node.accessor is None or node.accessor[0] != ACCESS_CONSTANT:
+                self.read(self.target(node.accessor, node.variableName), node.variableName, ConstNode(node.index))
+        elif isinstance(node, ValueNode):
+            if node.accessor is None or node.accessor[0] != ACCESS_CONSTANT:
+                self.read(self.target(node.accessor, node.variableName), node.variableName, node.expression)
+            self.expression(node.expression)
+        elif isinstance(node, ExistingExpressionNode):
+            self.read_entity(node.entityIndex, node.expression)
+            self.expression(node.expression)
+        elif isinstance(node, OperatorNode):
+            for operand in node.operands:
+                self.expression(operand)
+        else:
+            self.unknown = True
+
+    def updates(self, updates: Sequence[Update]):
+        """Add the reads and writes of updates."""
+        for update in updates:
+            self.update(update)
+
+    def update(self, update: Update):
+        """Add the reads and writes of an update."""
+        if isinstance(update, ConstUpdate):
+            self.write(self.target(update.accessor, update.variableName), update.variableName,
+                       ConstNode(update.index))
+        elif isinstance(update, ExpressionIndexUpdate):
+            self.expression(update.expression)
+            self.write(self.target(update.accessor, update.variableName), update.variableName,
+                       ConstNode(update.index))
+        elif isinstance(update, ExpressionUpdate):
+            self.expression(update.expressionIndex)
+            self.expression(update.expressionValue)
+            self.write(self.target(update.accessor, update.variableName), update.variableName,
+                       update.expressionIndex)
+        elif isinstance(update, ExpressionRemoveUpdate):
+            self.expression(update.expression)
+            self.write_entity(update.entityIndex, update.expression)
+        elif isinstance(update, ExpressionAddUpdate):
+            for expression in update.expressions:
+                self.expression(expression)
+            self.write_entity(update.entityIndex, None)
+        elif isinstance(update, ExpressionReplaceUpdate):
+            self.expression(update.expressionId)
+            for expression in update.expressions:
+                self.expression(expression)
+            self.write_entity(update.entityIndex, update.expressionId)
+        elif isinstance(update, ParameterUpdate):
+            self.expression(update.expression)
+        elif isinstance(update, CaseUpdate):
+            self.expression(update.condition)
+            self.updates(update.updates)
+            self.updates(update.elseUpdates)
+        elif isinstance(update, RepeatUpdate):
+            self.expression(update.condition)
+            self.updates(update.updates)
+        elif isinstance(update, AllUpdate):
+            self.read_entity(update.entityIndex, None)
+            if update.condition is not None:
+                self.expression(update.condition)
+            self.updates(update.updates)
+        else:
+            self.unknown = True
+
+
+def analyze_step(problem: Problem, preconditions: Sequence[ExpressionNode] = (), updates: Sequence[Update] = (),
+                 cost=None, parameters: Sequence[ParameterNode] = ()) -> AccessSets:
+    """
+    Collect the symbolic read and write sets of a step, see AccessAnalyzer.
+
+    Args:
+        problem (Problem): The problem. Accessors should be bound (see bind_accessors).
+        preconditions (Sequence[ExpressionNode]): The step's preconditions and conflicting preconditions.
+        updates (Sequence[Update]): The step's effects.
+        cost (ExpressionNode, optional): The step's cost.
+        parameters (Sequence[ParameterNode]): The step's parameters, read from slots when grounding.
+
+    Returns:
+        AccessSets: The step's accesses.
+    """
+    return AccessAnalyzer(problem, parameters).analyze(preconditions, updates, cost)
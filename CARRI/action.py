@@ -1,13 +1,20 @@
 from typing import List, Iterable
 from CARRI.problem import Problem
 from CARRI.state import State
-from CARRI.expression import ExpressionNode, ValueParameterNode, Update, CostExpression
+from CARRI.expression import (ExpressionNode, ValueParameterNode, Update, CostExpression,
+                              find_index_probe, resolve_index_probe, find_adjacency_probe)
+from CARRI.compiler import compile_expressions, compile_conjunction, compile_updates
+from CARRI.batchEvaluation import (StateBatch, compile_batch_conjunction, evaluate_batch, compile_domain_filter,
+                                   filter_candidates)
 
 
 class Step:
     """Represents a step in the simulation, consisting of effects to apply."""
-    def __init__(self, effects: List[Update]):
+    __slots__ = ('effects', 'compiled')
+
+    def __init__(self, effects: List[Update], compiled=None):
         self.effects = effects  # List of Effect objects
+        self.compiled = compiled  # The effects fused by CARRI.compiler, None to apply them one by one
 
     def __repr__(self):
         return str(self.effects)
@@ -15,13 +22,28 @@ class Step:
     def __str__(self):
         return "Step effects: " + str(self.effects)
 
+    def __getstate__(self):
+        """Pickle without the compiled forms - functions generated by compile() can't be pickled."""
+        return {name: getattr(self, name) for cls in type(self).__mro__ for name in cls.__dict__.get('__slots__', ())
+                if not name.startswith('compiled')}
+
+    def __setstate__(self, state):
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                setattr(self, name, state.get(name))
+
     def apply(self, problem, state):
+        if self.compiled is not None:
+            self.compiled(problem, state, ())
+            return
         for effect in self.effects:
             effect.apply(problem, state)
 
 
 class EnvStep(Step):
     """Represents an environmental step with a name, effects, and cost."""
+    __slots__ = ('name', 'cost')
+
     def __init__(self, name: str, effects: List[Update], cost: CostExpression):
         super().__init__(effects)
         self.name = name
@@ -36,24 +58,72 @@ class EnvStep(Step):
 
 class Action(EnvStep):
     """Represents an action that can be performed, with preconditions and effects."""
+    __slots__ = ('preconditions', 'conflictingPreconditions', 'params', 'baseAction',
+                 'compiledValidate', 'compiledReValidate', 'compiledBatchValidate', 'compiledBatchReValidate')
+
     def __init__(self, name: str, preconditions: List[ExpressionNode],
                  conflictingPreconditions: List[ExpressionNode],
-                 effects: List[Update], cost: CostExpression, params: List[ValueParameterNode], baseAction):
+                 effects: List[Update], cost: CostExpression, params: List[ValueParameterNode], baseAction,
+                 compiledValidate=None, compiledReValidate=None, compiledEffects=None,
+                 compiledBatchValidate=None, compiledBatchReValidate=None):
         super().__init__(name, effects, cost)
         self.preconditions = preconditions  # List of precondition expressions
         self.conflictingPreconditions = conflictingPreconditions  # List of conflicting precondition expressions
         self.params = params  # List of parameter nodes
         self.baseAction = baseAction
+        # The generator's compiled preconditions checks (see ActionGenerator.compile_expressions), None to interpret
+        self.compiledValidate = compiledValidate
+        self.compiledReValidate = compiledReValidate
+        self.compiled = compiledEffects
+        # The same checks compiled for StateBatches, None to check the batches' states one by one
+        self.compiledBatchValidate = compiledBatchValidate
+        self.compiledBatchReValidate = compiledBatchReValidate
 
     def validate(self, problem, state):
         """Check if action's preconditions and conflicting preconditions are satisfied in the current state."""
+        if self.compiledValidate is not None:
+            return self.compiledValidate(problem, state, [param.value for param in self.params])
         return (all(precondition.evaluate(problem, state) for precondition in self.preconditions)
                 and all(precondition.evaluate(problem, state) for precondition in self.conflictingPreconditions))
 
     def reValidate(self, problem, state):
         """Re-validate the conflicting preconditions in the current state."""
+        if self.compiledReValidate is not None:
+            return self.compiledReValidate(problem, state, [param.value for param in self.params])
         return all(precondition.evaluate(problem, state) for precondition in self.conflictingPreconditions)
 
+    def validate_batch(self, problem, batch: StateBatch):
+        """
+        Check validate in every state of a batch (see CARRI.batchEvaluation).
+
+        Returns:
+            np.ndarray: A boolean per state of the batch.
+        """
+        return evaluate_batch(self.compiledBatchValidate, self.validate, problem, batch,
+                              [param.value for param in self.params])
+
+    def reValidate_batch(self, problem, batch: StateBatch):
+        """
+        Check reValidate in every state of a batch (see CARRI.batchEvaluation).
+
+        Returns:
+            np.ndarray: A boolean per state of the batch.
+        """
+        return evaluate_batch(self.compiledBatchReValidate, self.reValidate, problem, batch,
+                              [param.value for param in self.params])
+
+    def apply(self, problem, state):
+        if self.compiled is not None:
+            self.compiled(problem, state, [param.value for param in self.params])
+            return
+        for effect in self.effects:
+            effect.apply(problem, state)
+
+    def get_cost(self, problem, state):
+        if isinstance(self.cost, CostExpression):
+            return self.cost.evaluate(problem, state, [param.value for param in self.params])
+        return self.cost.evaluate(problem, state)
+
     def __str__(self):
         return str(self.name)
 
@@ -73,11 +143,43 @@ class ActionGenerator:
         self.paramExpressions = paramExpressions  # List of parameter expressions
         self.applicablePrecsRanges = []
         self.applicableConfPrecsRanges = []
+        # Per parameter: (item key name, expression) the parameter's item key must equal, or None.
+        self.indexProbes = [None] * len(paramExpressions)
+        # Per parameter: (adjacency constant name, expression) the parameter must be a neighbour of, or None.
+        self.adjacencyProbes = [None] * len(paramExpressions)
         self.baseActionName = baseActionName
+        # Preconditions and effects compiled by compile_expressions, None to interpret them
+        self.compiledPreconditions = None
+        self.compiledConflictingPreconditions = None
+        self.compiledEffects = None
+        # All preconditions, and the conflicting preconditions, compiled into single checks of generated actions
+        self.compiledValidate = None
+        self.compiledReValidate = None
+        # The same checks compiled for StateBatches (see CARRI.batchEvaluation), None if they can't be
+        self.compiledBatchValidate = None
+        self.compiledBatchReValidate = None
+        # Per parameter after the first, its applicable preconditions compiled for CandidateBatches of its values
+        # (see CARRI.batchEvaluation), None if they can't be - empty to filter the values one by one
+        self.compiledDomainFilters = []
+        # Values of paramExpressions, read by the compiled preconditions during action production
+        self.slots = [None] * len(paramExpressions)
 
     def __repr__(self):
         return self.__str__()
 
+    def __getstate__(self):
+        """Pickle without the compiled preconditions - functions generated by compile() can't be pickled."""
+        state = self.__dict__.copy()
+        state['compiledPreconditions'] = None
+        state['compiledConflictingPreconditions'] = None
+        state['compiledEffects'] = None
+        state['compiledValidate'] = None
+        state['compiledReValidate'] = None
+        state['compiledBatchValidate'] = None
+        state['compiledBatchReValidate'] = None
+        state['compiledDomainFilters'] = []
+        return state
+
     def __str__(self):
         return ("Action: " + self.name + "\nEntities: " + str(self.entities)
                 + "\nParams: " + str(self.params) + "\nPreconditions: " + str(self.preconditions)
@@ -102,10 +204,52 @@ class ActionGenerator:
             effects=effects,
             cost=cost,
             params=newParams,
-            baseAction=self.baseActionName
+            baseAction=self.baseActionName,
+            compiledValidate=self.compiledValidate,
+            compiledReValidate=self.compiledReValidate,
+            compiledEffects=self.compiledEffects,
+            compiledBatchValidate=self.compiledBatchValidate,
+            compiledBatchReValidate=self.compiledBatchReValidate
         )
         return action
 
+    def compile_expressions(self, problem: Problem):
+        """
+        Compile the preconditions, and fuse the effects and the cost (see CARRI.compiler),
+        reading the parameters from slots.
+
+        Preconditions are compiled one by one, for checking them while assigning parameters, and together,
+        sharing their repeated reads, for validating generated actions - in one state, and in StateBatches
+        when they can be vectorised. The preconditions applicable to each parameter are also compiled
+        together, when they can be vectorised, for filtering all its candidate values at once.
+        Generated actions share the compiled forms, passing their own parameter values as slots.
+        Should be called after reArrangePreconditions and bind_accessors.
+
+        Args:
+            problem (Problem): The problem the actions are produced for.
+        """
+        self.compiledPreconditions = compile_expressions(self.preconditions, problem, self.paramExpressions)
+        self.compiledConflictingPreconditions = compile_expressions(self.conflictingPreconditions, problem,
+                                                                    self.paramExpressions)
+        self.compiledValidate = compile_conjunction(self.preconditions + self.conflictingPreconditions, problem,
+                                                    self.paramExpressions)
+        self.compiledReValidate = compile_conjunction(self.conflictingPreconditions, problem, self.paramExpressions)
+        self.compiledBatchValidate = compile_batch_conjunction(self.preconditions + self.conflictingPreconditions,
+                                                               problem, self.paramExpressions)
+        self.compiledBatchReValidate = compile_batch_conjunction(self.conflictingPreconditions, problem,
+                                                                 self.paramExpressions)
+        self.compiledDomainFilters = [
+            compile_domain_filter([self.preconditions[index] for index in precsRange]
+                                  + [self.conflictingPreconditions[index] for index in confPrecsRange],
+                                  problem, self.paramExpressions, paramIndex)
+            if paramIndex > 0 else None
+            for paramIndex, (precsRange, confPrecsRange) in enumerate(zip(self.applicablePrecsRanges,
+                                                                         self.applicableConfPrecsRanges))]
+        self.compiledEffects = compile_updates(self.effects, problem, self.paramExpressions)
+        if isinstance(self.cost, CostExpression):
+            self.cost.compiled = compile_updates(self.cost.updates, problem, self.paramExpressions,
+                                                 self.cost.costExpression)
+
     def resetParams(self):
         """Reset all parameter expressions to None."""
         for param in self.paramExpressions:
@@ -159,6 +303,61 @@ class ActionGenerator:
         self.conflictingPreconditions = newOrderConfPrecs
 
 
+    def find_index_probes(self, problem: Problem):
+        """
+        Find, per parameter, a precondition `Items key ?param = expression` checked when the parameter is assigned.
+
+        Only items whose key equals the expression's value can pass it, so the parameter's
+        candidates can be looked up in an item index (Problem.ids_where) instead of trying all items.
+        Should be called after reArrangePreconditions.
+
+        Args:
+            problem (Problem): The problem the actions are produced for.
+        """
+        self.indexProbes = [None] * len(self.paramExpressions)
+        for paramIndex, parameter in enumerate(self.paramExpressions):
+            itemsIndex = problem.entityIdToItemId.get(self.entities[paramIndex])
+            if itemsIndex is None or paramIndex >= len(self.applicablePrecsRanges):
+                continue
+            candidates = ([self.preconditions[index] for index in self.applicablePrecsRanges[paramIndex]]
+                          + [self.conflictingPreconditions[index]
+                             for index in self.applicableConfPrecsRanges[paramIndex]])
+            for precondition in candidates:
+                probe = find_index_probe(precondition, parameter)
+                if probe is None:
+                    continue
+                keyNode, other = resolve_index_probe(precondition, probe)
+                itemKey = problem.itemKeysPositions.get(keyNode.variableName)
+                if itemKey is not None and itemKey[0] == itemsIndex:
+                    self.indexProbes[paramIndex] = (keyNode.variableName, other)
+                    break
+
+    def find_adjacency_probes(self, problem: Problem):
+        """
+        Find, per parameter, a precondition `adjacency (expression) ? ?param` checked when the parameter is assigned.
+
+        Only neighbours of the expression's value can pass it, so the parameter's candidates
+        are enumerated from the adjacency's CSR arrays (Problem.adjacencies) instead of all entities.
+        Should be called after reArrangePreconditions.
+
+        Args:
+            problem (Problem): The problem the actions are produced for.
+        """
+        self.adjacencyProbes = [None] * len(self.paramExpressions)
+        for paramIndex, parameter in enumerate(self.paramExpressions):
+            if paramIndex >= len(self.applicablePrecsRanges):
+                continue
+            candidates = ([self.preconditions[index] for index in self.applicablePrecsRanges[paramIndex]]
+                          + [self.conflictingPreconditions[index]
+                             for index in self.applicableConfPrecsRanges[paramIndex]])
+            for precondition in candidates:
+                adjacencyNode = find_adjacency_probe(precondition, parameter)
+                if (adjacencyNode is not None and adjacencyNode.variableName in problem.adjacencies
+                        and problem.get_adjacency_entity(adjacencyNode.variableName) == self.entities[paramIndex]):
+                    self.adjacencyProbes[paramIndex] = (adjacencyNode.variableName, adjacencyNode.expression)
+                    break
+
+
 class ActionStringRepresentor:
     """Provides string representations of actions based on their generators."""
     def __init__(self, actionGenerators: List[ActionGenerator]):
@@ -186,6 +385,7 @@ class ActionProducer:
 
             # Initialize parameter values with the fixed entity parameter (id)
             actionGenerator.paramExpressions[0].updateParam(entityId)
+            actionGenerator.slots[0] = entityId
 
             # Evaluate initial preconditions
             if not self.evaluate_partial_preconditions(actionGenerator, problem, state, 0):
@@ -212,34 +412,61 @@ class ActionProducer:
         paramEntityIndex = actionGenerator.entities[paramIndex]
 
         # Get possible values for this parameter
-        possible_values = problem.get_entity_ids(state, paramEntityIndex)
+        indexProbe = actionGenerator.indexProbes[paramIndex]
+        adjacencyProbe = actionGenerator.adjacencyProbes[paramIndex]
+        if indexProbe is not None:
+            # Only values found in the item index can pass the probed precondition
+            itemKeyName, expression = indexProbe
+            possible_values = problem.ids_where(state, itemKeyName, expression.evaluate(problem, state))
+        elif adjacencyProbe is not None:
+            # Only neighbours can pass the probed precondition
+            adjacencyName, expression = adjacencyProbe
+            possible_values = problem.adjacencies[adjacencyName].neighbors(expression.evaluate(problem, state))
+        else:
+            possible_values = problem.get_entity_ids(state, paramEntityIndex)
 
         # Filter possible values based on preconditions involving parameters assigned so far
         filtered_values = self.filter_parameter_values(actionGenerator, problem, state,
                                                        paramIndex, possible_values)
 
         parameterNode = actionGenerator.paramExpressions[paramIndex]
+        slots = actionGenerator.slots
         # For each possible value, proceed to assign the next parameter
         for value in filtered_values:
             # Update the ParameterNode
             parameterNode.updateParam(value)
+            slots[paramIndex] = value
 
             # Recurse to assign the next parameter
             self.assign_parameters_recursive(actionGenerator, problem, state, paramIndex + 1, actions)
 
         # Clean up parameter values (backtrack)
         parameterNode.updateParam(None)
+        slots[paramIndex] = None
 
     def filter_parameter_values(self, actionGenerator: ActionGenerator,
                                 problem: Problem, state: State,
                                 paramIndex: int, possibleValues: Iterable):
-        """Filter possible parameter values based on preconditions up to paramIndex."""
+        """
+        Filter possible parameter values based on preconditions up to paramIndex - all at once
+        if they're compiled for it (see ActionGenerator.compiledDomainFilters), otherwise one by one.
+        """
+        domainFilters = actionGenerator.compiledDomainFilters
+        if paramIndex < len(domainFilters) and domainFilters[paramIndex] is not None:
+            # Both passes go over the values, which may be an iterator
+            possibleValues = list(possibleValues)
+            filtered_values = filter_candidates(domainFilters[paramIndex], problem, state, possibleValues,
+                                                actionGenerator.slots)
+            if filtered_values is not None:
+                return filtered_values
         filtered_values = []
         parameterNode = actionGenerator.paramExpressions[paramIndex]
+        slots = actionGenerator.slots
 
         for value in possibleValues:
             # Set current parameter value
             parameterNode.updateParam(value)
+            slots[paramIndex] = value
 
             # Evaluate preconditions involving parameters assigned so far
             if self.evaluate_partial_preconditions(actionGenerator, problem, state, paramIndex):
@@ -249,6 +476,17 @@ class ActionProducer:
 
     def evaluate_partial_preconditions(self, actionGenerator, problem, state, paramIndex: int):
         """Evaluate preconditions applicable for parameters up to paramIndex."""
+        if actionGenerator.compiledPreconditions is not None:
+            slots = actionGenerator.slots
+            compiledPreconditions = actionGenerator.compiledPreconditions
+            for index in actionGenerator.applicablePrecsRanges[paramIndex]:
+                if not compiledPreconditions[index](problem, state, slots):
+                    return False
+            compiledPreconditions = actionGenerator.compiledConflictingPreconditions
+            for index in actionGenerator.applicableConfPrecsRanges[paramIndex]:
+                if not compiledPreconditions[index](problem, state, slots):
+                    return False
+            return True
         # Evaluate applicable preconditions. Searches in predetermined ranges.
         for index in actionGenerator.applicablePrecsRanges[paramIndex]:
             if not actionGenerator.preconditions[index].evaluate(problem, state):
@@ -0,0 +1,103 @@
+from array import array
+from typing import Iterable, Dict, Set, Union
+
+# Typecode of the CSR index arrays.
+INDEX_TYPECODE = 'q'
+
+
+class Adjacency:
+    """
+    Compressed sparse row (CSR) form of an adjacency constant - a tuple of neighbour sets,
+    or of neighbour -> weight dictionaries for weighted (MATCH) adjacency.
+
+    The neighbours of all nodes are kept sorted in one flat array, node n's being
+    indices[indptr[n]:indptr[n + 1]], with their weights at the same positions.
+    Each node also has a bitset (an int, bit m set if m is a neighbour) for intersecting
+    neighbourhoods with sets of nodes.
+    """
+    __slots__ = ('indptr', 'indices', 'weights', 'bits')
+
+    def __init__(self, rows: Iterable[Union[Set[int], Dict[int, int]]]):
+        """
+        Build the CSR arrays and bitsets of an adjacency constant.
+
+        Args:
+            rows (Iterable[Set[int] | Dict[int, int]]): Per node, its neighbours (with weights, for dictionaries).
+        """
+        indptr = array(INDEX_TYPECODE, [0])
+        indices = array(INDEX_TYPECODE)
+        weights = []
+        weighted = False
+        bits = []
+        for row in rows:
+            neighbours = sorted(row)
+            indices.extend(neighbours)
+            indptr.append(len(indices))
+            if isinstance(row, dict):
+                weighted = True
+                weights.extend(row[neighbour] for neighbour in neighbours)
+            else:
+                weights.extend([1] * len(neighbours))
+            rowBits = 0
+            for neighbour in neighbours:
+                rowBits |= 1 << neighbour
+            bits.append(rowBits)
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = None
+        if weighted:
+            try:
+                self.weights = array(INDEX_TYPECODE, weights)
+            except (TypeError, OverflowError):
+                self.weights = weights
+        self.bits = tuple(bits)
+
+    def __len__(self):
+        """Return the number of nodes."""
+        return len(self.bits)
+
+    def neighbors(self, node: int):
+        """
+        Get a node's neighbours.
+
+        Args:
+            node (int): The node.
+
+        Returns:
+            array: The neighbours, ascending.
+        """
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def neighbor_weights(self, node: int):
+        """
+        Get the weights of a node's edges, in the order of neighbors(node).
+
+        Args:
+            node (int): The node.
+
+        Returns:
+            array | List: The weights - 1 per edge for unweighted adjacency.
+        """
+        if self.weights is None:
+            return [1] * self.degree(node)
+        return self.weights[self.indptr[node]:self.indptr[node + 1]]
+
+    def degree(self, node: int) -> int:
+        """Return the number of neighbours of a node."""
+        return self.indptr[node + 1] - self.indptr[node]
+
+
+def nodes_bitset(nodes: Iterable[int]) -> int:
+    """
+    Build the bitset of a set of nodes.
+
+    Args:
+        nodes (Iterable[int]): The nodes.
+
+    Returns:
+        int: An int with the bit of every node set.
+    """
+    bits = 0
+    for node in nodes:
+        bits |= 1 << node
+    return bits
@@ -0,0 +1,495 @@
+from typing import Callable, List, Optional, Sequence
+from array import array
+import operator
+import numpy as np
+from CARRI.state import State
+from CARRI.columnarState import ColumnarState
+from CARRI.problem import Problem, ACCESS_CONSTANT, ACCESS_VARIABLE
+from CARRI.expression import (ExpressionNode, ConstNode, ParameterNode, ValueIndexNode, ValueNode,
+                              ExistingExpressionNode, OperatorNode, NotNode, AndNode, OrNode, iter_tree)
+from CARRI.compiler import ExpressionCompiler, INFIX_OPERATORS
+
+# Fewest states worth evaluating as a batch - smaller beams are checked state by state
+# (gathering the values costs more than it saves below ~16-32 states, see benchmarks.batchEvaluation).
+MIN_BATCH_STATES = 32
+# Fewest candidate values of a parameter worth filtering as a batch - fewer are checked one by one
+# (a batch costs about as much as checking ~50 values, see benchmarks.batchEvaluation).
+MIN_BATCH_CANDIDATES = 64
+# Errors of a batch evaluation after which its states are evaluated one by one. Reads of missing items
+# (KeyError), values NumPy can't combine (TypeError, ValueError) and invalid arithmetic (FloatingPointError,
+# raised under np.errstate) then fail or pass exactly as they do state by state.
+BATCH_FALLBACK_ERRORS = (LookupError, TypeError, ValueError, ArithmeticError)
+# NumPy functions of the logical nodes and operators - they evaluate both operands, on whole arrays.
+LOGICAL_FUNCTIONS = {
+    AndNode: 'np.logical_and',
+    OrNode: 'np.logical_or',
+    NotNode: 'np.logical_not'
+}
+
+# Operators on a constant table's containers: the StateBatch helper looping over the states, and the
+# source template of the operation on single values (container, value)
+CONTAINER_OPERATORS = {
+    operator.contains: ('contains_at', "({1} in {0})"),
+    operator.getitem: ('lookup_at', "{0}[{1}]")
+}
+
+
+class Unvectorisable(Exception):
+    """Raised by BatchCompiler for expressions it can't evaluate on whole batches."""
+
+
+class StateBatch:
+    """
+    K states viewed column-wise: the values of a variable or items key at an index across the states,
+    as NumPy arrays of length K.
+
+    Reads at a fixed index are gathered once, then shared by all the expressions evaluated on the batch.
+    Numbers and booleans are gathered into numeric arrays (booleans as 0 and 1), other values into object arrays.
+    """
+    __slots__ = ('states', 'columns')
+
+    def __init__(self, states: Sequence):
+        """
+        Initialize a StateBatch.
+
+        Args:
+            states (Sequence[State]): The states, not modified while the batch is used.
+        """
+        self.states = list(states)
+        # (kind, ...) -> the gathered array
+        self.columns = {}
+
+    def __len__(self):
+        return len(self.states)
+
+    @staticmethod
+    def gather(values: List) -> np.ndarray:
+        """Return values as an array - numeric if they're all numbers or booleans, else of objects."""
+        array = np.array(values)
+        if array.ndim == 1 and array.dtype.kind == 'b':
+            # As Python's, sums of booleans count them (NumPy's boolean + is a logical or)
+            return array.astype(np.int64)
+        if array.ndim != 1 or array.dtype.kind not in 'iuf':
+            array = np.empty(len(values), dtype=object)
+            array[:] = values
+        return array
+
+    def all_true(self) -> np.ndarray:
+        """Return a new array of K True values."""
+        return np.ones(len(self), dtype=bool)
+
+    def variable(self, varIndex: int, index) -> np.ndarray:
+        """Get the values of a variable at an index, across the states."""
+        key = ('variable', varIndex, index)
+        column = self.columns.get(key)
+        if column is None:
+            column = self.columns[key] = self.gather([state.get_variable_value(varIndex, index)
+                                                      for state in self.states])
+        return column
+
+    def item(self, itemsIndex: int, keyIndex: int, itemId) -> np.ndarray:
+        """Get the values of an items key of an item, across the states. Raises KeyError if a state lacks the item."""
+        key = ('item', itemsIndex, keyIndex, itemId)
+        column = self.columns.get(key)
+        if column is None:
+            column = self.columns[key] = self.gather([state.get_item_value(itemsIndex, keyIndex, itemId)
+                                                      for state in self.states])
+        return column
+
+    def exists(self, problem: Problem, entityIndex: int, itemId) -> np.ndarray:
+        """Check in every state if an entity has an id."""
+        key = ('exists', entityIndex, itemId)
+        column = self.columns.get(key)
+        if column is None:
+            column = self.columns[key] = np.array([itemId in problem.get_entity_ids(state, entityIndex)
+                                                   for state in self.states], dtype=bool)
+        return column
+
+    def variable_at(self, varIndex: int, indexes: np.ndarray) -> np.ndarray:
+        """Get the values of a variable at a different index per state."""
+        return self.gather([state.get_variable_value(varIndex, index)
+                            for state, index in zip(self.states, indexes.tolist())])
+
+    def item_at(self, itemsIndex: int, keyIndex: int, itemIds: np.ndarray) -> np.ndarray:
+        """Get the values of an items key of a different item per state."""
+        return self.gather([state.get_item_value(itemsIndex, keyIndex, itemId)
+                            for state, itemId in zip(self.states, itemIds.tolist())])
+
+    def exists_at(self, problem: Problem, entityIndex: int, itemIds: np.ndarray) -> np.ndarray:
+        """Check in every state if an entity has the state's id."""
+        return np.array([itemId in problem.get_entity_ids(state, entityIndex)
+                         for state, itemId in zip(self.states, itemIds.tolist())], dtype=bool)
+
+    def spread(self, values) -> List:
+        """Return an array of K values as a list, or a single value repeated for all the states."""
+        if isinstance(values, np.ndarray):
+            return values.tolist()
+        return [values] * len(self)
+
+    def contains_at(self, table, indexes, values) -> np.ndarray:
+        """
+        Check per state if a constant table's container (e.g. a neighbours set) at the state's index
+        contains the state's value. indexes and values are arrays, or single values for all the states.
+        """
+        size = len(self)
+        values = self.spread(values)
+        if not isinstance(indexes, np.ndarray):
+            container = table[indexes]
+            return np.fromiter((value in container for value in values), dtype=bool, count=size)
+        return np.fromiter((value in table[index] for index, value in zip(indexes.tolist(), values)),
+                           dtype=bool, count=size)
+
+    def lookup_at(self, table, indexes, keys) -> np.ndarray:
+        """
+        Look up per state the state's key in a constant table's container (e.g. an adjacency's row)
+        at the state's index. indexes and keys are arrays, or single values for all the states.
+        """
+        return self.gather([table[index][key] for index, key in zip(self.spread(indexes), self.spread(keys))])
+
+
+class CandidateBatch(StateBatch):
+    """
+    K candidate values of a parameter in one state: reads at a candidate-dependent index gather the state's
+    values at every candidate's index, through NumPy views of the state's integer columns (see ColumnarState).
+
+    Reads at a fixed index return the state's single value, shared by all the candidates.
+    The views share the state's memory - the batch should be dropped before the state is modified.
+    """
+    __slots__ = ('state', 'values')
+
+    def __init__(self, state: State, values: np.ndarray):
+        """
+        Initialize a CandidateBatch.
+
+        Args:
+            state (State): The state, not modified while the batch is used.
+            values (np.ndarray): The candidate values.
+        """
+        super().__init__((state,))
+        self.state = state
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    @staticmethod
+    def view(column) -> np.ndarray:
+        """Return a column of values as an array - a view of it if it's an array of numbers."""
+        if isinstance(column, array):
+            return np.frombuffer(column, dtype=column.typecode)
+        return StateBatch.gather(list(column))
+
+    def variable(self, varIndex: int, index):
+        """Get the value of a variable at an index."""
+        return self.state.get_variable_value(varIndex, index)
+
+    def item(self, itemsIndex: int, keyIndex: int, itemId):
+        """Get the value of an items key of an item. Raises KeyError if the state lacks the item."""
+        return self.state.get_item_value(itemsIndex, keyIndex, itemId)
+
+    def exists(self, problem: Problem, entityIndex: int, itemId) -> bool:
+        """Check if an entity has an id."""
+        return itemId in problem.get_entity_ids(self.state, entityIndex)
+
+    def variable_at(self, varIndex: int, indexes: np.ndarray) -> np.ndarray:
+        """Get the values of a variable at a different index per candidate."""
+        key = ('variable', varIndex)
+        column = self.columns.get(key)
+        if column is None:
+            column = self.columns[key] = self.view(self.state.variables[varIndex])
+        return column[indexes]
+
+    def item_at(self, itemsIndex: int, keyIndex: int, itemIds: np.ndarray) -> np.ndarray:
+        """Get the values of an items key of a different item per candidate. Raises KeyError for missing items."""
+        state = self.state
+        if not isinstance(state, ColumnarState):
+            entityItems = state.items[itemsIndex]
+            return self.gather([entityItems[itemId][keyIndex] for itemId in itemIds.tolist()])
+        key = ('column', itemsIndex, keyIndex)
+        column = self.columns.get(key)
+        if column is None:
+            column = self.columns[key] = self.view(state.columns[itemsIndex][keyIndex])
+        if itemIds is self.values:
+            key = ('rows', itemsIndex)
+            rows = self.columns.get(key)
+            if rows is None:
+                rows = self.columns[key] = self.rows(itemsIndex, itemIds)
+        else:
+            rows = self.rows(itemsIndex, itemIds)
+        return column[rows]
+
+    def rows(self, itemsIndex: int, itemIds: np.ndarray) -> np.ndarray:
+        """Return the rows of items in a ColumnarState's columns. Raises KeyError for missing items."""
+        entityRows = self.state.rows[itemsIndex]
+        return np.fromiter((entityRows[itemId] for itemId in itemIds.tolist()), dtype=np.intp, count=len(itemIds))
+
+    def exists_at(self, problem: Problem, entityIndex: int, itemIds: np.ndarray) -> np.ndarray:
+        """Check per candidate if an entity has the candidate's id."""
+        ids = problem.get_entity_ids(self.state, entityIndex)
+        return np.fromiter((itemId in ids for itemId in itemIds.tolist()), dtype=bool, count=len(itemIds))
+
+
+class BatchCompiler(ExpressionCompiler):
+    """
+    Compiles preconditions into a function evaluating them on a whole StateBatch with NumPy.
+
+    The function takes (problem, batch, slots) - slots as in ExpressionCompiler - and returns
+    an array of K booleans. Reads become StateBatch columns, operators NumPy operations on them,
+    and `and`, `or` and `not` element-wise logical functions. Both operands of logical nodes are evaluated,
+    so errors the scalar evaluation short-circuits past (e.g. reading a removed item) make the batch
+    fall back to state by state evaluation (see evaluate_batch).
+
+    Expressions with unbound names, logical nodes used as values, operators other than the infix ones
+    and membership checks / lookups in a constant table's containers (`?`, `@`), and constant tables
+    indexed by state values that aren't numeric lists, aren't compiled.
+    """
+    def __init__(self, problem: Problem, parameters: Sequence[ParameterNode] = ()):
+        """
+        Initialize a BatchCompiler.
+
+        Args:
+            problem (Problem): The problem the expressions are evaluated in.
+            parameters (Sequence[ParameterNode]): Parameters read from slots, by their position in the sequence.
+        """
+        super().__init__(problem, parameters)
+        self.namespace['np'] = np
+
+    def compile_conjunction(self, nodes: Sequence[ExpressionNode]) -> Callable:
+        """
+        Compile expressions into one function checking in every state that all are true.
+
+        Args:
+            nodes (Sequence[ExpressionNode]): The expressions.
+
+        Returns:
+            Callable: function(problem, batch, slots) returning an array of K booleans, True where all are true.
+
+        Raises:
+            Unvectorisable: If an expression can't be evaluated on whole batches.
+        """
+        lines = ["    valid = batch.all_true()"]
+        for node in nodes:
+            lines.append("    valid &= np.asarray({}, dtype=bool)".format(self.emit_batch(node, True)))
+            lines.append("    if not valid.any():\n        return valid")
+        source = "def compiled(problem, batch, slots):\n{}\n    return valid\n".format("\n".join(lines))
+        exec(compile(source, "<CARRI batch conjunction>", "exec"), self.namespace)
+        function = self.namespace.pop("compiled")
+        function.source = source
+        return function
+
+    @staticmethod
+    def varies(node: ExpressionNode) -> bool:
+        """Check if an expression reads the state - its value may differ between the batch's states."""
+        for child in iter_tree(node):
+            if (isinstance(child, (ValueIndexNode, ValueNode))
+                    and (child.accessor is None or child.accessor[0] != ACCESS_CONSTANT)):
+                return True
+            if isinstance(child, ExistingExpressionNode):
+                return True
+        return False
+
+    def emit_batch(self, node: ExpressionNode, boolean: bool = False) -> str:
+        """
+        Generate the source of an expression evaluated on a batch.
+
+        Args:
+            node (ExpressionNode): The expression.
+            boolean (bool): Whether only the truth of the value is used.
+
+        Returns:
+            str: A Python expression, an array of K values or a single value for all the states.
+
+        Raises:
+            Unvectorisable: If the expression can't be evaluated on whole batches.
+        """
+        if isinstance(node, (ConstNode, ParameterNode)):
+            return self.emit(node)
+        if isinstance(node, (ValueIndexNode, ValueNode)):
+            accessor = node.accessor
+            if accessor is None:
+                raise Unvectorisable(node)
+            if isinstance(node, ValueIndexNode):
+                if accessor[0] == ACCESS_CONSTANT:
+                    return self.constant(accessor[1][node.index])
+                index, varies = repr(node.index), False
+            else:
+                index, varies = self.emit_batch(node.expression), self.varies(node.expression)
+            if accessor[0] == ACCESS_CONSTANT:
+                if not varies:
+                    return "{}[{}]".format(self.bind(accessor[1], "table"), index)
+                return "{}[{}]".format(self.bind_table(accessor[1]), index)
+            suffix = "_at" if varies else ""
+            if accessor[0] == ACCESS_VARIABLE:
+                return "batch.variable{}({}, {})".format(suffix, accessor[1], index)
+            return "batch.item{}({}, {}, {})".format(suffix, accessor[1], accessor[2], index)
+        if isinstance(node, ExistingExpressionNode):
+            suffix = "_at" if self.varies(node.expression) else ""
+            return "batch.exists{}(problem, {}, {})".format(suffix, node.entityIndex,
+                                                            self.emit_batch(node.expression))
+        if isinstance(node, OperatorNode):
+            function = LOGICAL_FUNCTIONS.get(type(node))
+            if function is None and node.operator is operator.not_:
+                function = LOGICAL_FUNCTIONS[NotNode]
+            if function is not None:
+                # Logical functions return booleans, not an operand as `and` and `or` do
+                if not boolean:
+                    raise Unvectorisable(node)
+                return "{}({})".format(function, ", ".join(self.emit_batch(operand, True)
+                                                           for operand in node.operands))
+            if node.operator in CONTAINER_OPERATORS and len(node.operands) == 2:
+                return self.emit_container(node.operator, *node.operands)
+            symbol = INFIX_OPERATORS.get(node.operator)
+            if symbol is None or len(node.operands) != 2:
+                raise Unvectorisable(node)
+            return "({} {} {})".format(self.emit_batch(node.operands[0]), symbol,
+                                       self.emit_batch(node.operands[1]))
+        raise Unvectorisable(node)
+
+    def emit_container(self, operatorFn: Callable, container: ExpressionNode, value: ExpressionNode) -> str:
+        """
+        Generate the source of a membership check (?) or a lookup (@) in a constant table's container,
+        e.g. an adjacency's row, through the batch's helper looping over the states.
+        """
+        helper, template = CONTAINER_OPERATORS[operatorFn]
+        if not self.varies(container) and not self.varies(value):
+            return template.format(self.emit_batch(container), self.emit_batch(value))
+        if not (isinstance(container, ValueNode) and container.accessor is not None
+                and container.accessor[0] == ACCESS_CONSTANT):
+            raise Unvectorisable(container)
+        return "batch.{}({}, {}, {})".format(helper, self.bind(container.accessor[1], "table"),
+                                             self.emit_batch(container.expression), self.emit_batch(value))
+
+    def bind_table(self, table) -> str:
+        """Return the name of a constant table as a numeric array, for indexing it with arrays of indexes."""
+        if not isinstance(table, (list, tuple)):
+            raise Unvectorisable(table)
+        array = np.array(table)
+        if array.ndim != 1 or array.dtype.kind not in 'biuf':
+            raise Unvectorisable(table)
+        name = self.names.get(id(table))
+        if name is None:
+            name = "array{}".format(len(self.names))
+            self.names[id(table)] = name
+            self.namespace[name] = array
+        return name
+
+
+def compile_batch_conjunction(nodes: Sequence[ExpressionNode], problem: Problem,
+                              parameters: Sequence[ParameterNode] = ()) -> Optional[Callable]:
+    """
+    Compile expressions into one function(problem, batch, slots) checking in every state of a StateBatch
+    that all are true, see BatchCompiler.
+
+    Args:
+        nodes (Sequence[ExpressionNode]): The expressions.
+        problem (Problem): The problem the expressions are evaluated in.
+        parameters (Sequence[ParameterNode]): Parameters read from slots, by their position in the sequence.
+
+    Returns:
+        Callable | None: The compiled conjunction, None if an expression can't be evaluated on whole batches.
+    """
+    try:
+        return BatchCompiler(problem, parameters).compile_conjunction(nodes)
+    except Unvectorisable:
+        return None
+
+
+def evaluate_batch(compiled: Optional[Callable], scalar: Callable, problem: Problem, batch: StateBatch,
+                   slots: Sequence) -> np.ndarray:
+    """
+    Evaluate a check in every state of a batch, with its batch function if it has one and it succeeds,
+    otherwise state by state.
+
+    Args:
+        compiled (Callable | None): The check's batch function, see compile_batch_conjunction.
+        scalar (Callable): function(problem, state) evaluating the check in one state.
+        problem (Problem): The problem.
+        batch (StateBatch): The states.
+        slots (Sequence): The parameters' values, read by the batch function.
+
+    Returns:
+        np.ndarray: K booleans, the check's truth per state.
+    """
+    if compiled is not None:
+        try:
+            with np.errstate(all='raise'):
+                return compiled(problem, batch, slots)
+        except BATCH_FALLBACK_ERRORS:
+            pass
+    return np.array([bool(scalar(problem, state)) for state in batch.states], dtype=bool)
+
+
+class DomainCompiler(BatchCompiler):
+    """
+    Compiles the preconditions checked when a parameter is assigned into a function evaluating them
+    for a whole CandidateBatch of the parameter's values: the parameter reads the candidates, the parameters
+    assigned before it are read from slots, and only expressions of the parameter vary between candidates.
+    """
+    def __init__(self, problem: Problem, parameters: Sequence[ParameterNode], paramIndex: int):
+        """
+        Initialize a DomainCompiler.
+
+        Args:
+            problem (Problem): The problem the expressions are evaluated in.
+            parameters (Sequence[ParameterNode]): Parameters read from slots, by their position in the sequence.
+            paramIndex (int): The position of the parameter whose candidates are evaluated.
+        """
+        super().__init__(problem, parameters)
+        self.parameter = parameters[paramIndex]
+        self.locals[id(self.parameter)] = "batch.values"
+
+    def varies(self, node: ExpressionNode) -> bool:
+        """Check if an expression reads the parameter - its value may differ between the candidates."""
+        return any(child is self.parameter for child in iter_tree(node))
+
+
+def compile_domain_filter(nodes: Sequence[ExpressionNode], problem: Problem, parameters: Sequence[ParameterNode],
+                          paramIndex: int) -> Optional[Callable]:
+    """
+    Compile the preconditions checked when a parameter is assigned into one function(problem, batch, slots)
+    checking them for every candidate value of a CandidateBatch, see DomainCompiler.
+
+    Args:
+        nodes (Sequence[ExpressionNode]): The preconditions, reading no parameters after the parameter.
+        problem (Problem): The problem the expressions are evaluated in.
+        parameters (Sequence[ParameterNode]): Parameters read from slots, by their position in the sequence.
+        paramIndex (int): The position of the parameter whose candidates are filtered.
+
+    Returns:
+        Callable | None: The compiled filter, None if there are no preconditions or one can't be vectorised.
+    """
+    if not nodes:
+        return None
+    try:
+        return DomainCompiler(problem, parameters, paramIndex).compile_conjunction(nodes)
+    except Unvectorisable:
+        return None
+
+
+def filter_candidates(compiled: Callable, problem: Problem, state: State, possibleValues: Sequence,
+                      slots: Sequence) -> Optional[List]:
+    """
+    Filter a parameter's candidate values by its compiled domain filter, in one vectorised pass.
+
+    Args:
+        compiled (Callable): The parameter's filter, see compile_domain_filter.
+        problem (Problem): The problem.
+        state (State): The state.
+        possibleValues (Sequence): The candidate values, integer ids. A sequence, not an iterator - the caller
+                                   filters the same values one by one if this returns None.
+        slots (Sequence): The values of the parameters assigned before the parameter.
+
+    Returns:
+        List | None: The values passing the filter, in their order, or None if they should be filtered
+            one by one - too few candidates, non-integer ones, or an error evaluating the batch
+            (see BATCH_FALLBACK_ERRORS).
+    """
+    values = np.array(possibleValues)
+    if len(values) < MIN_BATCH_CANDIDATES or values.ndim != 1 or values.dtype.kind not in 'iu':
+        return None
+    try:
+        with np.errstate(all='raise'):
+            valid = compiled(problem, CandidateBatch(state, values), slots)
+    except BATCH_FALLBACK_ERRORS:
+        return None
+    return values[valid].tolist()
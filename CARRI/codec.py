@@ -0,0 +1,396 @@
+import pickle
+from typing import List, Dict, Tuple
+from CARRI.state import State, StateDelta
+from CARRI.action import Action, ActionGenerator
+
+# Payloads start with a 2-byte magic and a version byte.
+STATE_MAGIC = b"CS"
+PLAN_MAGIC = b"CP"
+DELTA_MAGIC = b"CD"
+CODEC_VERSION = 2
+
+# Value tags, kept in the lowest 2 bits of a value's varint.
+_TAG_INT = 0
+_TAG_BOOL = 1
+_TAG_PICKLE = 2
+
+# Items kinds, per entity.
+_ITEMS_TUPLES = 0
+_ITEMS_LISTS = 1
+_ITEMS_MIXED = 2
+
+
+def _write_uvarint(buffer: bytearray, value: int):
+    """Append an unsigned LEB128 varint to the buffer."""
+    while value > 0x7F:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_uvarint(data: bytes, pos: int) -> Tuple[int, int]:
+    """Read an unsigned LEB128 varint, returning the value and the position after it."""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _write_varint(buffer: bytearray, value: int):
+    """Append a signed, zigzag encoded varint to the buffer."""
+    _write_uvarint(buffer, (value << 1) if value >= 0 else ((-value << 1) - 1))
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """Read a signed, zigzag encoded varint, returning the value and the position after it."""
+    value, pos = _read_uvarint(data, pos)
+    return (value >> 1) if not value & 1 else -((value + 1) >> 1), pos
+
+
+def _write_value(buffer: bytearray, value):
+    """Append a state value: ints and bools as tagged varints, anything else pickled."""
+    if type(value) is int:
+        _write_uvarint(buffer, (((value << 1) if value >= 0 else ((-value << 1) - 1)) << 2) | _TAG_INT)
+    elif type(value) is bool:
+        _write_uvarint(buffer, (int(value) << 2) | _TAG_BOOL)
+    else:
+        payload = pickle.dumps(value)
+        _write_uvarint(buffer, (len(payload) << 2) | _TAG_PICKLE)
+        buffer += payload
+
+
+def _read_value(data: bytes, pos: int):
+    """Read a state value, returning the value and the position after it."""
+    code, pos = _read_uvarint(data, pos)
+    tag = code & 3
+    code >>= 2
+    if tag == _TAG_INT:
+        return (code >> 1) if not code & 1 else -((code + 1) >> 1), pos
+    if tag == _TAG_BOOL:
+        return bool(code), pos
+    return pickle.loads(data[pos:pos + code]), pos + code
+
+
+def _check_header(data: bytes, magic: bytes) -> int:
+    """Validate a payload's magic and version, returning the position after the header."""
+    if data[:2] != magic:
+        raise ValueError("Not a CARRI {} payload".format(
+            {STATE_MAGIC: "state", PLAN_MAGIC: "plan", DELTA_MAGIC: "delta"}[magic]))
+    if data[2] != CODEC_VERSION:
+        raise ValueError(f"Unsupported codec version: {data[2]}")
+    return 3
+
+
+def encode_state(state: State) -> bytes:
+    """
+    Encode a State (of any backend) to a compact binary payload.
+
+    Layout: header, variables (length + values each), then per items its kind,
+    count and (id, [kind], length, values) per item, then the next id per items.
+    Integers are zigzag varints.
+
+    Args:
+        state (State): The state to encode.
+
+    Returns:
+        bytes: The encoded state.
+    """
+    buffer = bytearray(STATE_MAGIC)
+    buffer.append(CODEC_VERSION)
+    lenVariables = len(state.variables)
+    _write_uvarint(buffer, lenVariables)
+    for varIndex in range(lenVariables):
+        values = state.variable_values(varIndex)
+        _write_uvarint(buffer, len(values))
+        for value in values:
+            _write_value(buffer, value)
+    lenItems = state.get_len_entities()
+    _write_uvarint(buffer, lenItems)
+    for entityIndex in range(lenItems):
+        entity = state.items_dict(entityIndex)
+        kinds = {type(item) for item in entity.values()}
+        if kinds == {tuple}:
+            kind = _ITEMS_TUPLES
+        elif kinds <= {list}:
+            kind = _ITEMS_LISTS
+        else:
+            kind = _ITEMS_MIXED
+        buffer.append(kind)
+        _write_uvarint(buffer, len(entity))
+        for itemId, values in entity.items():
+            _write_varint(buffer, itemId)
+            if kind == _ITEMS_MIXED:
+                buffer.append(_ITEMS_LISTS if type(values) is list else _ITEMS_TUPLES)
+            _write_uvarint(buffer, len(values))
+            for value in values:
+                _write_value(buffer, value)
+    for nextId in state.nextIds:
+        _write_varint(buffer, nextId)
+    return bytes(buffer)
+
+
+def decode_state(data: bytes, problem=None) -> State:
+    """
+    Decode a State encoded by encode_state.
+
+    Args:
+        data (bytes): The encoded state.
+        problem (Problem, optional): If given, the state is built with the problem's State backend.
+
+    Returns:
+        State: The decoded state.
+
+    Raises:
+        ValueError: If the payload isn't an encoded state of a supported version.
+    """
+    pos = _check_header(data, STATE_MAGIC)
+    lenVariables, pos = _read_uvarint(data, pos)
+    variables = []
+    for _ in range(lenVariables):
+        length, pos = _read_uvarint(data, pos)
+        values = []
+        for _ in range(length):
+            value, pos = _read_value(data, pos)
+            values.append(value)
+        variables.append(values)
+    lenItems, pos = _read_uvarint(data, pos)
+    items = []
+    for _ in range(lenItems):
+        kind = data[pos]
+        count, pos = _read_uvarint(data, pos + 1)
+        entity = {}
+        for _ in range(count):
+            itemId, pos = _read_varint(data, pos)
+            itemKind = kind
+            if kind == _ITEMS_MIXED:
+                itemKind = data[pos]
+                pos += 1
+            length, pos = _read_uvarint(data, pos)
+            values = []
+            for _ in range(length):
+                value, pos = _read_value(data, pos)
+                values.append(value)
+            entity[itemId] = values if itemKind == _ITEMS_LISTS else tuple(values)
+        items.append(entity)
+    nextIds = []
+    for _ in range(lenItems):
+        nextId, pos = _read_varint(data, pos)
+        nextIds.append(nextId)
+    if problem is not None:
+        return problem.new_state(variables, items, nextIds)
+    return State(variables, items, nextIds=nextIds)
+
+
+def _write_values(buffer: bytearray, values):
+    """Append a sequence of values, prefixed by its length and kind."""
+    buffer.append(_ITEMS_LISTS if type(values) is list else _ITEMS_TUPLES)
+    _write_uvarint(buffer, len(values))
+    for value in values:
+        _write_value(buffer, value)
+
+
+def _read_values(data: bytes, pos: int):
+    """Read a sequence of values written by _write_values, returning it and the position after it."""
+    kind = data[pos]
+    length, pos = _read_uvarint(data, pos + 1)
+    values = []
+    for _ in range(length):
+        value, pos = _read_value(data, pos)
+        values.append(value)
+    return (values if kind == _ITEMS_LISTS else tuple(values)), pos
+
+
+def encode_delta(delta: StateDelta) -> bytes:
+    """
+    Encode a StateDelta to a compact binary payload.
+
+    Args:
+        delta (StateDelta): The delta to encode.
+
+    Returns:
+        bytes: The encoded delta.
+    """
+    buffer = bytearray(DELTA_MAGIC)
+    buffer.append(CODEC_VERSION)
+    _write_uvarint(buffer, len(delta.variables))
+    for varIndex, index, value in delta.variables:
+        _write_uvarint(buffer, varIndex)
+        _write_uvarint(buffer, index)
+        _write_value(buffer, value)
+    _write_uvarint(buffer, len(delta.itemValues))
+    for entityIndex, keyIndex, itemId, value in delta.itemValues:
+        _write_uvarint(buffer, entityIndex)
+        _write_uvarint(buffer, keyIndex)
+        _write_varint(buffer, itemId)
+        _write_value(buffer, value)
+    _write_uvarint(buffer, len(delta.addedItems))
+    for entityIndex, itemId, values in delta.addedItems:
+        _write_uvarint(buffer, entityIndex)
+        _write_varint(buffer, itemId)
+        _write_values(buffer, values)
+    _write_uvarint(buffer, len(delta.removedItems))
+    for entityIndex, itemId in delta.removedItems:
+        _write_uvarint(buffer, entityIndex)
+        _write_varint(buffer, itemId)
+    _write_uvarint(buffer, len(delta.nextIds))
+    for entityIndex, nextId in delta.nextIds:
+        _write_uvarint(buffer, entityIndex)
+        _write_varint(buffer, nextId)
+    return bytes(buffer)
+
+
+def decode_delta(data: bytes) -> StateDelta:
+    """
+    Decode a StateDelta encoded by encode_delta.
+
+    Args:
+        data (bytes): The encoded delta.
+
+    Returns:
+        StateDelta: The decoded delta.
+
+    Raises:
+        ValueError: If the payload isn't an encoded delta of a supported version.
+    """
+    pos = _check_header(data, DELTA_MAGIC)
+    delta = StateDelta()
+    count, pos = _read_uvarint(data, pos)
+    for _ in range(count):
+        varIndex, pos = _read_uvarint(data, pos)
+        index, pos = _read_uvarint(data, pos)
+        value, pos = _read_value(data, pos)
+        delta.variables.append((varIndex, index, value))
+    count, pos = _read_uvarint(data, pos)
+    for _ in range(count):
+        entityIndex, pos = _read_uvarint(data, pos)
+        keyIndex, pos = _read_uvarint(data, pos)
+        itemId, pos = _read_varint(data, pos)
+        value, pos = _read_value(data, pos)
+        delta.itemValues.append((entityIndex, keyIndex, itemId, value))
+    count, pos = _read_uvarint(data, pos)
+    for _ in range(count):
+        entityIndex, pos = _read_uvarint(data, pos)
+        itemId, pos = _read_varint(data, pos)
+        values, pos = _read_values(data, pos)
+        delta.addedItems.append((entityIndex, itemId, values))
+    count, pos = _read_uvarint(data, pos)
+    for _ in range(count):
+        entityIndex, pos = _read_uvarint(data, pos)
+        itemId, pos = _read_varint(data, pos)
+        delta.removedItems.append((entityIndex, itemId))
+    count, pos = _read_uvarint(data, pos)
+    for _ in range(count):
+        entityIndex, pos = _read_uvarint(data, pos)
+        nextId, pos = _read_varint(data, pos)
+        delta.nextIds.append((entityIndex, nextId))
+    return delta
+
+
+class PlanCodec:
+    """
+    Encodes plans (lists of transitions of Actions) as (generator index, parameter values) per action,
+    and rebuilds the Actions against the receiver's ActionGenerators.
+    """
+    def __init__(self, actionGenerators: List[ActionGenerator]):
+        """
+        Initialize the PlanCodec.
+
+        Both sides must use the same action generators, in the same order (e.g., parsed from the same domain).
+
+        Args:
+            actionGenerators (List[ActionGenerator]): The simulator's action generators.
+        """
+        self.actionGenerators = actionGenerators
+        self.generatorIndexes = {generator.name: index for index, generator in enumerate(actionGenerators)}
+
+    def encode(self, plan: List[List[Action]]) -> bytes:
+        """
+        Encode a plan.
+
+        Args:
+            plan (List[List[Action]]): A list of transitions, each a list of actions.
+
+        Returns:
+            bytes: The encoded plan.
+        """
+        buffer = bytearray(PLAN_MAGIC)
+        buffer.append(CODEC_VERSION)
+        _write_uvarint(buffer, len(plan))
+        for transition in plan:
+            _write_uvarint(buffer, len(transition))
+            for action in transition:
+                _write_uvarint(buffer, self.generatorIndexes[action.name])
+                for param in action.params:
+                    _write_value(buffer, param.value)
+        return bytes(buffer)
+
+    def decode(self, data: bytes) -> List[List[Action]]:
+        """
+        Decode a plan encoded by encode, generating its actions.
+
+        Args:
+            data (bytes): The encoded plan.
+
+        Returns:
+            List[List[Action]]: The plan.
+
+        Raises:
+            ValueError: If the payload isn't an encoded plan of a supported version.
+        """
+        pos = _check_header(data, PLAN_MAGIC)
+        lenPlan, pos = _read_uvarint(data, pos)
+        plan = []
+        for _ in range(lenPlan):
+            lenTransition, pos = _read_uvarint(data, pos)
+            transition = []
+            for _ in range(lenTransition):
+                generatorIndex, pos = _read_uvarint(data, pos)
+                generator = self.actionGenerators[generatorIndex]
+                for paramExpression in generator.paramExpressions:
+                    value, pos = _read_value(data, pos)
+                    paramExpression.updateParam(value)
+                transition.append(generator.generate_action())
+                generator.resetParams()
+            plan.append(transition)
+        return plan
+
+
+class EncodedPlanDict:
+    """
+    Wraps a (possibly shared, multiprocessing) plan dictionary, storing plans encoded.
+
+    Planners publish plans with planDict['plan'] = plan; the wrapper encodes them on the way in
+    and decodes them on the way out, so only compact payloads cross process boundaries.
+    """
+    def __init__(self, planDict: Dict, planCodec: PlanCodec):
+        """
+        Initialize the EncodedPlanDict.
+
+        Args:
+            planDict (Dict): The underlying dictionary.
+            planCodec (PlanCodec): The codec for plans.
+        """
+        self.planDict = planDict
+        self.planCodec = planCodec
+
+    def __setitem__(self, key, value):
+        if key == "plan":
+            value = self.planCodec.encode(value)
+        self.planDict[key] = value
+
+    def __getitem__(self, key):
+        value = self.planDict[key]
+        if key == "plan":
+            return self.planCodec.decode(value)
+        return value
+
+    def __contains__(self, key):
+        return key in self.planDict
+
+    def get(self, key, default=None):
+        return self[key] if key in self.planDict else default
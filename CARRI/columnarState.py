@@ -0,0 +1,489 @@
+from array import array
+from typing import List, Dict, Iterable
+from CARRI.state import (State, FINGERPRINT_MASK, NO_ITEM_INDEXES, NO_ITEM_AGGREGATES, item_fingerprint,
+                         initial_next_ids, key_position, move_last_key, UNDO_VARIABLE, UNDO_ITEM_VALUE, UNDO_ADD,
+                         UNDO_REMOVE, UNDO_REPLACE)
+
+# Typecode used for integer columns.
+INT_TYPECODE = 'i'
+
+
+def make_column(values, typecode):
+    """
+    Create a column for the given values.
+
+    Args:
+        values (Iterable): The column's values.
+        typecode (str): Array typecode, or None for a plain list column.
+
+    Returns:
+        array | List: An array column if all values fit the typecode, otherwise a list column.
+    """
+    values = list(values)
+    if typecode is not None and not any(isinstance(value, bool) for value in values):
+        try:
+            return array(typecode, values)
+        except (TypeError, OverflowError):
+            pass
+    return values
+
+
+class ColumnarState(State):
+    """
+    Array-backed State representation.
+
+    Integer variables are stored as array('i') columns. Items are stored as struct-of-arrays:
+    one column per key, an id -> row map, and a free list of rows released by removals.
+    Columns of non integer values (e.g. BOOL) are plain lists.
+
+    Like State, ColumnarState is copy-on-write: copies share columns, rows maps and free lists,
+    and only the touched ones are copied on first write.
+    """
+    __slots__ = ('rows', 'columns', 'freeRows', '_rowsBits', '_columnBits', '_owned')
+
+    def __init__(self, variables: List, rows: List[Dict], columns: List[List], freeRows: List[List],
+                 fingerprint: int = None, nextIds: Iterable[int] = None):
+        """
+        Initialize the ColumnarState with its columns.
+
+        The given collections are treated as shared - they are copied before the first write.
+
+        Args:
+            variables (List): A column per variable.
+            rows (List[Dict]): Per items, a dictionary of item id -> row.
+            columns (List[List]): Per items, a column per key.
+            freeRows (List[List]): Per items, the rows available for reuse.
+            fingerprint (int, optional): The contents' fingerprint, computed if not given.
+            nextIds (Iterable[int], optional): Per items, the id to allocate next.
+                                               Defaults to one past the largest id.
+        """
+        self.variables = list(variables)
+        self.rows = list(rows)
+        self.columns = [list(entityColumns) for entityColumns in columns]
+        self.freeRows = list(freeRows)
+        # Ownership is tracked as a bit mask, so copies reset it in O(1):
+        # a bit per variable column, then per items a bit for the rows map and free list,
+        # followed by a bit per column.
+        bit = len(self.variables)
+        rowsBits = []
+        columnBits = []
+        for entityColumns in self.columns:
+            rowsBits.append(1 << bit)
+            columnBits.append(tuple(1 << (bit + 1 + keyIndex) for keyIndex in range(len(entityColumns))))
+            bit += 1 + len(entityColumns)
+        self._rowsBits = tuple(rowsBits)
+        self._columnBits = tuple(columnBits)
+        self._owned = 0
+        self.undoLog = None
+        self.itemIndexes = NO_ITEM_INDEXES
+        self.indexes = []
+        self._ownedIndexes = []
+        self.itemAggregates = NO_ITEM_AGGREGATES
+        self.aggregates = []
+        self.nextIds = tuple(nextIds) if nextIds is not None else initial_next_ids(self.rows)
+        if fingerprint is None:
+            fingerprint = self.compute_fingerprint()
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def from_values(cls, variables: Iterable[List], items: Iterable[Dict],
+                    variableTypecodes: Iterable, itemTypecodes: Iterable[Iterable], nextIds: Iterable[int] = None):
+        """
+        Build a ColumnarState from the object representation (lists of values, dicts of items).
+
+        Args:
+            variables (Iterable[List]): Variable lists.
+            items (Iterable[Dict]): Items dictionaries of id -> values.
+            variableTypecodes (Iterable): Typecode (or None) per variable.
+            itemTypecodes (Iterable[Iterable]): Per items, typecode (or None) per key.
+            nextIds (Iterable[int], optional): Per items, the id to allocate next.
+
+        Returns:
+            ColumnarState: The new state.
+        """
+        variableColumns = [make_column(variable, typecode)
+                           for variable, typecode in zip(variables, variableTypecodes)]
+        rows = []
+        columns = []
+        for entity, typecodes in zip(items, itemTypecodes):
+            typecodes = tuple(typecodes)
+            rows.append({itemId: row for row, itemId in enumerate(entity)})
+            values = list(entity.values())
+            columns.append([make_column((item[keyIndex] for item in values), typecode)
+                            for keyIndex, typecode in enumerate(typecodes)])
+        return cls(variableColumns, rows, columns, [[] for _ in rows], nextIds=nextIds)
+
+    def compute_fingerprint(self) -> int:
+        """
+        Compute the fingerprint of the contents from scratch.
+
+        Uses the same terms as State, so equal contents have equal fingerprints in both backends.
+
+        Returns:
+            int: The 64-bit fingerprint.
+        """
+        fingerprint = 0
+        for varIndex, variable in enumerate(self.variables):
+            for index, value in enumerate(variable):
+                fingerprint ^= hash((varIndex, index, value))
+        for entityIndex in range(len(self.rows)):
+            for itemId, values in self.items_dict(entityIndex).items():
+                fingerprint ^= item_fingerprint(entityIndex, itemId, values)
+        return fingerprint & FINGERPRINT_MASK
+
+    def __str__(self):
+        """Return a readable string representation of the State."""
+        return ("State:\nVariables: " + str([self.variable_values(i) for i in range(len(self.variables))])
+                + "\nEntities: " + str([self.items_dict(i) for i in range(len(self.rows))]))
+
+    def __eq__(self, other):
+        """
+        Check if two states are equal, comparing fingerprints first.
+
+        Args:
+            other (State): Another State instance to compare with.
+
+        Returns:
+            bool: True if variables and items are equal, False otherwise.
+        """
+        if self is other:
+            return True
+        if not isinstance(other, State):
+            return NotImplemented
+        if self.fingerprint != other.fingerprint:
+            return False
+        lenVariables = len(self.variables)
+        lenItems = len(self.rows)
+        return (all(self.variable_values(i) == other.variable_values(i) for i in range(lenVariables))
+                and all(self.items_dict(i) == other.items_dict(i) for i in range(lenItems)))
+
+    def __hash__(self):
+        """Return the incrementally maintained fingerprint."""
+        return self.fingerprint
+
+    def __copy__(self):
+        """
+        Create a copy-on-write copy of the State.
+
+        Returns:
+            ColumnarState: A new ColumnarState sharing all columns with this one.
+        """
+        self._owned = 0
+        state = ColumnarState.__new__(ColumnarState)
+        state.variables = self.variables.copy()
+        state.rows = self.rows.copy()
+        state.columns = [entityColumns.copy() for entityColumns in self.columns]
+        state.freeRows = self.freeRows.copy()
+        state._rowsBits = self._rowsBits
+        state._columnBits = self._columnBits
+        state._owned = 0
+        state.undoLog = None
+        state.fingerprint = self.fingerprint
+        state.nextIds = self.nextIds
+        state.itemIndexes = NO_ITEM_INDEXES
+        state.indexes = []
+        state._ownedIndexes = []
+        state.itemAggregates = NO_ITEM_AGGREGATES
+        state.aggregates = []
+        self._copy_indexes_to(state)
+        return state
+
+    def _own_variable(self, varIndex):
+        """Return a variable column that is safe to write, copying the shared column if needed."""
+        bit = 1 << varIndex
+        if self._owned & bit:
+            return self.variables[varIndex]
+        variable = self.variables[varIndex][:]
+        self.variables[varIndex] = variable
+        self._owned |= bit
+        return variable
+
+    def _own_rows(self, entityIndex) -> Dict:
+        """Return a rows map (and free list) that is safe to write, copying the shared ones if needed."""
+        bit = self._rowsBits[entityIndex]
+        if self._owned & bit:
+            return self.rows[entityIndex]
+        rows = self.rows[entityIndex].copy()
+        self.rows[entityIndex] = rows
+        self.freeRows[entityIndex] = self.freeRows[entityIndex].copy()
+        self._owned |= bit
+        return rows
+
+    def _own_column(self, entityIndex, keyIndex):
+        """Return an items column that is safe to write, copying the shared column if needed."""
+        bit = self._columnBits[entityIndex][keyIndex]
+        if self._owned & bit:
+            return self.columns[entityIndex][keyIndex]
+        column = self.columns[entityIndex][keyIndex][:]
+        self.columns[entityIndex][keyIndex] = column
+        self._owned |= bit
+        return column
+
+    def _widen_variable(self, varIndex):
+        """Replace an array variable column with a list column, for values an array can't hold."""
+        self.variables[varIndex] = list(self.variables[varIndex])
+        self._owned |= 1 << varIndex
+
+    def _widen_column(self, entityIndex, keyIndex):
+        """Replace an array items column with a list column, for values an array can't hold."""
+        self.columns[entityIndex][keyIndex] = list(self.columns[entityIndex][keyIndex])
+        self._owned |= self._columnBits[entityIndex][keyIndex]
+
+    def _item_values(self, entityIndex, itemId):
+        """Return the values of an item."""
+        row = self.rows[entityIndex][itemId]
+        return [column[row] for column in self.columns[entityIndex]]
+
+    def _restore_item(self, entityIndex, itemId, values, position=None):
+        """
+        Put back an item's values as they were logged, without logging.
+
+        Args:
+            entityIndex (int): The index of the entity in the items tuple.
+            itemId (int): The ID of the item.
+            values (List): The logged values.
+            position (int, optional): The item's position in iteration order, for removed items.
+        """
+        rows = self._own_rows(entityIndex)
+        indexed = entityIndex in self.itemIndexes
+        if itemId in rows:
+            row = rows[itemId]
+            oldValues = [column[row] for column in self.columns[entityIndex]]
+            self.fingerprint ^= item_fingerprint(entityIndex, itemId, oldValues)
+            if indexed:
+                self._index_item(entityIndex, itemId, oldValues, False)
+        else:
+            freeRows = self.freeRows[entityIndex]
+            # Without free rows, every row holds an item - a new row goes at the end of the columns
+            row = freeRows.pop() if freeRows else len(rows)
+            rows[itemId] = row
+        self._write_row(entityIndex, row, values)
+        self.fingerprint ^= item_fingerprint(entityIndex, itemId, values)
+        if indexed:
+            self._index_item(entityIndex, itemId, values)
+        if position is not None and position < len(rows) - 1:
+            # Back to the original position, so iteration order is restored too.
+            move_last_key(rows, position)
+
+    def variable_values(self, varIndex) -> List:
+        """
+        Get all values of a variable.
+
+        Args:
+            varIndex (int): The index of the variable.
+
+        Returns:
+            List: The variable's values.
+        """
+        return list(self.variables[varIndex])
+
+    def items_dict(self, entityIndex) -> Dict:
+        """
+        Get the items of an entity as a dictionary of id -> values.
+
+        Args:
+            entityIndex (int): The index of the entity in the items tuple.
+
+        Returns:
+            Dict: The items' values, as lists.
+        """
+        columns = self.columns[entityIndex]
+        return {itemId: [column[row] for column in columns] for itemId, row in self.rows[entityIndex].items()}
+
+    def get_item_value(self, entityIndex, keyIndex, index):
+        """
+        Get the value of an item.
+
+        Args:
+            entityIndex (int): The index of the entity in the items tuple.
+            keyIndex (int): The index of the key in the item.
+            index (int): The ID of the item.
+
+        Returns:
+            Any: The value at the specified key and item ID.
+        """
+        return self.columns[entityIndex][keyIndex][self.rows[entityIndex][index]]
+
+    def set_variable_value(self, varIndex, index, value):
+        """
+        Set the value of a variable.
+
+        Args:
+            varIndex (int): The index of the variable in the variables tuple.
+            index (int): The index within the variable list.
+            value (Any): The new value to set.
+        """
+        variable = self._own_variable(varIndex)
+        old = variable[index]
+        if self.undoLog is not None:
+            self.undoLog.append((UNDO_VARIABLE, varIndex, index, old))
+        if isinstance(value, bool) and isinstance(variable, array):
+            # Arrays would store booleans as integers (see make_column)
+            self._widen_variable(varIndex)
+            variable = self.variables[varIndex]
+        try:
+            variable[index] = value
+        except (TypeError, OverflowError):
+            self._widen_variable(varIndex)
+            self.variables[varIndex][index] = value
+        self.fingerprint = (self.fingerprint ^ hash((varIndex, index, old))
+                            ^ hash((varIndex, index, value))) & FINGERPRINT_MASK
+
+    def set_item_value(self, entityIndex, keyIndex, index, value):
+        """
+        Set the value of an item.
+
+        Args:
+            entityIndex (int): The index of the entity in the items tuple.
+            keyIndex (int): The index of the key in the item.
+            index (int): The ID of the item.
+            value (Any): The new value to set.
+        """
+        row = self.rows[entityIndex][index]
+        column = self._own_column(entityIndex, keyIndex)
+        old = column[row]
+        if self.undoLog is not None:
+            self.undoLog.append((UNDO_ITEM_VALUE, entityIndex, keyIndex, index, old))
+        if entityIndex in self.itemIndexes:
+            self._reindex_value(entityIndex, keyIndex, index, old, value)
+        if isinstance(value, bool) and isinstance(column, array):
+            # Arrays would store booleans as integers (see make_column)
+            self._widen_column(entityIndex, keyIndex)
+            column = self.columns[entityIndex][keyIndex]
+        try:
+            column[row] = value
+        except (TypeError, OverflowError):
+            self._widen_column(entityIndex, keyIndex)
+            self.columns[entityIndex][keyIndex][row] = value
+        entityKey = -1 - entityIndex
+        self.fingerprint = (self.fingerprint ^ hash((entityKey, index, keyIndex, old))
+                            ^ hash((entityKey, index, keyIndex, value))) & FINGERPRINT_MASK
+
+    def get_items_ids(self, entityIndex) -> Iterable[int]:
+        """
+        Get the IDs of all items for a given entity.
+
+        Args:
+            entityIndex (int): The index of the entity in the items tuple.
+
+        The ids are a live view, see State.get_items_ids.
+
+        Returns:
+            Iterable[int]: A view of the item IDs, supporting len and fast membership tests.
+        """
+        return self.rows[entityIndex].keys()
+
+    def get_len_items(self, entityIndex) -> int:
+        """
+        Get the number of items for a given entity.
+
+        Args:
+            entityIndex (int): The index of the entity in the items tuple.
+
+        Returns:
+            int: The number of items.
+        """
+        return len(self.rows[entityIndex])
+
+    def get_len_entities(self) -> int:
+        """
+        Get the number of items collections (entities with items) in the state.
+
+        Returns:
+            int: The number of items collections.
+        """
+        return len(self.rows)
+
+    def _write_row(self, entityIndex, row, values):
+        """Write an item's values to a row, appending a new row at the end of the columns if needed."""
+        for keyIndex, value in enumerate(values):
+            column = self._own_column(entityIndex, keyIndex)
+            if isinstance(value, bool) and isinstance(column, array):
+                # Arrays would store booleans as integers (see make_column)
+                self._widen_column(entityIndex, keyIndex)
+                column = self.columns[entityIndex][keyIndex]
+            try:
+                if row == len(column):
+                    column.append(value)
+                else:
+                    column[row] = value
+            except (TypeError, OverflowError):
+                self._widen_column(entityIndex, keyIndex)
+                self._write_row(entityIndex, row, values)
+                return
+
+    def add_entity(self, entityIndex, maxId, *params):
+        """
+        Add a new entity, reusing a free row if there is one.
+
+        Args:
+            entityIndex (int): The index of the entity in the items tuple.
+            maxId (int): The ID to assign to the new entity.
+            *params: Parameters of the new entity.
+        """
+        rows = self._own_rows(entityIndex)
+        if maxId in rows:
+            if self.undoLog is not None:
+                row = rows[maxId]
+                self.undoLog.append((UNDO_ADD, entityIndex, maxId,
+                                     [column[row] for column in self.columns[entityIndex]]))
+                undoLog, self.undoLog = self.undoLog, None
+                self.replace_entity(entityIndex, maxId, *params)
+                self.undoLog = undoLog
+            else:
+                self.replace_entity(entityIndex, maxId, *params)
+            return
+        if self.undoLog is not None:
+            self.undoLog.append((UNDO_ADD, entityIndex, maxId, None))
+        freeRows = self.freeRows[entityIndex]
+        # Without free rows, every row holds an item - a new row goes at the end of the columns
+        row = freeRows.pop() if freeRows else len(rows)
+        self._write_row(entityIndex, row, params)
+        rows[maxId] = row
+        self.fingerprint ^= item_fingerprint(entityIndex, maxId, params)
+        if entityIndex in self.itemIndexes:
+            self._index_item(entityIndex, maxId, params)
+
+    # Columns don't distinguish between list and tuple items.
+    add_entity_list = add_entity
+
+    def remove_entity(self, entityIndex, removeId):
+        """
+        Remove an entity by its ID. Its row is released to the free list.
+
+        Args:
+            entityIndex (int): The index of the entity in the items tuple.
+            removeId (int): The ID of the entity to remove.
+        """
+        rows = self._own_rows(entityIndex)
+        row = rows[removeId]
+        values = [column[row] for column in self.columns[entityIndex]]
+        if self.undoLog is not None:
+            self.undoLog.append((UNDO_REMOVE, entityIndex, removeId, values, key_position(rows, removeId)))
+        del rows[removeId]
+        self.freeRows[entityIndex].append(row)
+        self.fingerprint ^= item_fingerprint(entityIndex, removeId, values)
+        if entityIndex in self.itemIndexes:
+            self._index_item(entityIndex, removeId, values, False)
+
+    def replace_entity(self, entityIndex, replaceId, *newVals):
+        """
+        Replace an existing entity's values with new values.
+
+        Args:
+            entityIndex (int): The index of the entity in the items tuple.
+            replaceId (int): The ID of the entity to replace.
+            *newVals: New values for the entity.
+        """
+        row = self.rows[entityIndex][replaceId]
+        oldVals = [column[row] for column in self.columns[entityIndex]]
+        if self.undoLog is not None:
+            self.undoLog.append((UNDO_REPLACE, entityIndex, replaceId, oldVals))
+        self._write_row(entityIndex, row, newVals)
+        self.fingerprint ^= (item_fingerprint(entityIndex, replaceId, oldVals)
+                             ^ item_fingerprint(entityIndex, replaceId, newVals))
+        if entityIndex in self.itemIndexes:
+            self._index_item(entityIndex, replaceId, oldVals, False)
+            self._index_item(entityIndex, replaceId, newVals)
+
+    replace_entity_list = replace_entity
@@ -0,0 +1,521 @@
+from typing import Callable, Sequence, List, Optional, Set
+import operator
+from CARRI.problem import Problem, ACCESS_CONSTANT, ACCESS_VARIABLE, ACCESS_ITEM
+from CARRI.expression import (ExpressionNode, ConstNode, ParameterNode, ValueIndexNode, ValueNode,
+                              ExistingExpressionNode, OperatorNode, AndNode, OrNode, Update, ConstUpdate,
+                              ExpressionIndexUpdate, ExpressionUpdate, ExpressionRemoveUpdate, ExpressionAddUpdate,
+                              ExpressionReplaceUpdate, ParameterUpdate, CaseUpdate, AllUpdate, RepeatUpdate,
+                              resolve_index_probe, iter_tree)
+
+# Operators compiled to Python's infix operators - the same functions, and both evaluate the left operand first.
+INFIX_OPERATORS = {
+    operator.add: '+',
+    operator.sub: '-',
+    operator.mul: '*',
+    operator.truediv: '/',
+    operator.eq: '==',
+    operator.ne: '!=',
+    operator.gt: '>',
+    operator.lt: '<',
+    operator.ge: '>=',
+    operator.le: '<=',
+    operator.and_: '&',
+    operator.or_: '|'
+}
+# Short-circuiting node classes compiled to Python's boolean operators.
+LOGICAL_KEYWORDS = {
+    AndNode: 'and',
+    OrNode: 'or'
+}
+# Constant types inlined into the generated source as literals.
+LITERAL_TYPES = (bool, int, str, type(None))
+
+
+class ExpressionCompiler:
+    """
+    Compiles an expression tree into a single Python function, generated as source and built with compile().
+
+    The function takes (problem, state, slots) and returns what evaluate(problem, state) on the tree does.
+    Its body is one expression: constants are inlined, bound accessors (see bind_accessors) become direct
+    State calls, and the given parameters are read from slots - a flat sequence of their values.
+    Other parameters (e.g. NewVar parameters) are read from their nodes when evaluating,
+    and nodes the compiler doesn't know are evaluated by their own evaluate.
+
+    State reads repeated in the compiled code (the same variable or items key at the same index expression,
+    see read_key) are common subexpressions: the first read evaluated unconditionally is kept in a local
+    variable, by an assignment expression, and the later ones use it until a write may change it.
+    """
+    def __init__(self, problem: Problem, parameters: Sequence[ParameterNode] = ()):
+        """
+        Initialize an ExpressionCompiler.
+
+        Args:
+            problem (Problem): The problem the expressions are evaluated in.
+            parameters (Sequence[ParameterNode]): Parameters read from slots, by their position in the sequence.
+        """
+        self.problem = problem
+        self.slots = {id(parameter): slot for slot, parameter in enumerate(parameters)}
+        self.namespace = {}
+        # id of an object -> its name in namespace
+        self.names = {}
+        # id of a parameter -> the local variable holding its value in the generated function
+        self.locals = {}
+        self.localCount = 0
+        # Key of a read (see read_key) -> the number of times the compiled code has it
+        self.readCounts = {}
+        # Key of a read held in a local variable -> (the local variable, what the read depends on)
+        self.cache = {}
+        # Number of enclosing operands evaluated only conditionally (right operands of and / or)
+        self.conditional = 0
+
+    def compile(self, node: ExpressionNode) -> Callable:
+        """
+        Compile an expression.
+
+        Args:
+            node (ExpressionNode): The expression's root.
+
+        Returns:
+            Callable: function(problem, state, slots) returning the expression's value.
+        """
+        self.count_reads((node,))
+        source = "def compiled(problem, state, slots):\n    return {}\n".format(self.emit(node))
+        exec(compile(source, "<CARRI expression>", "exec"), self.namespace)
+        function = self.namespace.pop("compiled")
+        function.source = source
+        return function
+
+    def compile_conjunction(self, nodes: Sequence[ExpressionNode]) -> Callable:
+        """
+        Compile expressions into one function checking them in order, sharing the reads repeated across them.
+
+        Args:
+            nodes (Sequence[ExpressionNode]): The expressions.
+
+        Returns:
+            Callable: function(problem, state, slots) returning False at the first expression whose value
+                      is false, True if all are true - like all(node.evaluate(problem, state) for node in nodes).
+        """
+        self.count_reads(nodes)
+        lines = ["    if not {}:\n        return False".format(self.emit(node)) for node in nodes]
+        source = "def compiled(problem, state, slots):\n{}\n".format("\n".join(lines + ["    return True"]))
+        exec(compile(source, "<CARRI conjunction>", "exec"), self.namespace)
+        function = self.namespace.pop("compiled")
+        function.source = source
+        return function
+
+    def new_local(self, prefix: str) -> str:
+        """Return a new local variable name."""
+        self.localCount += 1
+        return "{}_{}".format(prefix, self.localCount)
+
+    def read_key(self, node: ExpressionNode, dependencies: Set):
+        """
+        Get the key of an expression, equal for expressions reading and computing the same,
+        as long as the state and parameters they depend on don't change.
+
+        Args:
+            node (ExpressionNode): The expression.
+            dependencies (Set): Gets the expression's dependencies: the accessors it reads through,
+                                and ('parameter', id) of the parameters it reads.
+
+        Returns:
+            tuple: The key, None if the expression has nodes whose reads aren't known.
+        """
+        if isinstance(node, ConstNode):
+            return ('const', node.const) if type(node.const) in LITERAL_TYPES else ('const', id(node.const))
+        if isinstance(node, ParameterNode):
+            dependencies.add(('parameter', id(node)))
+            return 'parameter', id(node)
+        if isinstance(node, (ValueIndexNode, ValueNode)):
+            accessor = node.accessor
+            if accessor is None:
+                return None
+            if isinstance(node, ValueIndexNode):
+                index = ('const', node.index)
+            else:
+                index = self.read_key(node.expression, dependencies)
+                if index is None:
+                    return None
+            if accessor[0] == ACCESS_CONSTANT:
+                return 'table', id(accessor[1]), index
+            dependencies.add(accessor)
+            return 'read', accessor, index
+        if isinstance(node, OperatorNode):
+            operands = tuple(self.read_key(operand, dependencies) for operand in node.operands)
+            if None in operands:
+                return None
+            return 'operator', type(node), node.operator, operands
+        return None
+
+    def count_reads(self, roots: Sequence):
+        """Count the state reads under roots (expressions or updates) by their keys, see read_key."""
+        for root in roots:
+            for node in iter_tree(root):
+                if (isinstance(node, (ValueIndexNode, ValueNode)) and node.accessor is not None
+                        and node.accessor[0] != ACCESS_CONSTANT):
+                    key = self.read_key(node, set())
+                    if key is not None:
+                        self.readCounts[key] = self.readCounts.get(key, 0) + 1
+
+    def invalidate(self, written: Optional[Set]):
+        """Stop using the held reads that depend on written (accessors and parameters), all if it's None."""
+        if written is None:
+            self.cache = {}
+        else:
+            self.cache = {key: entry for key, entry in self.cache.items() if not entry[1] & written}
+
+    def bind(self, value, prefix: str) -> str:
+        """Return the name of an object in the generated code's namespace, adding it if needed."""
+        name = self.names.get(id(value))
+        if name is None:
+            name = "{}{}".format(prefix, len(self.names))
+            self.names[id(value)] = name
+            self.namespace[name] = value
+        return name
+
+    def constant(self, value) -> str:
+        """Return the source of a constant value."""
+        if type(value) in LITERAL_TYPES:
+            return repr(value)
+        return self.bind(value, "const")
+
+    def read(self, accessor, variableName: str, index: str) -> str:
+        """Return the source reading a variable or items key at an index, through its accessor if it's bound."""
+        if accessor is None:
+            return "problem.get_value(state, {}, {})".format(repr(variableName), index)
+        kind = accessor[0]
+        if kind == ACCESS_VARIABLE:
+            return "state.get_variable_value({}, {})".format(accessor[1], index)
+        if kind == ACCESS_ITEM:
+            return "state.get_item_value({}, {}, {})".format(accessor[1], accessor[2], index)
+        return "{}[{}]".format(self.bind(accessor[1], "table"), index)
+
+    def emit(self, node: ExpressionNode) -> str:
+        """
+        Generate the source of an expression.
+
+        Args:
+            node (ExpressionNode): The expression.
+
+        Returns:
+            str: A Python expression, using the names problem, state, slots and the namespace's names.
+        """
+        if isinstance(node, ConstNode):
+            return self.constant(node.const)
+        if isinstance(node, ParameterNode):
+            local = self.locals.get(id(node))
+            if local is not None:
+                return local
+            slot = self.slots.get(id(node))
+            if slot is not None:
+                return "slots[{}]".format(slot)
+            return "{}.value".format(self.bind(node, "parameter"))
+        if isinstance(node, (ValueIndexNode, ValueNode)):
+            accessor = node.accessor
+            if accessor is not None and accessor[0] == ACCESS_CONSTANT:
+                if isinstance(node, ValueIndexNode):
+                    return self.constant(accessor[1][node.index])
+                return self.read(accessor, node.variableName, self.emit(node.expression))
+            dependencies = set()
+            key = self.read_key(node, dependencies)
+            if key in self.cache:
+                return self.cache[key][0]
+            index = repr(node.index) if isinstance(node, ValueIndexNode) else self.emit(node.expression)
+            source = self.read(accessor, node.variableName, index)
+            if key is None or self.conditional or self.readCounts.get(key, 0) < 2:
+                return source
+            local = self.new_local("read")
+            self.cache[key] = (local, frozenset(dependencies))
+            return "({} := {})".format(local, source)
+        if isinstance(node, ExistingExpressionNode):
+            return "({} in problem.get_entity_ids(state, {}))".format(self.emit(node.expression), node.entityIndex)
+        if isinstance(node, OperatorNode):
+            keyword = LOGICAL_KEYWORDS.get(type(node))
+            if keyword is not None:
+                # The right operand may not be evaluated - reads in it aren't held for later
+                left = self.emit(node.operands[0])
+                self.conditional += 1
+                right = self.emit(node.operands[1])
+                self.conditional -= 1
+                return "({} {} {})".format(left, keyword, right)
+            operands = [self.emit(operand) for operand in node.operands]
+            symbol = INFIX_OPERATORS.get(node.operator)
+            if symbol is not None and len(operands) == 2:
+                return "({} {} {})".format(operands[0], symbol, operands[1])
+            if node.operator is operator.not_ and len(operands) == 1:
+                return "(not {})".format(operands[0])
+            if node.operator is operator.getitem and len(operands) == 2:
+                return "{}[{}]".format(operands[0], operands[1])
+            return "{}({})".format(self.bind(node.operator, "operator"), ", ".join(operands))
+        return "{}.evaluate(problem, state)".format(self.bind(node, "node"))
+
+
+class EffectCompiler(ExpressionCompiler):
+    """
+    Fuses a list of updates - a step's effects, or a CostExpression's updates and cost - into one generated function.
+
+    All, Case and Repeat updates become for, if and while statements, writes become direct State calls,
+    and the parameters the updates assign (NewVal parameters, All parameters) are held in local variables.
+    Their nodes are still assigned, as applying the updates would, for expressions read outside the function.
+
+    Held reads (see ExpressionCompiler) are dropped after a write through their accessors or to parameters
+    they read, before loops whose bodies may write them, and after branches that may write them.
+    """
+    def __init__(self, problem: Problem, parameters: Sequence[ParameterNode] = ()):
+        """
+        Initialize an EffectCompiler.
+
+        Args:
+            problem (Problem): The problem the updates are applied in.
+            parameters (Sequence[ParameterNode]): Parameters read from slots, by their position in the sequence.
+        """
+        super().__init__(problem, parameters)
+        # (local variable, parameter's name in namespace) of the NewVal parameters assigned by the updates
+        self.newValLocals = []
+
+    def compile_updates(self, updates: Sequence[Update], result: ExpressionNode = None) -> Callable:
+        """
+        Compile updates, and optionally an expression evaluated after them.
+
+        Args:
+            updates (Sequence[Update]): The updates, applied in order.
+            result (ExpressionNode, optional): An expression whose value is returned, None to return None.
+
+        Returns:
+            Callable: function(problem, state, slots) applying the updates (and returning result's value).
+        """
+        self.count_reads(list(updates) + ([result] if result is not None else []))
+        body = []
+        self.emit_updates(updates, body, 1)
+        if result is not None:
+            body.append("    return " + self.emit(result))
+        # NewVal parameters keep their values between calls - start from them
+        prologue = ["    {} = {}.value".format(local, parameter) for local, parameter in self.newValLocals]
+        source = "def compiled(problem, state, slots):\n{}\n".format("\n".join(prologue + body or ["    pass"]))
+        exec(compile(source, "<CARRI effects>", "exec"), self.namespace)
+        function = self.namespace.pop("compiled")
+        function.source = source
+        return function
+
+    def write(self, accessor, variableName: str, index: str, value: str) -> str:
+        """Return the source writing a variable or items key at an index, through its setter if it's bound."""
+        if accessor is None:
+            return "problem.set_value(state, {}, {}, {})".format(repr(variableName), index, value)
+        if accessor[0] == ACCESS_VARIABLE:
+            return "state.set_variable_value({}, {}, {})".format(accessor[1], index, value)
+        return "state.set_item_value({}, {}, {}, {})".format(accessor[1], accessor[2], index, value)
+
+    def emit_updates(self, updates: Sequence[Update], lines: List[str], depth: int):
+        """Append the statements of updates at an indentation depth, pass if there are none."""
+        if not updates:
+            lines.append("    " * depth + "pass")
+        for update in updates:
+            self.emit_update(update, lines, depth)
+
+    def emit_update(self, update: Update, lines: List[str], depth: int):
+        """
+        Append the statements of an update.
+
+        Args:
+            update (Update): The update.
+            lines (List[str]): The function's lines so far.
+            depth (int): The indentation depth.
+        """
+        indent = "    " * depth
+        if isinstance(update, ConstUpdate):
+            lines.append(indent + self.write(update.accessor, update.variableName, repr(update.index),
+                                             self.constant(update.const)))
+            self.invalidate(self.written_by((update,)))
+        elif isinstance(update, ExpressionIndexUpdate):
+            lines.append(indent + self.write(update.accessor, update.variableName, repr(update.index),
+                                             self.emit(update.expression)))
+            self.invalidate(self.written_by((update,)))
+        elif isinstance(update, ExpressionUpdate):
+            lines.append(indent + self.write(update.accessor, update.variableName, self.emit(update.expressionIndex),
+                                             self.emit(update.expressionValue)))
+            self.invalidate(self.written_by((update,)))
+        elif isinstance(update, ExpressionRemoveUpdate):
+            lines.append(indent + "problem.remove_entity(state, {}, {})".format(
+                update.entityIndex, self.emit(update.expression)))
+            self.invalidate(None)
+        elif isinstance(update, ExpressionAddUpdate):
+            lines.append(indent + "problem.add_entity(state, {})".format(
+                ", ".join([repr(update.entityIndex)] + [self.emit(expression) for expression in update.expressions])))
+            self.invalidate(None)
+        elif isinstance(update, ExpressionReplaceUpdate):
+            lines.append(indent + "problem.replace_entity(state, {})".format(
+                ", ".join([repr(update.entityIndex), self.emit(update.expressionId)]
+                          + [self.emit(expression) for expression in update.expressions])))
+            self.invalidate(None)
+        elif isinstance(update, ParameterUpdate):
+            self.emit_parameter_update(update, lines, indent)
+            self.invalidate(self.written_by((update,)))
+        elif isinstance(update, CaseUpdate):
+            lines.append(indent + "if {}:".format(self.emit(update.condition)))
+            before = self.cache
+            self.cache = dict(before)
+            self.emit_updates(update.updates, lines, depth + 1)
+            kept = self.cache
+            if update.elseUpdates:
+                lines.append(indent + "else:")
+                self.cache = dict(before)
+                self.emit_updates(update.elseUpdates, lines, depth + 1)
+            # Held reads are valid after the if statement if neither branch dropped them
+            self.cache = {key: entry for key, entry in before.items()
+                          if kept.get(key) is entry and self.cache.get(key) is entry}
+        elif isinstance(update, RepeatUpdate):
+            # The condition is evaluated before each iteration and last, so reads held by it stay valid after it
+            self.invalidate(self.written_by(update.updates))
+            lines.append(indent + "while {}:".format(self.emit(update.condition)))
+            before = self.cache
+            self.cache = dict(before)
+            self.emit_updates(update.updates, lines, depth + 1)
+            self.cache = before
+        elif isinstance(update, AllUpdate):
+            self.emit_all_update(update, lines, depth)
+        else:
+            lines.append(indent + "{}.apply(problem, state)".format(self.bind(update, "update")))
+            # The update may have assigned parameters held in locals
+            lines.extend(indent + "{} = {}.value".format(local, parameter) for local, parameter in self.newValLocals)
+            self.invalidate(None)
+
+    @staticmethod
+    def written_by(updates: Sequence[Update]) -> Optional[Set]:
+        """
+        Get what updates, and the updates under them, may write.
+
+        Args:
+            updates (Sequence[Update]): The updates.
+
+        Returns:
+            Set | None: The setters (see Problem.resolve_setter) and ('parameter', id) of the parameters they write,
+                        None if they may write anything - through unbound names, entities or unknown updates.
+        """
+        written = set()
+        for update in updates:
+            for node in iter_tree(update):
+                if isinstance(node, (ConstUpdate, ExpressionIndexUpdate, ExpressionUpdate)):
+                    if node.accessor is None:
+                        return None
+                    written.add(node.accessor)
+                elif isinstance(node, (ParameterUpdate, AllUpdate)):
+                    written.add(('parameter', id(node.parameter)))
+                elif isinstance(node, Update) and not isinstance(node, (CaseUpdate, RepeatUpdate)):
+                    return None
+        return written
+
+    def emit_parameter_update(self, update: ParameterUpdate, lines: List[str], indent: str):
+        """Append the statement of a ParameterUpdate, assigning the parameter's local variable and node."""
+        value = self.emit(update.expression)
+        parameter = update.parameter
+        name = self.bind(parameter, "parameter")
+        slot = self.slots.get(id(parameter))
+        if slot is not None:
+            lines.append(indent + "slots[{}] = {}.value = {}".format(slot, name, value))
+            return
+        local = self.locals.get(id(parameter))
+        if local is None:
+            local = self.new_local("newVal")
+            self.locals[id(parameter)] = local
+            self.newValLocals.append((local, name))
+        lines.append(indent + "{} = {}.value = {}".format(local, name, value))
+
+    def emit_all_update(self, update: AllUpdate, lines: List[str], depth: int):
+        """Append the loop of an AllUpdate, over the item index's candidates if it has an index probe."""
+        indent = "    " * depth
+        problem = self.problem
+        # Reads held before the loop, or by its candidates, may change in later iterations if the body writes them
+        written = self.written_by((update,))
+        self.invalidate(written)
+        entities = None
+        if update.indexProbe:
+            keyNode, other = resolve_index_probe(update.condition, update.indexProbe)
+            itemKey = problem.itemKeysPositions.get(keyNode.variableName)
+            if itemKey is not None and itemKey[0] == problem.entityIdToItemId[update.entityIndex]:
+                entities = "problem.ids_where(state, {}, {})".format(repr(keyNode.variableName), self.emit(other))
+        if entities is None:
+            entities = "problem.get_entity_ids(state, {}, {})".format(update.entityIndex, update.snapshot)
+        self.invalidate(written)
+        parameter = update.parameter
+        local = self.new_local("item")
+        lines.append(indent + "for {} in {}:".format(local, entities))
+        lines.append(indent + "    {}.value = {}".format(self.bind(parameter, "parameter"), local))
+        previous = self.locals.get(id(parameter))
+        self.locals[id(parameter)] = local
+        before = self.cache
+        self.cache = dict(before)
+        if update.condition is not None:
+            lines.append(indent + "    if {}:".format(self.emit(update.condition)))
+            self.emit_updates(update.updates, lines, depth + 2)
+        else:
+            self.emit_updates(update.updates, lines, depth + 1)
+        # Reads held in an iteration aren't valid after the loop, which may have had no iterations
+        self.cache = before
+        # After the loop, the parameter is read from its node (the loop may have had no iterations)
+        if previous is None:
+            del self.locals[id(parameter)]
+        else:
+            self.locals[id(parameter)] = previous
+
+
+def compile_expression(node: ExpressionNode, problem: Problem,
+                       parameters: Sequence[ParameterNode] = ()) -> Callable:
+    """
+    Compile an expression into a function(problem, state, slots), see ExpressionCompiler.
+
+    Args:
+        node (ExpressionNode): The expression.
+        problem (Problem): The problem the expression is evaluated in.
+        parameters (Sequence[ParameterNode]): Parameters read from slots, by their position in the sequence.
+
+    Returns:
+        Callable: The compiled expression.
+    """
+    return ExpressionCompiler(problem, parameters).compile(node)
+
+
+def compile_expressions(nodes: Sequence[ExpressionNode], problem: Problem,
+                        parameters: Sequence[ParameterNode] = ()) -> tuple:
+    """
+    Compile expressions sharing parameters, see compile_expression.
+
+    Returns:
+        tuple: The compiled expressions, in order.
+    """
+    return tuple(compile_expression(node, problem, parameters) for node in nodes)
+
+
+def compile_conjunction(nodes: Sequence[ExpressionNode], problem: Problem,
+                        parameters: Sequence[ParameterNode] = ()) -> Callable:
+    """
+    Compile expressions into one function(problem, state, slots) checking that all are true,
+    see ExpressionCompiler.compile_conjunction.
+
+    Args:
+        nodes (Sequence[ExpressionNode]): The expressions, checked in order.
+        problem (Problem): The problem the expressions are evaluated in.
+        parameters (Sequence[ParameterNode]): Parameters read from slots, by their position in the sequence.
+
+    Returns:
+        Callable: The compiled conjunction.
+    """
+    return ExpressionCompiler(problem, parameters).compile_conjunction(nodes)
+
+
+def compile_updates(updates: Sequence[Update], problem: Problem, parameters: Sequence[ParameterNode] = (),
+                    result: ExpressionNode = None) -> Callable:
+    """
+    Fuse updates, and optionally an expression evaluated after them, into a function(problem, state, slots),
+    see EffectCompiler.
+
+    Args:
+        updates (Sequence[Update]): The updates, applied in order.
+        problem (Problem): The problem the updates are applied in.
+        parameters (Sequence[ParameterNode]): Parameters read from slots, by their position in the sequence.
+        result (ExpressionNode, optional): An expression whose value the function returns.
+
+    Returns:
+        Callable: The compiled updates.
+    """
+    return EffectCompiler(problem, parameters).compile_updates(updates, result)
@@ -0,0 +1,201 @@
+import os
+import hashlib
+import heapq
+from collections import deque
+from typing import Optional, Sequence, Set
+import numpy as np
+from CARRI.adjacency import Adjacency, nodes_bitset
+
+# Directory of the on-disk distance matrices cache (relative to the working directory). Ignored by git.
+DEFAULT_CACHE_DIR = os.path.join(".carriCache", "distances")
+# Bump when the matrices' layout or meaning changes, invalidating cached files.
+CACHE_VERSION = 1
+
+
+class DistanceOracle:
+    """
+    All-pairs shortest distances over an adjacency constant, per vehicle type.
+
+    A vehicle type's graph keeps the locations accessible to it (see accessible) and the edges
+    between them. Distances are computed once per vehicle type - a BFS per source for neighbour
+    sets, Dijkstra for weighted (MATCH) adjacency - and kept as a NumPy matrix, with inf for unreachable
+    pairs. Matrices are also cached on disk, keyed by a hash of the graph, so later runs of the same
+    problem load them instead of recomputing.
+    """
+    def __init__(self, adjacency: Adjacency, locType: Optional[Sequence[int]] = None,
+                 cacheDir: Optional[str] = DEFAULT_CACHE_DIR):
+        """
+        Initialize a DistanceOracle. Distances are computed on first use.
+
+        Args:
+            adjacency (Adjacency): The locations' adjacency.
+            locType (Sequence[int], optional): Per location, its type. None if every vehicle may enter every location.
+            cacheDir (str, optional): Directory of the on-disk cache, None to disable it.
+        """
+        self.adjacency = adjacency
+        self.locType = None if locType is None else tuple(locType)
+        self.cacheDir = cacheDir
+        self.matrices = {}
+
+    def __len__(self):
+        """Return the number of locations."""
+        return len(self.adjacency)
+
+    def accessible(self, vehicleType: Optional[int] = None) -> int:
+        """
+        Get the locations a vehicle type may enter.
+
+        Args:
+            vehicleType (int, optional): The vehicle's entity index. None for no restriction.
+
+        Returns:
+            int: Bitset of the accessible locations.
+        """
+        if vehicleType is None or self.locType is None:
+            return (1 << len(self.adjacency)) - 1
+        return nodes_bitset(location for location, t in enumerate(self.locType) if t == 0 or t == vehicleType)
+
+    def distances(self, vehicleType: Optional[int] = None) -> np.ndarray:
+        """
+        Get the shortest distances matrix of a vehicle type.
+
+        Args:
+            vehicleType (int, optional): The vehicle's entity index. None for no restriction.
+
+        Returns:
+            np.ndarray: matrix[source, target] is the distance, inf if target is unreachable from source.
+                        Shared - don't modify.
+        """
+        allowed = self.accessible(vehicleType)
+        matrix = self.matrices.get(allowed)
+        if matrix is None:
+            matrix = self.load_cached(allowed)
+            if matrix is None:
+                matrix = self.compute(allowed)
+                self.store_cached(allowed, matrix)
+            matrix.setflags(write=False)
+            self.matrices[allowed] = matrix
+        return matrix
+
+    def distance(self, source: int, target: int, vehicleType: Optional[int] = None) -> float:
+        """
+        Get the shortest distance between two locations.
+
+        Args:
+            source (int): The starting location.
+            target (int): The destination.
+            vehicleType (int, optional): The vehicle's entity index. None for no restriction.
+
+        Returns:
+            float: The distance, inf if target is unreachable from source.
+        """
+        return float(self.distances(vehicleType)[source, target])
+
+    def reachable(self, source: int, vehicleType: Optional[int] = None) -> np.ndarray:
+        """
+        Get the locations reachable from a location.
+
+        Args:
+            source (int): The starting location.
+            vehicleType (int, optional): The vehicle's entity index. None for no restriction.
+
+        Returns:
+            np.ndarray: Boolean mask over the locations.
+        """
+        return np.isfinite(self.distances(vehicleType)[source])
+
+    def sinks(self, vehicleType: Optional[int] = None) -> Set[int]:
+        """
+        Get the locations a vehicle type can't leave: locations it may not enter,
+        and accessible locations without an edge to another accessible location.
+
+        Args:
+            vehicleType (int, optional): The vehicle's entity index. None for no restriction.
+
+        Returns:
+            Set[int]: The sink locations.
+        """
+        allowed = self.accessible(vehicleType)
+        bits = self.adjacency.bits
+        return {location for location in range(len(bits))
+                if not (allowed >> location) & 1 or bits[location] & allowed & ~(1 << location) == 0}
+
+    def compute(self, allowed: int) -> np.ndarray:
+        """
+        Compute the shortest distances between locations, walking only through allowed locations.
+
+        Args:
+            allowed (int): Bitset of the accessible locations.
+
+        Returns:
+            np.ndarray: The distances matrix.
+        """
+        size = len(self.adjacency)
+        matrix = np.full((size, size), np.inf)
+        search = self.bfs if self.adjacency.weights is None else self.dijkstra
+        for source in range(size):
+            matrix[source, source] = 0
+            if (allowed >> source) & 1:
+                search(source, allowed, matrix[source])
+        return matrix
+
+    def bfs(self, source: int, allowed: int, row: np.ndarray):
+        """Fill row with the hop counts from source, by breadth first search."""
+        adjacency = self.adjacency
+        queue = deque((source,))
+        while queue:
+            location = queue.popleft()
+            nextDistance = row[location] + 1
+            for neighbour in adjacency.neighbors(location):
+                if (allowed >> neighbour) & 1 and row[neighbour] == np.inf:
+                    row[neighbour] = nextDistance
+                    queue.append(neighbour)
+
+    def dijkstra(self, source: int, allowed: int, row: np.ndarray):
+        """Fill row with the weighted distances from source, by Dijkstra's algorithm."""
+        adjacency = self.adjacency
+        heap = [(0, source)]
+        done = set()
+        while heap:
+            distance, location = heapq.heappop(heap)
+            if location in done:
+                continue
+            done.add(location)
+            for neighbour, weight in zip(adjacency.neighbors(location), adjacency.neighbor_weights(location)):
+                if (allowed >> neighbour) & 1 and distance + weight < row[neighbour]:
+                    row[neighbour] = distance + weight
+                    heapq.heappush(heap, (distance + weight, neighbour))
+
+    def cache_path(self, allowed: int) -> str:
+        """Return the cache file of a restriction's matrix - a hash of the graph and the restriction."""
+        adjacency = self.adjacency
+        digest = hashlib.sha1()
+        digest.update(repr((CACHE_VERSION, allowed)).encode())
+        digest.update(adjacency.indptr.tobytes())
+        digest.update(adjacency.indices.tobytes())
+        digest.update(repr(list(adjacency.weights) if adjacency.weights is not None else None).encode())
+        return os.path.join(self.cacheDir, digest.hexdigest() + ".npy")
+
+    def load_cached(self, allowed: int) -> Optional[np.ndarray]:
+        """Load a matrix from the cache, None if caching is disabled or it isn't cached."""
+        if self.cacheDir is None:
+            return None
+        try:
+            matrix = np.load(self.cache_path(allowed))
+        except (OSError, ValueError):
+            return None
+        size = len(self.adjacency)
+        return matrix if matrix.shape == (size, size) else None
+
+    def store_cached(self, allowed: int, matrix: np.ndarray):
+        """Write a matrix to the cache. The cache is best effort - write failures are ignored."""
+        if self.cacheDir is None:
+            return
+        path = self.cache_path(allowed)
+        temporary = "{}.{}.tmp.npy".format(path[:-len(".npy")], os.getpid())
+        try:
+            os.makedirs(self.cacheDir, exist_ok=True)
+            np.save(temporary, matrix)
+            os.replace(temporary, path)
+        except OSError:
+            pass
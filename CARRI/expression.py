@@ -1,5 +1,5 @@
-from typing import List
-from CARRI.problem import Problem
+from typing import List, Tuple, Iterator
+from CARRI.problem import Problem, ACCESS_CONSTANT, ACCESS_VARIABLE, ACCESS_ITEM
 from CARRI.state import State
 import operator
 
@@ -22,14 +22,26 @@ operatorStringMap = {
     operator.getitem: '@'
 }
 
+# Types of the constant values fold_constants replaces subtrees by
+FOLDED_TYPES = (bool, int, float, str, type(None))
+
 class Copies:
     """Abstract base class enforcing the implementation of the 'copies' method in subclasses."""
+    __slots__ = ()
+
     def copies(self, params: List):
-        """Create a copy of the object with given parameters."""
+        """
+        Create a copy of the object with given parameters.
+
+        Objects that don't depend on the given parameters are returned as is,
+        so grounded actions share them instead of holding copies.
+        """
         raise NotImplementedError("Must be implemented by subclasses")
 
 class ExpressionNode(Copies):
     """Abstract base class for expression nodes in the expression tree."""
+    __slots__ = ()
+
     def evaluate(self, problem, state):
         """Evaluate the expression in the given problem and state context."""
         raise NotImplementedError("Must be implemented by subclasses")
@@ -43,6 +55,8 @@ class ExpressionNode(Copies):
 
 class ConstNode(ExpressionNode):
     """Represents a constant value in the expression tree."""
+    __slots__ = ('const',)
+
     def __init__(self, const):
         """Initialize with a constant value."""
         self.const = const
@@ -66,6 +80,8 @@ class ConstNode(ExpressionNode):
 
 class ParameterNode(ExpressionNode):
     """Abstract class representing a parameter node in the expression tree."""
+    __slots__ = ('index',)
+
     def __init__(self, index):
         self.index = index
 
@@ -86,6 +102,8 @@ class ParameterNode(ExpressionNode):
 
 class ValueParameterNode(ParameterNode):
     """Represents a parameter with a value assigned."""
+    __slots__ = ('value',)
+
     def __init__(self, index, value=None):
         """Initialize the ValueParameterNode with index and optional value."""
         super().__init__(index)
@@ -111,6 +129,8 @@ class ValueParameterNode(ParameterNode):
 
 class NewValParameterNode(ParameterNode):
     """Represents a new value parameter node in the expression tree."""
+    __slots__ = ('value',)
+
     def __init__(self, index, value=None):
         """Initialize the NewValParameterNode with index and optional value."""
         super().__init__(index)
@@ -139,16 +159,27 @@ class NewValParameterNode(ParameterNode):
 
 class ValueIndexNode(ExpressionNode):
     """Represents a variable with a fixed index in the expression tree."""
-    def __init__(self, variableName: str, index: int):
+    __slots__ = ('variableName', 'index', 'accessor')
+
+    def __init__(self, variableName: str, index: int, accessor: Tuple = None):
         self.variableName = variableName
         self.index = index
+        self.accessor = accessor  # Resolved by bind_accessors, get_value is used until then
 
     def __str__(self):
         return "var: " + str(self.variableName) + " at " + str(self.index) + " "
 
     def evaluate(self, problem: Problem, state: State):
         """Retrieve the value of the variable at the given index."""
-        return problem.get_value(state, self.variableName, self.index)
+        accessor = self.accessor
+        if accessor is None:
+            return problem.get_value(state, self.variableName, self.index)
+        kind = accessor[0]
+        if kind == ACCESS_VARIABLE:
+            return state.get_variable_value(accessor[1], self.index)
+        if kind == ACCESS_ITEM:
+            return state.get_item_value(accessor[1], accessor[2], self.index)
+        return accessor[1][self.index]
 
     def copies(self, params: List):
         """
@@ -162,9 +193,12 @@ class ValueIndexNode(ExpressionNode):
 
 class ValueNode(ExpressionNode):
     """Represents a variable with an index determined by an expression."""
-    def __init__(self, variableName: str, expression: ExpressionNode):
+    __slots__ = ('variableName', 'expression', 'accessor')
+
+    def __init__(self, variableName: str, expression: ExpressionNode, accessor: Tuple = None):
         self.variableName = variableName
         self.expression = expression
+        self.accessor = accessor  # Resolved by bind_accessors, get_value is used until then
 
     def __str__(self):
         return "var: " + str(self.variableName) + " at (" + str(self.expression) + ") "
@@ -172,13 +206,24 @@ class ValueNode(ExpressionNode):
     def evaluate(self, problem: Problem, state: State):
         """Retrieve the value of the variable at the index evaluated from the expression."""
         index = self.expression.evaluate(problem, state)
-        return problem.get_value(state, self.variableName, index)
+        accessor = self.accessor
+        if accessor is None:
+            return problem.get_value(state, self.variableName, index)
+        kind = accessor[0]
+        if kind == ACCESS_VARIABLE:
+            return state.get_variable_value(accessor[1], index)
+        if kind == ACCESS_ITEM:
+            return state.get_item_value(accessor[1], accessor[2], index)
+        return accessor[1][index]
 
     def copies(self, params: List):
         """
         Copies object's expression.
         """
-        return ValueNode(self.variableName, self.expression.copies(params))
+        expression = self.expression.copies(params)
+        if expression is self.expression:
+            return self
+        return ValueNode(self.variableName, expression, self.accessor)
 
     def applicable(self) -> bool:
         """Applicable if the index expression is applicable."""
@@ -186,6 +231,8 @@ class ValueNode(ExpressionNode):
 
 class ExistingExpressionNode(ExpressionNode):
     """Checks if an entity exists based on the evaluated expression."""
+    __slots__ = ('entityIndex', 'expression')
+
     def __init__(self, entityIndex: int, expression: ExpressionNode):
         self.entityIndex = entityIndex
         self.expression = expression
@@ -202,7 +249,10 @@ class ExistingExpressionNode(ExpressionNode):
         """
         Copies object's expression.
         """
-        return ExistingExpressionNode(self.entityIndex, self.expression.copies(params))
+        expression = self.expression.copies(params)
+        if expression is self.expression:
+            return self
+        return ExistingExpressionNode(self.entityIndex, expression)
 
     def applicable(self) -> bool:
         """Applicable if the expression is applicable."""
@@ -210,6 +260,8 @@ class ExistingExpressionNode(ExpressionNode):
 
 class OperatorNode(ExpressionNode):
     """Represents an operator applied to one or more operands."""
+    __slots__ = ('operator', 'operands')
+
     def __init__(self, operator, *operands):
         self.operator = operator  # A callable operator (e.g., operator.add)
         self.operands = operands  # Tuple of operand nodes of ExpressionNode type
@@ -226,14 +278,116 @@ class OperatorNode(ExpressionNode):
         """
         Copies object's expressions.
         """
-        return OperatorNode(self.operator, *[expression.copies(params) for expression in self.operands])
+        operands = [expression.copies(params) for expression in self.operands]
+        if all(copied is expression for copied, expression in zip(operands, self.operands)):
+            return self
+        return type(self)(self.operator, *operands)
 
     def applicable(self) -> bool:
         """Applicable if all operands are applicable."""
         return all(expression.applicable() for expression in self.operands)
 
+class UnaryOperatorNode(OperatorNode):
+    """Represents an operator applied to a single operand."""
+    __slots__ = ()
+
+    def evaluate(self, problem, state):
+        """Evaluate the operator with the evaluated operand."""
+        return self.operator(self.operands[0].evaluate(problem, state))
+
+class BinaryOperatorNode(OperatorNode):
+    """Represents an operator applied to two operands, evaluated left to right."""
+    __slots__ = ()
+
+    def evaluate(self, problem, state):
+        """Evaluate the operator with the evaluated operands."""
+        operands = self.operands
+        return self.operator(operands[0].evaluate(problem, state), operands[1].evaluate(problem, state))
+
+class ComparisonNode(BinaryOperatorNode):
+    """Represents a comparison (=, !=, <, <=, >, >=) of two operands."""
+    __slots__ = ()
+
+class NotNode(UnaryOperatorNode):
+    """Represents the logical negation of an operand."""
+    __slots__ = ()
+
+    def evaluate(self, problem, state):
+        """Evaluate to True if the operand evaluates to a false value."""
+        return not self.operands[0].evaluate(problem, state)
+
+class AndNode(BinaryOperatorNode):
+    """Represents a logical 'and'. The right operand is only evaluated if the left one is true."""
+    __slots__ = ()
+
+    def evaluate(self, problem, state):
+        """Evaluate the left operand if it is false, the right operand otherwise."""
+        operands = self.operands
+        return operands[0].evaluate(problem, state) and operands[1].evaluate(problem, state)
+
+class OrNode(BinaryOperatorNode):
+    """Represents a logical 'or'. The right operand is only evaluated if the left one is false."""
+    __slots__ = ()
+
+    def evaluate(self, problem, state):
+        """Evaluate the left operand if it is true, the right operand otherwise."""
+        operands = self.operands
+        return operands[0].evaluate(problem, state) or operands[1].evaluate(problem, state)
+
+# Operators with a dedicated node class
+LOGICAL_NODES = {
+    operator.and_: AndNode,
+    operator.or_: OrNode,
+    operator.not_: NotNode
+}
+COMPARISON_OPERATORS = frozenset((operator.eq, operator.ne, operator.gt, operator.lt, operator.ge, operator.le))
+
+def make_operator_node(operatorFn, *operands) -> OperatorNode:
+    """
+    Create the most specific node of an operator: logical operators short-circuit, and unary and binary
+    operators evaluate their operands without building an operands list.
+
+    Args:
+        operatorFn (Callable): The operator (e.g., operator.add).
+        *operands (ExpressionNode): The operand nodes.
+
+    Returns:
+        OperatorNode: The operator's node.
+    """
+    nodeClass = LOGICAL_NODES.get(operatorFn)
+    if nodeClass is not None and len(operands) == (1 if nodeClass is NotNode else 2):
+        return nodeClass(operatorFn, *operands)
+    if len(operands) == 2:
+        if operatorFn in COMPARISON_OPERATORS:
+            return ComparisonNode(operatorFn, *operands)
+        return BinaryOperatorNode(operatorFn, *operands)
+    if len(operands) == 1:
+        return UnaryOperatorNode(operatorFn, *operands)
+    return OperatorNode(operatorFn, *operands)
+
+def set_bound_value(problem: Problem, state: State, variableName: str, accessor: Tuple, index, value):
+    """
+    Set a value through an accessor resolved by Problem.resolve_setter, or by name if there is none.
+
+    Args:
+        problem (Problem): The problem.
+        state (State): The state to modify.
+        variableName (str): The name of the variable or item key.
+        accessor (Tuple): The resolved accessor, or None.
+        index (int): The index or item ID.
+        value (Any): The value to set.
+    """
+    if accessor is None:
+        problem.set_value(state, variableName, index, value)
+    elif accessor[0] == ACCESS_VARIABLE:
+        state.set_variable_value(accessor[1], index, value)
+    else:
+        state.set_item_value(accessor[1], accessor[2], index, value)
+
 class Update(Copies):
     """Abstract base class for updates to be applied to the state."""
+    __slots__ = ()
+
     def apply(self, problem: Problem, state: State):
         """Apply the update to the given problem and state."""
         raise NotImplementedError("Must be implemented by subclasses")
@@ -247,17 +401,20 @@ class Update(Copies):
 
 class ConstUpdate(Update):
     """Update that sets a variable at a given index to a constant value."""
-    def __init__(self, variableName: str, index: int, const: int):
+    __slots__ = ('variableName', 'const', 'index', 'accessor')
+
+    def __init__(self, variableName: str, index: int, const: int, accessor: Tuple = None):
         self.variableName = variableName
         self.const = const
         self.index = index
+        self.accessor = accessor  # Resolved by bind_accessors, set_value is used until then
 
     def __str__(self):
         return "const update: " + str(self.variableName) + " <- " + str(self.const) + " at " + str(self.index) + " "
 
     def apply(self, problem: Problem, state: State):
         """Set the variable at the index to the constant value."""
-        problem.set_value(state, self.variableName, self.index, self.const)
+        set_bound_value(problem, state, self.variableName, self.accessor, self.index, self.const)
 
     def copies(self, params: List):
         """
@@ -267,10 +424,13 @@ class ConstUpdate(Update):
 
 class ExpressionIndexUpdate(Update):
     """Update that sets a variable at a fixed index to the result of an expression."""
-    def __init__(self, variableName: str, index: int, expression: ExpressionNode):
+    __slots__ = ('variableName', 'index', 'expression', 'accessor')
+
+    def __init__(self, variableName: str, index: int, expression: ExpressionNode, accessor: Tuple = None):
         self.variableName = variableName
         self.index = index
         self.expression = expression
+        self.accessor = accessor  # Resolved by bind_accessors, set_value is used until then
 
     def __str__(self):
         return ("exp idx update: " + str(self.variableName) + " <- ("
@@ -279,16 +439,21 @@ class ExpressionIndexUpdate(Update):
     def apply(self, problem: Problem, state: State):
         """Set the variable at the index to the evaluated expression."""
         value = self.expression.evaluate(problem, state)
-        problem.set_value(state, self.variableName, self.index, value)
+        set_bound_value(problem, state, self.variableName, self.accessor, self.index, value)
 
     def copies(self, params: List):
         """
         Copies object's expression.
         """
-        return ExpressionIndexUpdate(self.variableName, self.index, self.expression.copies(params))
+        expression = self.expression.copies(params)
+        if expression is self.expression:
+            return self
+        return ExpressionIndexUpdate(self.variableName, self.index, expression, self.accessor)
 
 class ExpressionRemoveUpdate(Update):
     """Update that removes an entity based on the evaluated expression."""
+    __slots__ = ('entityIndex', 'expression')
+
     def __init__(self, entityIndex: int, expression: ExpressionNode):
         self.entityIndex = entityIndex
         self.expression = expression
@@ -305,10 +470,15 @@ class ExpressionRemoveUpdate(Update):
         """
         Copies object's expression.
         """
-        return ExpressionRemoveUpdate(self.entityIndex, self.expression.copies(params))
+        expression = self.expression.copies(params)
+        if expression is self.expression:
+            return self
+        return ExpressionRemoveUpdate(self.entityIndex, expression)
 
 class ExpressionAddUpdate(Update):
     """Update that adds entities based on evaluated expressions."""
+    __slots__ = ('entityIndex', 'expressions')
+
     def __init__(self, entityIndex: int, *expressions: ExpressionNode):
         self.entityIndex = entityIndex
         self.expressions = expressions
@@ -326,11 +496,15 @@ class ExpressionAddUpdate(Update):
         """
         Copies object's expressions.
         """
-        return ExpressionAddUpdate(self.entityIndex,
-                                   *[expression.copies(params) for expression in self.expressions])
+        expressions = [expression.copies(params) for expression in self.expressions]
+        if all(copied is expression for copied, expression in zip(expressions, self.expressions)):
+            return self
+        return ExpressionAddUpdate(self.entityIndex, *expressions)
 
 class ExpressionReplaceUpdate(Update):
     """Update that replaces an entity with new values based on expressions."""
+    __slots__ = ('entityIndex', 'expressionId', 'expressions')
+
     def __init__(self, entityIndex: int, expressionId: ExpressionNode, *expressions: ExpressionNode):
         self.entityIndex = entityIndex
         self.expressionId = expressionId
@@ -350,15 +524,23 @@ class ExpressionReplaceUpdate(Update):
         """
         Copies object's expressions.
         """
-        return ExpressionReplaceUpdate(self.entityIndex, self.expressionId.copies(params),
-                                       *[expression.copies(params) for expression in self.expressions])
+        expressionId = self.expressionId.copies(params)
+        expressions = [expression.copies(params) for expression in self.expressions]
+        if expressionId is self.expressionId and all(copied is expression for copied, expression
+                                                     in zip(expressions, self.expressions)):
+            return self
+        return ExpressionReplaceUpdate(self.entityIndex, expressionId, *expressions)
 
 class ExpressionUpdate(Update):
     """Update that sets a variable at an index evaluated from an expression to a value evaluated from another expression."""
-    def __init__(self, variableName: str, expressionIndex: ExpressionNode, expressionValue: ExpressionNode):
+    __slots__ = ('variableName', 'expressionIndex', 'expressionValue', 'accessor')
+
+    def __init__(self, variableName: str, expressionIndex: ExpressionNode, expressionValue: ExpressionNode,
+                 accessor: Tuple = None):
         self.variableName = variableName
         self.expressionIndex = expressionIndex
         self.expressionValue = expressionValue
+        self.accessor = accessor  # Resolved by bind_accessors, set_value is used until then
 
     def __str__(self):
         return ("exp update: " + str(self.variableName) + " at (" + str(self.expressionIndex) + ") <- ("
@@ -368,18 +550,22 @@ class ExpressionUpdate(Update):
         """Set the variable at the evaluated index to the evaluated value."""
         index = self.expressionIndex.evaluate(problem, state)
         value = self.expressionValue.evaluate(problem, state)
-        problem.set_value(state, self.variableName, index, value)
+        set_bound_value(problem, state, self.variableName, self.accessor, index, value)
 
     def copies(self, params: List):
         """
         Copies object's expressions.
         """
-        return ExpressionUpdate(self.variableName,
-                                self.expressionIndex.copies(params),
-                                self.expressionValue.copies(params))
+        expressionIndex = self.expressionIndex.copies(params)
+        expressionValue = self.expressionValue.copies(params)
+        if expressionIndex is self.expressionIndex and expressionValue is self.expressionValue:
+            return self
+        return ExpressionUpdate(self.variableName, expressionIndex, expressionValue, self.accessor)
 
 class ParameterUpdate(Update):
     """Update that sets a parameter to the evaluated result of an expression."""
+    __slots__ = ('parameter', 'expression')
+
     def __init__(self, parameter: NewValParameterNode, expression: ExpressionNode):
         self.parameter = parameter
         self.expression = expression
@@ -396,10 +582,16 @@ class ParameterUpdate(Update):
         """
         Copies object's operator & expression.
         """
-        return ParameterUpdate(self.parameter.copies(params), self.expression.copies(params))
+        parameter = self.parameter.copies(params)
+        expression = self.expression.copies(params)
+        if parameter is self.parameter and expression is self.expression:
+            return self
+        return ParameterUpdate(parameter, expression)
 
 class CaseUpdate(Update):
     """Conditional update that applies different updates based on a condition."""
+    __slots__ = ('condition', 'updates', 'elseUpdates')
+
     def __init__(self, condition: ExpressionNode, updates, elseUpdates=None):
         self.condition = condition
         self.updates = updates
@@ -422,26 +614,80 @@ class CaseUpdate(Update):
         """
         Copies object's expressions.
         """
-        return CaseUpdate(self.condition.copies(params),
-                          [expression.copies(params) for expression in self.updates],
-                          [expression.copies(params) for expression in self.elseUpdates])
+        condition = self.condition.copies(params)
+        updates = [expression.copies(params) for expression in self.updates]
+        elseUpdates = [expression.copies(params) for expression in self.elseUpdates]
+        if (condition is self.condition and all(copied is update for copied, update in zip(updates, self.updates))
+                and all(copied is update for copied, update in zip(elseUpdates, self.elseUpdates))):
+            return self
+        return CaseUpdate(condition, updates, elseUpdates)
 
 class AllUpdate(Update):
     """Update that applies a set of updates to all entities of a certain type, optionally filtered by a condition."""
-    def __init__(self, entityIndex: int, parameter: ValueParameterNode, updates, condition: ExpressionNode = None):
+    __slots__ = ('entityIndex', 'parameter', 'updates', 'condition', 'indexProbe', 'snapshot')
+
+    def __init__(self, entityIndex: int, parameter: ValueParameterNode, updates, condition: ExpressionNode = None,
+                 indexProbe: Tuple = None, snapshot: bool = None):
         self.entityIndex = entityIndex
         # Must have the id of len(Action's param) + position of nesting (starting at 0).
         self.parameter = parameter
         self.updates = updates
         self.condition = condition  # Optional condition to filter items
+        # (path, side) of an `Items key parameter = expression` conjunct in the condition, () if none.
+        # Lets apply look candidates up in an item index instead of scanning all items.
+        self.indexProbe = indexProbe if indexProbe is not None else self.find_index_probe()
+        # Whether the updates add or remove entities of the iterated type,
+        # in which case apply iterates over a snapshot of the ids rather than a view.
+        self.snapshot = snapshot if snapshot is not None else any(
+            isinstance(node, (ExpressionAddUpdate, ExpressionRemoveUpdate)) and node.entityIndex == entityIndex
+            for update in updates for node in iter_tree(update))
 
     def __str__(self):
         return ("all " + str(self.entityIndex) + " by (" + str(self.condition)
                 + ") updates (" + str([exp for exp in self.updates]) + ") ")
 
+    def find_index_probe(self) -> Tuple:
+        """
+        Find a condition conjunct usable to look the matching items up in an item index.
+
+        The conjunct's other side must stay the same while the updates are applied,
+        since it's evaluated only once per apply.
+
+        Returns:
+            Tuple: (path, side) as returned by find_index_probe, or () if there is none.
+        """
+        if self.condition is None:
+            return ()
+        probe = find_index_probe(self.condition, self.parameter)
+        if probe is None:
+            return ()
+        _, other = resolve_index_probe(self.condition, probe)
+        writtenNames = set()
+        writtenParameters = []
+        for update in self.updates:
+            for node in iter_tree(update):
+                if isinstance(node, (ConstUpdate, ExpressionIndexUpdate, ExpressionUpdate)):
+                    writtenNames.add(node.variableName)
+                elif isinstance(node, ParameterUpdate):
+                    writtenParameters.append(node.parameter)
+        for node in iter_tree(other):
+            if ((isinstance(node, (ValueNode, ValueIndexNode)) and node.variableName in writtenNames)
+                    or any(node is parameter for parameter in writtenParameters)):
+                return ()
+        return probe
+
     def apply(self, problem: Problem, state: State):
         """Apply updates to all entities, optionally filtering by the condition."""
-        for entity in problem.get_entity_ids(state, self.entityIndex):
+        entities = None
+        if self.indexProbe:
+            keyNode, other = resolve_index_probe(self.condition, self.indexProbe)
+            itemKey = problem.itemKeysPositions.get(keyNode.variableName)
+            if itemKey is not None and itemKey[0] == problem.entityIdToItemId[self.entityIndex]:
+                # Only items matching the conjunct can pass the condition (ids_where returns a new list)
+                entities = problem.ids_where(state, keyNode.variableName, other.evaluate(problem, state))
+        if entities is None:
+            entities = problem.get_entity_ids(state, self.entityIndex, self.snapshot)
+        for entity in entities:
             self.parameter.updateParam(entity)
             if self.condition is None or self.condition.evaluate(problem, state):
                 for update in self.updates:
@@ -454,12 +700,16 @@ class AllUpdate(Update):
         # Using the same parameter for all expressions and updates in block.
         params = params.copy()
         params.append(self.parameter)
-        return AllUpdate(self.entityIndex, self.parameter,
-                         [expression.copies(params) for expression in self.updates],
-                         self.condition.copies(params) if self.condition else None)
+        updates = [expression.copies(params) for expression in self.updates]
+        condition = self.condition.copies(params) if self.condition else None
+        if condition is self.condition and all(copied is update for copied, update in zip(updates, self.updates)):
+            return self
+        return AllUpdate(self.entityIndex, self.parameter, updates, condition, self.indexProbe, self.snapshot)
 
 class RepeatUpdate(Update):
     """Update that repeatedly applies a set of updates while a condition holds."""
+    __slots__ = ('condition', 'updates')
+
     def __init__(self, condition: ExpressionNode, updates):
         self.condition = condition
         self.updates = updates
@@ -477,34 +727,247 @@ class RepeatUpdate(Update):
         """
         Repeat object's expressions.
         """
-        return RepeatUpdate(self.condition.copies(params),
-                            [expression.copies(params) for expression in self.updates])
+        condition = self.condition.copies(params)
+        updates = [expression.copies(params) for expression in self.updates]
+        if condition is self.condition and all(copied is update for copied, update in zip(updates, self.updates)):
+            return self
+        return RepeatUpdate(condition, updates)
 
 class CostExpression(ExpressionNode):
     """Represents a cost expression that may include updates to the state."""
-    def __init__(self, updates: List[Update], costExpression: ExpressionNode):
+    __slots__ = ('updates', 'costExpression', 'compiled')
+
+    def __init__(self, updates: List[Update], costExpression: ExpressionNode, compiled=None):
         self.updates = updates
         self.costExpression = costExpression
+        self.compiled = compiled  # updates and costExpression fused by CARRI.compiler, None to interpret them
 
     def __str__(self):
         return ("Cost Segment:\nUpdate: " + str([update for update in self.updates])
                 + "\nCost: " + str(self.costExpression) + " ")
 
-    def evaluate(self, problem, state):
-        """Apply updates and then evaluate the cost expression."""
+    def evaluate(self, problem, state, slots=()):
+        """
+        Apply updates and then evaluate the cost expression.
+
+        slots are the values of the parameters the compiled cost reads from slots, if it's compiled.
+        """
+        if self.compiled is not None:
+            return self.compiled(problem, state, slots)
         # First, apply updates (e.g., 'NewVar' assignments)
         for update in self.updates:
             update.apply(problem, state)
         # Then evaluate the cost expression
         return self.costExpression.evaluate(problem, state)
 
+    def __getstate__(self):
+        """Pickle without the compiled form - functions generated by compile() can't be pickled."""
+        return self.updates, self.costExpression
+
+    def __setstate__(self, state):
+        self.updates, self.costExpression = state
+        self.compiled = None
+
     def copies(self, params: List):
         """
         Copies object's expressions.
         """
-        return CostExpression([expression.copies(params) for expression in self.updates],
-                              self.costExpression.copies(params))
+        updates = [expression.copies(params) for expression in self.updates]
+        costExpression = self.costExpression.copies(params)
+        if (costExpression is self.costExpression
+                and all(copied is update for copied, update in zip(updates, self.updates))):
+            return self
+        return CostExpression(updates, costExpression, self.compiled)
 
     def applicable(self) -> bool:
         """Applicable if the cost expression is applicable."""
         return self.costExpression.applicable()
+
+
+def iter_children(node: Copies) -> Iterator[Copies]:
+    """
+    Iterate over the expressions and updates directly under a node.
+
+    Args:
+        node (Copies): An expression node or update.
+
+    Yields:
+        Copies: The node's child expressions and updates.
+    """
+    for cls in type(node).__mro__:
+        for name in cls.__dict__.get('__slots__', ()):
+            value = getattr(node, name, None)
+            if isinstance(value, Copies):
+                yield value
+            elif isinstance(value, (list, tuple)):
+                for child in value:
+                    if isinstance(child, Copies):
+                        yield child
+
+
+def iter_tree(node: Copies) -> Iterator[Copies]:
+    """
+    Iterate over a node and everything under it, depth first.
+
+    Args:
+        node (Copies): An expression node or update.
+
+    Yields:
+        Copies: The nodes of the tree.
+    """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(iter_children(node))
+
+
+def find_index_probe(condition: ExpressionNode, parameter: ParameterNode, path: Tuple = ()):
+    """
+    Find an `Items key parameter = expression` conjunct of a condition, where expression doesn't use parameter.
+
+    Items matching the condition are then among the items whose key equals expression's value,
+    which an item index finds without scanning all items.
+
+    Args:
+        condition (ExpressionNode): The condition - an equality, or a conjunction (and) of conditions.
+        parameter (ParameterNode): The parameter iterating over items.
+        path (Tuple): Operand indexes leading to condition (used in recursion).
+
+    Returns:
+        Tuple: (path, side) - operand indexes leading from condition to the equality,
+               and the index of its items key operand. None if there is no such conjunct.
+    """
+    if not isinstance(condition, OperatorNode):
+        return None
+    operands = condition.operands
+    if condition.operator is operator.and_:
+        for operandIndex, operand in enumerate(operands):
+            probe = find_index_probe(operand, parameter, path + (operandIndex,))
+            if probe is not None:
+                return probe
+    elif condition.operator is operator.eq and len(operands) == 2:
+        for side, operand in enumerate(operands):
+            if (isinstance(operand, ValueNode) and operand.expression is parameter
+                    and not any(node is parameter for node in iter_tree(operands[1 - side]))):
+                return path, side
+    return None
+
+
+def resolve_index_probe(condition: ExpressionNode, probe: Tuple) -> Tuple[ValueNode, ExpressionNode]:
+    """
+    Get the nodes of a probe found by find_index_probe.
+
+    Args:
+        condition (ExpressionNode): The condition the probe was found in (or a copy of it).
+        probe (Tuple): (path, side) as returned by find_index_probe.
+
+    Returns:
+        Tuple[ValueNode, ExpressionNode]: The items key node and the expression it equals.
+    """
+    path, side = probe
+    for operandIndex in path:
+        condition = condition.operands[operandIndex]
+    return condition.operands[side], condition.operands[1 - side]
+
+
+def find_adjacency_probe(condition: ExpressionNode, parameter: ParameterNode):
+    """
+    Find a `adjacency (expression) ? parameter` conjunct of a condition, where expression doesn't use parameter.
+
+    Values passing the condition are then among the neighbours of expression's value,
+    which can be enumerated from the adjacency instead of trying every value.
+
+    Args:
+        condition (ExpressionNode): The condition - a membership test, or a conjunction (and) of conditions.
+        parameter (ParameterNode): The parameter being assigned.
+
+    Returns:
+        ValueNode: The conjunct's adjacency node, None if there is no such conjunct.
+    """
+    if not isinstance(condition, OperatorNode):
+        return None
+    operands = condition.operands
+    if condition.operator is operator.and_:
+        for operand in operands:
+            probe = find_adjacency_probe(operand, parameter)
+            if probe is not None:
+                return probe
+    elif condition.operator is operator.contains and len(operands) == 2:
+        container, member = operands
+        if (member is parameter and isinstance(container, ValueNode)
+                and not any(node is parameter for node in iter_tree(container))):
+            return container
+    return None
+
+def constant_value(node: ExpressionNode):
+    """
+    Get the value of an expression that reads no state and no parameters - an operator over constants,
+    or a constant table at a constant index.
+
+    Args:
+        node (ExpressionNode): The expression. Its operands should already be folded (see fold_constants).
+
+    Returns:
+        Tuple[bool, Any]: (True, value) if the expression is constant, (False, None) otherwise.
+    """
+    try:
+        if isinstance(node, OperatorNode) and all(isinstance(operand, ConstNode) for operand in node.operands):
+            return True, node.evaluate(None, None)
+        if isinstance(node, (ValueIndexNode, ValueNode)):
+            accessor = node.accessor
+            if accessor is None or accessor[0] != ACCESS_CONSTANT:
+                return False, None
+            if isinstance(node, ValueIndexNode):
+                return True, accessor[1][node.index]
+            if isinstance(node.expression, ConstNode):
+                return True, accessor[1][node.expression.const]
+    except (ArithmeticError, LookupError, TypeError, ValueError):
+        # Left to fail when evaluated, as it would unfolded
+        pass
+    return False, None
+
+def fold_constants(root: Copies) -> Copies:
+    """
+    Replace the constant subtrees under root by ConstNodes, bottom up (see constant_value).
+
+    Only scalar values (FOLDED_TYPES) are folded - constant tables and sets stay behind their nodes,
+    which index and adjacency probes look for. Should be called after bind_accessors, which marks
+    constant reads.
+
+    Args:
+        root (Copies): An expression node or update. Its children are replaced in place.
+
+    Returns:
+        Copies: root, or the ConstNode replacing it.
+    """
+    for cls in type(root).__mro__:
+        for name in cls.__dict__.get('__slots__', ()):
+            value = getattr(root, name, None)
+            if isinstance(value, Copies):
+                setattr(root, name, fold_constants(value))
+            elif isinstance(value, (list, tuple)) and any(isinstance(child, Copies) for child in value):
+                setattr(root, name, type(value)(fold_constants(child) if isinstance(child, Copies) else child
+                                                for child in value))
+    if isinstance(root, ExpressionNode) and not isinstance(root, ConstNode):
+        constant, value = constant_value(root)
+        if constant and type(value) in FOLDED_TYPES:
+            return ConstNode(value)
+    return root
+
+def bind_accessors(root: Copies, problem: Problem):
+    """
+    Resolve the names read and written by the nodes under root into direct accessors,
+    so evaluating and applying them skips looking the names up in the problem.
+
+    Nodes whose names can't be resolved keep using Problem.get_value and Problem.set_value.
+
+    Args:
+        root (Copies): An expression node or update.
+        problem (Problem): The problem resolving the names.
+    """
+    for node in iter_tree(root):
+        if isinstance(node, (ValueNode, ValueIndexNode)):
+            node.accessor = problem.resolve_accessor(node.variableName)
+        elif isinstance(node, (ConstUpdate, ExpressionIndexUpdate, ExpressionUpdate)):
+            node.accessor = problem.resolve_setter(node.variableName)
@@ -0,0 +1,206 @@
+from typing import Callable, List, Optional, Set, Tuple
+import operator
+from CARRI.problem import Problem, ACCESS_CONSTANT, ACCESS_VARIABLE, ACCESS_ITEM
+from CARRI.expression import (ExpressionNode, ConstNode, ParameterNode, NewValParameterNode, ValueParameterNode,
+                              ValueIndexNode, ValueNode, OperatorNode, BinaryOperatorNode, AndNode, OrNode,
+                              ParameterUpdate, AllUpdate, CostExpression)
+from CARRI.compiler import ExpressionCompiler
+
+# Types of the initial values of recognised sums. States update the sums incrementally (see State._index_item),
+# which is exact for integers only - float sums would drift from the looped cost as rounding errors accumulate.
+INITIAL_TYPES = (int,)
+
+
+class ItemTermCompiler(ExpressionCompiler):
+    """
+    Compiles the expressions of an item term into a function of the item's values.
+
+    Reads of the item's keys at the parameter become `values[keyIndex]`, constant tables are bound
+    into the namespace as usual.
+    """
+    def __init__(self, parameter: ValueParameterNode):
+        """
+        Initialize an ItemTermCompiler.
+
+        Args:
+            parameter (ValueParameterNode): The parameter the item's keys are read at.
+        """
+        super().__init__(None)
+        self.parameter = parameter
+
+    def compile_term(self, parts: List[Tuple[int, ExpressionNode]]) -> Callable:
+        """
+        Compile a term's expressions into one function.
+
+        Args:
+            parts (List[Tuple[int, ExpressionNode]]): (sign, expression) pairs, see ItemTerm.
+
+        Returns:
+            Callable: function(values) returning the sum of the signed expressions' values.
+        """
+        terms = "".join(" {} {}".format('+' if sign > 0 else '-', self.emit(node)) for sign, node in parts)
+        source = "def compiled(values):\n    return 0{}\n".format(terms)
+        exec(compile(source, "<CARRI item term>", "exec"), self.namespace)
+        function = self.namespace.pop("compiled")
+        function.source = source
+        return function
+
+    def emit(self, node: ExpressionNode) -> str:
+        """Generate the source of an expression, reading the item's keys from values."""
+        if (isinstance(node, ValueNode) and node.accessor[0] == ACCESS_ITEM
+                and node.expression is self.parameter):
+            return "values[{}]".format(node.accessor[2])
+        return super().emit(node)
+
+
+class ItemTerm:
+    """
+    The term of an item aggregate: a sum of expressions reading one item's keys (at the `all` parameter
+    iterating the items) and constants, evaluated on the item's values (see find_item_aggregate).
+    """
+    __slots__ = ('parameter', 'parts', 'keys', 'function')
+
+    def __init__(self, parameter: ValueParameterNode, parts: List[Tuple[int, ExpressionNode]], keys: frozenset):
+        """
+        Initialize an ItemTerm.
+
+        Args:
+            parameter (ValueParameterNode): The parameter the item's keys are read at.
+            parts (List[Tuple[int, ExpressionNode]]): (sign, expression) pairs, added (1) or subtracted (-1).
+            keys (frozenset): The indexes of the item keys the expressions read.
+        """
+        self.parameter = parameter
+        self.parts = parts
+        self.keys = keys
+        self.function = ItemTermCompiler(parameter).compile_term(parts)
+
+    def __str__(self):
+        return " ".join(("+ " if sign > 0 else "- ") + str(node) for sign, node in self.parts)
+
+    def __call__(self, values):
+        """Evaluate the term on an item's values."""
+        return self.function(values)
+
+    def __getstate__(self):
+        """Pickle without the compiled function - functions generated by compile() can't be pickled."""
+        return self.parameter, self.parts, self.keys
+
+    def __setstate__(self, state):
+        self.parameter, self.parts, self.keys = state
+        self.function = ItemTermCompiler(self.parameter).compile_term(self.parts)
+
+
+class ItemAggregateNode(ExpressionNode):
+    """
+    A cost summing a term over all items of an entity (see find_item_aggregate), read from the state's
+    running sum of the term (see State.add_item_aggregate) instead of looping over the items.
+    States that don't keep the sum evaluate the original cost.
+    """
+    __slots__ = ('itemsIndex', 'initial', 'term', 'cost')
+
+    def __init__(self, itemsIndex: int, initial, term: ItemTerm, cost: CostExpression):
+        self.itemsIndex = itemsIndex
+        self.initial = initial
+        self.term = term
+        self.cost = cost
+
+    def __str__(self):
+        return "aggregate of " + str(self.itemsIndex) + ": " + str(self.initial) + " " + str(self.term) + " "
+
+    def evaluate(self, problem, state, slots=()):
+        """Return the initial value plus the state's sum of the term, or evaluate the original cost."""
+        total = state.get_item_aggregate(self.itemsIndex, self.term)
+        if total is None:
+            return self.cost.evaluate(problem, state, slots)
+        return self.initial + total
+
+    def copies(self, params: List):
+        """
+        Aggregates don't read the given parameters.
+        """
+        return self
+
+    def applicable(self) -> bool:
+        """Always applicable."""
+        return True
+
+
+def item_term_keys(node: ExpressionNode, parameter: ParameterNode, itemsIndex: int, keys: Set) -> bool:
+    """
+    Check if an expression reads only the keys of the item at parameter and constants, and has integer values -
+    no float constants or divisions (see INITIAL_TYPES) - adding the indexes of the keys it reads to keys.
+
+    Args:
+        node (ExpressionNode): The expression. Accessors should be bound (see bind_accessors).
+        parameter (ParameterNode): The parameter the item's keys are read at.
+        itemsIndex (int): The index of the item's entity in the items tuple.
+        keys (Set): Collects the read keys' indexes.
+
+    Returns:
+        bool: True if the expression can be evaluated on the item's values (see ItemTerm).
+    """
+    if isinstance(node, ConstNode):
+        return isinstance(node.const, int)
+    if isinstance(node, ValueIndexNode):
+        return node.accessor is not None and node.accessor[0] == ACCESS_CONSTANT
+    if isinstance(node, ValueNode):
+        accessor = node.accessor
+        if accessor is None or accessor[0] == ACCESS_VARIABLE:
+            return False
+        if accessor[0] == ACCESS_ITEM:
+            if accessor[1] != itemsIndex or node.expression is not parameter:
+                return False
+            keys.add(accessor[2])
+            return True
+        return item_term_keys(node.expression, parameter, itemsIndex, keys)
+    if (isinstance(node, OperatorNode) and not isinstance(node, (AndNode, OrNode))
+            and node.operator is not operator.truediv):
+        return all(item_term_keys(operand, parameter, itemsIndex, keys) for operand in node.operands)
+    return False
+
+
+def find_item_aggregate(cost: ExpressionNode, problem: Problem) -> Optional[Tuple[int, object, ItemTerm]]:
+    """
+    Recognise a cost summing a term over all items of an entity:
+
+        NewVal c : initial; all x in Items (without condition): c : c + term(x) ... ; cost c
+
+    where initial is an integer, and the terms are added or subtracted, read only x's keys and constants,
+    and have integer values (see item_term_keys).
+
+    Args:
+        cost (ExpressionNode): A step's cost. Accessors should be bound and constants folded.
+        problem (Problem): The problem.
+
+    Returns:
+        Tuple[int, Any, ItemTerm] | None: (items index, initial, term) if the cost is such a sum, None otherwise.
+    """
+    if not isinstance(cost, CostExpression) or len(cost.updates) != 2:
+        return None
+    first, loop = cost.updates
+    accumulator = cost.costExpression
+    if not (isinstance(accumulator, NewValParameterNode) and isinstance(first, ParameterUpdate)
+            and first.parameter is accumulator and isinstance(first.expression, ConstNode)
+            and type(first.expression.const) in INITIAL_TYPES
+            and isinstance(loop, AllUpdate) and loop.condition is None
+            and problem.ranges[loop.entityIndex] is None):
+        return None
+    itemsIndex = problem.entityIdToItemId[loop.entityIndex]
+    parts = []
+    keys = set()
+    for update in loop.updates:
+        if not (isinstance(update, ParameterUpdate) and update.parameter is accumulator
+                and isinstance(update.expression, BinaryOperatorNode)):
+            return None
+        operatorFn = update.expression.operator
+        left, right = update.expression.operands
+        if left is accumulator and operatorFn in (operator.add, operator.sub):
+            sign, term = (1 if operatorFn is operator.add else -1), right
+        elif right is accumulator and operatorFn is operator.add:
+            sign, term = 1, left
+        else:
+            return None
+        if not item_term_keys(term, loop.parameter, itemsIndex, keys):
+            return None
+        parts.append((sign, term))
+    return itemsIndex, first.expression.const, ItemTerm(loop.parameter, parts, frozenset(keys))
@@ -1,6 +1,18 @@
 from typing import Iterable, List, Dict
 from copy import copy
-from CARRI.state import State
+from CARRI.state import State, StateDelta
+from CARRI.columnarState import ColumnarState, INT_TYPECODE
+from CARRI.adjacency import Adjacency
+from CARRI.distanceOracle import DistanceOracle
+from CARRI.problemSchema import ProblemSchema
+
+# Number of state values from which "auto" picks the columnar State backend.
+COLUMNAR_AUTO_THRESHOLD = 4096
+
+# Accessor kinds, see Problem.resolve_accessor.
+ACCESS_CONSTANT = 0  # (ACCESS_CONSTANT, constant tuple)
+ACCESS_VARIABLE = 1  # (ACCESS_VARIABLE, varIndex)
+ACCESS_ITEM = 2  # (ACCESS_ITEM, entityIndex, keyIndex)
 
 class Problem:
     """
@@ -14,6 +26,7 @@ class Problem:
 
         Supports two types of initialization:
         - By passing `initialValues`, `variablesInfo`, and `entities` dictionaries.
+          Optionally `stateBackend`: "object", "columnar" or "auto" (default).
         - By directly passing the attributes as keyword arguments.
 
         Args:
@@ -21,7 +34,8 @@ class Problem:
         """
         if "initialValues" in kwargs and "variablesInfo" in kwargs and "entities" in kwargs:
             # Initialize using the first method with data dictionaries
-            self._init_with_data_dicts(kwargs["initialValues"], kwargs["variablesInfo"], kwargs["entities"])
+            self._init_with_data_dicts(kwargs["initialValues"], kwargs["variablesInfo"], kwargs["entities"],
+                                       kwargs.get("stateBackend", "auto"))
         else:
             # Initialize using the second method with directly provided attributes
             self._init_with_attributes(**kwargs)
@@ -45,7 +59,8 @@ class Problem:
         elif baseInfo == "entity":
             self.entityVarNames.append(varName)
 
-    def _init_with_data_dicts(self, initialValues: Dict, variablesInfo: Dict, entities: Dict):
+    def _init_with_data_dicts(self, initialValues: Dict, variablesInfo: Dict, entities: Dict,
+                              stateBackend: str = "auto"):
         """
         Initialize the Problem instance with `initialValues`, `variablesInfo`, and `entities` dictionaries.
 
@@ -56,13 +71,16 @@ class Problem:
             initialValues (Dict): Initial values of variables and entities.
             variablesInfo (Dict): Information about variables (types, constants, items).
             entities (Dict): Information about entities defined in the problem.
+            stateBackend (str): State representation - "object", "columnar" or "auto".
         """
         self.variablesInfo = variablesInfo
         self.entities = entities
         self.constants = {}  # Constant name: Constant tuple
         variableTups = []  # Becomes: tuple of variables (state.variables)
+        variableTypecodes = []  # Array typecode per variable, None if not integer
         self.varPositions = {}  # Variable name: index in tuple
         itemTups = []  # Becomes: tuple of items (state.items)
+        itemTypecodes = []  # Array typecode per items key, None if not integer
         self.itemPositions = {}  # Items name: index in tuple
         # Items & key name: (items index, key index)
         self.itemKeysPositions = {}
@@ -71,7 +89,6 @@ class Problem:
         # Set of mutable items
         self.setAbleEntities = set()
         # {items index: Max id for items}
-        self.itemsMaxId = []
         self.itemsKeysNames = {}
         # Items indexes that qualify for Package
         self.packagesIndexes = []
@@ -136,8 +153,9 @@ class Problem:
                         self.typeBaseItemsKeysPosition[itemIndex] = keyIndex
                 if typeInfo == List:
                     self.setAbleEntities.add(itemIndex)
+                itemTypecodes.append(tuple(INT_TYPECODE if keyType == int else None
+                                           for keyType in info["key types"]))
 
-                self.itemsMaxId.append(max(variable, key=variable.get))
                 itemTups.append(variable)
                 # There is only one "items" per entity
                 self.entityIdToItemId[entities[entityInfo][0]] = itemIndex
@@ -153,6 +171,7 @@ class Problem:
             varIndex = len(variableTups)
             self.varPositions[name] = varIndex
             variableTups.append(variable)
+            variableTypecodes.append(INT_TYPECODE if typeInfo == int else None)
             self.addVarNames(name, baseInfo, typeInfo)
             if entities[entityInfo][0] not in self.entityIdToItemId:
                 self.entityIdToItemId[entities[entityInfo][0]] = None
@@ -161,7 +180,12 @@ class Problem:
         variableTups = tuple(variableTups)
         itemTups = tuple(itemTups)
         self.ranges = tuple([ranges[i] for i in range(len(ranges))])
-        self.initState = State(variableTups, itemTups)
+        self.variableTypecodes = tuple(variableTypecodes)
+        self.itemTypecodes = tuple(itemTypecodes)
+        self.itemIndexKeys = ()
+        self.itemAggregateTerms = ()
+        self.stateBackend = self.choose_state_backend(stateBackend, variableTups, itemTups)
+        self.initState = self.new_state(variableTups, itemTups)
 
         # Convert lists to tuples for immutability
         self.packagesIndexes = tuple(self.packagesIndexes)
@@ -172,6 +196,9 @@ class Problem:
         self.typeVarNames = tuple(self.typeVarNames)
         self.entityVarNames = tuple(self.entityVarNames)
         self.entities = entities
+        self.adjacencies = self.build_adjacencies()
+        self.distanceOracle = None
+        self.schema = ProblemSchema(self)
 
     def _init_with_attributes(self, **kwargs):
         """
@@ -191,7 +218,6 @@ class Problem:
         self.itemKeysPositions = kwargs.get("itemKeysPositions", {})
         self.setAbleItemKeysPosition = kwargs.get("setAbleItemKeysPosition", {})
         self.setAbleEntities = kwargs.get("setAbleEntities", set())
-        self.itemsMaxId = kwargs.get("itemsMaxId", [])
         self.itemsKeysNames = kwargs.get("itemsKeysNames", {})
         self.packagesIndexes = kwargs.get("packagesIndexes", tuple())
         self.requestsIndexes = kwargs.get("requestsIndexes", tuple())
@@ -210,11 +236,119 @@ class Problem:
         self.entityBaseItemsKeysPosition = kwargs.get("entityBaseItemsKeysPosition", {})
         self.locationBaseItemsKeysPosition = kwargs.get("locationBaseItemsKeysPosition", {})
         self.typeBaseItemsKeysPosition = kwargs.get("typeBaseItemsKeysPosition", {})
+        self.adjacencies = kwargs.get("adjacencies", {})
+        self.distanceOracle = kwargs.get("distanceOracle")
+
+        self.stateBackend = kwargs.get("stateBackend", "object")
+        self.variableTypecodes = kwargs.get("variableTypecodes", tuple())
+        self.itemTypecodes = kwargs.get("itemTypecodes", tuple())
+        self.itemIndexKeys = kwargs.get("itemIndexKeys", tuple())
+        self.itemAggregateTerms = kwargs.get("itemAggregateTerms", tuple())
 
         # Initialize initState if provided, otherwise default to empty State
         varbleTups = kwargs.get("variableTups", tuple())
         itemTups = kwargs.get("itemTups", tuple())
         self.initState = kwargs.get("initState", State(varbleTups, itemTups))
+        self.schema = kwargs.get("schema") or ProblemSchema(self)
+
+    @staticmethod
+    def choose_state_backend(stateBackend: str, variables, items) -> str:
+        """
+        Choose the State representation.
+
+        "auto" picks the columnar backend once the state holds at least
+        COLUMNAR_AUTO_THRESHOLD values, where its compact columns pay off.
+
+        Args:
+            stateBackend (str): "object", "columnar" or "auto".
+            variables (Iterable[List]): Initial variable values.
+            items (Iterable[Dict]): Initial items.
+
+        Returns:
+            str: "object" or "columnar".
+        """
+        if stateBackend != "auto":
+            if stateBackend not in ("object", "columnar"):
+                raise ValueError(f"Unknown state backend: {stateBackend}")
+            return stateBackend
+        size = (sum(len(variable) for variable in variables)
+                + sum(len(item) for entity in items for item in entity.values()))
+        return "columnar" if size >= COLUMNAR_AUTO_THRESHOLD else "object"
+
+    def new_state(self, variables: Iterable[List], items: Iterable[Dict], nextIds: Iterable[int] = None) -> State:
+        """
+        Create a State with the problem's State backend.
+
+        Args:
+            variables (Iterable[List]): Variable values.
+            items (Iterable[Dict]): Items dictionaries of id -> values.
+            nextIds (Iterable[int], optional): Per items, the id to allocate next.
+
+        Returns:
+            State: The new state.
+        """
+        if self.stateBackend == "columnar":
+            state = ColumnarState.from_values(variables, items, self.variableTypecodes, self.itemTypecodes,
+                                              nextIds)
+        else:
+            state = State(variables, items, nextIds=nextIds)
+        for itemKeyName in self.itemIndexKeys:
+            state.add_item_index(*self.itemKeysPositions[itemKeyName])
+        for itemsIndex, term in self.itemAggregateTerms:
+            state.add_item_aggregate(itemsIndex, term)
+        return state
+
+    def add_item_index(self, itemKeyName: str):
+        """
+        Index an item key in the initial state and in every state created by new_state.
+
+        States copied from an indexed state keep the index up to date.
+
+        Args:
+            itemKeyName (str): The item key's name, e.g. "Packages location".
+        """
+        if itemKeyName in self.itemIndexKeys:
+            return
+        self.itemIndexKeys = self.itemIndexKeys + (itemKeyName,)
+        self.initState.add_item_index(*self.itemKeysPositions[itemKeyName])
+
+    def add_item_aggregate(self, itemsIndex: int, term):
+        """
+        Keep the sum of a term over all items of an entity in the initial state and in every state
+        created by new_state (see State.add_item_aggregate).
+
+        States copied from an aggregated state keep the sum up to date.
+
+        Args:
+            itemsIndex (int): The index of the entity in the items tuple.
+            term (Callable): Item values -> a number, e.g. an ItemTerm.
+        """
+        if any(aggregated is term for _, aggregated in self.itemAggregateTerms):
+            return
+        self.itemAggregateTerms = self.itemAggregateTerms + ((itemsIndex, term),)
+        self.initState.add_item_aggregate(itemsIndex, term)
+
+    def ids_where(self, state: State, itemKeyName: str, value) -> List[int]:
+        """
+        Get the ids of the items whose key has a given value.
+
+        Uses the state's index of the key if it has one, otherwise scans the items.
+
+        Args:
+            state (State): The current state.
+            itemKeyName (str): The item key's name, e.g. "Packages location".
+            value (Any): The value to look for.
+
+        Returns:
+            List[int]: The matching item ids, ascending when looked up in an index.
+        """
+        entityIndex, keyIndex = self.itemKeysPositions[itemKeyName]
+        index = state.get_item_index(entityIndex, keyIndex)
+        if index is not None:
+            ids = index.get(value)
+            return sorted(ids) if ids else []
+        return [itemId for itemId in state.get_items_ids(entityIndex)
+                if state.get_item_value(entityIndex, keyIndex, itemId) == value]
 
     def __copy__(self):
         """
@@ -228,6 +362,55 @@ class Problem:
         # Create a new Problem instance using the copied attributes as kwargs
         return Problem(**attributes)
 
+    def build_adjacencies(self) -> Dict[str, Adjacency]:
+        """
+        Build the CSR form (see Adjacency) of each constant flagged (adjacency).
+
+        Returns:
+            Dict[str, Adjacency]: Constant name -> its adjacency, for constants of neighbour sets or dictionaries.
+        """
+        adjacencies = {}
+        for name in self.adjacencyVarNames:
+            if name not in self.constants:
+                continue
+            try:
+                adjacencies[name] = Adjacency(self.constants[name])
+            except (TypeError, ValueError):
+                # Not a tuple of sets or dictionaries of node indexes
+                continue
+        return adjacencies
+
+    def get_adjacency_entity(self, name: str):
+        """
+        Get the entity an adjacency constant is defined over - the entity of its nodes.
+
+        Args:
+            name (str): The adjacency constant's name.
+
+        Returns:
+            int | None: The entity's index, None if unknown.
+        """
+        info = self.variablesInfo.get(name)
+        if info is None or info["entity"] not in self.entities:
+            return None
+        return self.entities[info["entity"]][0]
+
+    def get_distance_oracle(self):
+        """
+        Get the shared distance oracle over the locations' adjacency - the first adjacency constant,
+        restricted per vehicle type by the location types (ProblemSchema.locationTypes). Created on first use.
+
+        Returns:
+            DistanceOracle | None: The oracle, None if the problem has no adjacency constant.
+        """
+        if self.distanceOracle is None and self.adjacencies:
+            adjacency = next(iter(self.adjacencies.values()))
+            locType = self.schema.locationTypes
+            if locType is not None and len(locType) != len(adjacency):
+                locType = None
+            self.distanceOracle = DistanceOracle(adjacency, locType)
+        return self.distanceOracle
+
     def get_adjacency_names(self):
         """
         Get the names of adjacency variables.
@@ -272,20 +455,25 @@ class Problem:
                     vehiclelist[entityId] = False
         return countVehicles, countNotVehicles, vehiclelist
 
-    def get_entity_ids(self, state: State, entityIndex: int) -> Iterable[int]:
+    def get_entity_ids(self, state: State, entityIndex: int, snapshot: bool = False) -> Iterable[int]:
         """
         Get the IDs of entities of a specific type.
 
+        Items ids are returned as a live view of the state's ids (see State.get_items_ids),
+        unless a snapshot is asked for - needed when items may be added or removed while iterating.
+
         Args:
             state (State): The current state.
             entityIndex (int): The index of the entity type.
+            snapshot (bool): Return a tuple copy of items ids rather than a view.
 
         Returns:
             Iterable[int]: An iterable of entity IDs.
         """
         if self.ranges[entityIndex] is not None:
             return self.ranges[entityIndex]
-        return state.get_items_ids(self.entityIdToItemId[entityIndex])
+        ids = state.get_items_ids(self.entityIdToItemId[entityIndex])
+        return tuple(ids) if snapshot else ids
 
     def get_len_packages(self, state: State):
         """
@@ -319,7 +507,7 @@ class Problem:
 
     def add_entity(self, state: State, entityIndex: int, *params):
         """
-        Add a new entity to the state.
+        Add a new entity to the state, with an id allocated by the state.
 
         Args:
             state (State): The current state.
@@ -327,12 +515,11 @@ class Problem:
             *params: Parameters required to add the entity.
         """
         entity = self.entityIdToItemId[entityIndex]
-        maxId = self.itemsMaxId[entity] + 1
-        self.itemsMaxId[entity] = maxId
+        itemId = state.allocate_id(entity)
         if entity in self.setAbleEntities:
-            state.add_entity_list(entity, maxId, *params)
+            state.add_entity_list(entity, itemId, *params)
         else:
-            state.add_entity(entity, maxId, *params)
+            state.add_entity(entity, itemId, *params)
 
     def remove_entity(self, state: State, entityIndex: int, entityId):
         """
@@ -380,6 +567,42 @@ class Problem:
                 itemIndex, keyIndex = self.itemKeysPositions[variableName]
                 return state.get_item_value(itemIndex, keyIndex, index)
 
+    def resolve_accessor(self, variableName: str):
+        """
+        Resolve a name into a direct accessor for reading it, resolving it like get_value.
+
+        Args:
+            variableName (str): The name of the constant, variable or item key.
+
+        Returns:
+            Tuple | None: (ACCESS_CONSTANT, values), (ACCESS_VARIABLE, varIndex) or
+                          (ACCESS_ITEM, entityIndex, keyIndex), None if the name is unknown.
+        """
+        if variableName in self.constants:
+            return ACCESS_CONSTANT, self.constants[variableName]
+        if variableName in self.varPositions:
+            return ACCESS_VARIABLE, self.varPositions[variableName]
+        if variableName in self.itemKeysPositions:
+            return (ACCESS_ITEM,) + tuple(self.itemKeysPositions[variableName])
+        return None
+
+    def resolve_setter(self, variableName: str):
+        """
+        Resolve a name into a direct accessor for writing it, resolving it like set_value.
+
+        Args:
+            variableName (str): The name of the variable or settable item key.
+
+        Returns:
+            Tuple | None: (ACCESS_VARIABLE, varIndex) or (ACCESS_ITEM, entityIndex, keyIndex),
+                          None if the name can't be set.
+        """
+        if variableName in self.varPositions:
+            return ACCESS_VARIABLE, self.varPositions[variableName]
+        if variableName in self.setAbleItemKeysPosition:
+            return (ACCESS_ITEM,) + tuple(self.setAbleItemKeysPosition[variableName])
+        return None
+
     def set_value(self, state: State, variableName, index, value):
         """
         Set the value of a variable or item by name.
@@ -410,19 +633,14 @@ class Problem:
 
     def get_onEntity_indexes(self):
         """
-        Get the indexes for 'onEntity' item keys.
-
-        May be changed or implemented in another method.
+        Get the indexes for 'onEntity' item keys - the first items key with entity base (see ProblemSchema.onEntitySlots).
 
         Returns:
             Tuple[int, int]: A tuple containing the item index and key index for 'onEntity'.
         """
-        on_key = None
-        for key in self.itemKeysPositions.keys():
-            if 'onEntity' in key:
-                on_key = key
-                break
-        return self.itemKeysPositions[on_key]
+        if not self.schema.onEntitySlots:
+            raise KeyError("No items key with entity base")
+        return self.schema.onEntitySlots[0]
 
     def get_consts(self):
         """
@@ -436,9 +654,7 @@ class Problem:
 
     def get_locations(self, state):
         """
-        Get the location variables from the state.
-
-        May be changed or implemented in another method.
+        Get the location variables from the state - the variables with location base (see ProblemSchema.locationVarIndexes).
 
         Args:
             state (State): The current state.
@@ -446,29 +662,16 @@ class Problem:
         Returns:
             List[Any]: A list of location variables.
         """
-        locs = []
-        for name, index in self.varPositions.items():
-            if 'loc' in name.lower():
-                locs.append(state.variables[index])
-        return locs
+        return [state.variable_values(index) for index in self.schema.locationVarIndexes]
 
     def get_vehicle_types(self):
         """
-        Get the types of vehicles in the problem.
-
-        May be changed or implemented in another method.
+        Get the types of vehicles in the problem (see ProblemSchema.vehicleTypes).
 
         Returns:
             List[int]: A list of vehicle type indices.
         """
-        types = []
-        try:
-            for _, vals in self.entities.items():
-                if vals[1] == 'Vehicle':
-                    types.extend([vals[0]] * len(self.ranges[vals[0]]))
-            return types
-        except:
-            return [[0] * len(self.ranges[0])]
+        return list(self.schema.vehicleTypes)
 
     def copyState(self, state):
         """
@@ -494,10 +697,38 @@ class Problem:
         """
         txt = "State:\n"
         for name, index in self.varPositions.items():
-            txt += " {}: {}\n".format(name, state.variables[index])
+            txt += " {}: {}\n".format(name, state.variable_values(index))
         for name, index in self.itemPositions.items():
             txt += " {}:".format(name)
             for i, keyName in enumerate(self.itemsKeysNames[name]):
                 txt += " {}. {}".format(i, keyName)
-            txt += "\n  {}\n".format(state.items[index])
+            txt += "\n  {}\n".format(state.items_dict(index))
+        return txt
+
+    def representDelta(self, delta: StateDelta):
+        """
+        Generate a string representation of a state delta.
+
+        Args:
+            delta (StateDelta): The changes between two states.
+
+        Returns:
+            str: A string representing the changes.
+        """
+        if not len(delta):
+            return "No changes\n"
+        varNames = {index: name for name, index in self.varPositions.items()}
+        itemNames = {index: name for name, index in self.itemPositions.items()}
+        txt = "Changes:\n"
+        for varIndex, index, value in delta.variables:
+            txt += " {}[{}] = {}\n".format(varNames[varIndex], index, value)
+        for entityIndex, keyIndex, itemId, value in delta.itemValues:
+            name = itemNames[entityIndex]
+            txt += " {}[{}] {} = {}\n".format(name, itemId, self.itemsKeysNames[name][keyIndex], value)
+        for entityIndex, itemId in delta.removedItems:
+            txt += " {}[{}] removed\n".format(itemNames[entityIndex], itemId)
+        for entityIndex, itemId, values in delta.addedItems:
+            txt += " {}[{}] added: {}\n".format(itemNames[entityIndex], itemId, values)
+        for entityIndex, nextId in delta.nextIds:
+            txt += " {} next id = {}\n".format(itemNames[entityIndex], nextId)
         return txt
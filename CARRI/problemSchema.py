@@ -0,0 +1,83 @@
+from typing import Dict, Tuple
+
+# Name of the constant giving each location's type: vehicles of type t may only
+# enter locations whose type is 0 or t.
+LOC_TYPE_NAME = "locType"
+# Item key bases recorded per items in the key slots views.
+KEY_BASES = ("type", "location", "entity")
+
+
+class ProblemSchema:
+    """
+    Precomputed, read-only views of a problem's structure, built once from the variables' base information
+    (the `(location)`, `(type)`, `(entity)` annotations) and the entities' bases.
+
+    Slots are accessors in the form of Problem.resolve_accessor: (ACCESS_VARIABLE, varIndex)
+    or (ACCESS_ITEM, entityIndex, keyIndex).
+    """
+    def __init__(self, problem):
+        """
+        Build the views of a problem.
+
+        Args:
+            problem (Problem): The problem. Its positions, variable names and initial state must be set.
+        """
+        # Imported here, CARRI.problem imports this module
+        from CARRI.problem import ACCESS_VARIABLE, ACCESS_ITEM
+        entityOf = {name: problem.entities[info["entity"]][0] for name, info in problem.variablesInfo.items()
+                    if info["entity"] in problem.entities}
+        itemsEntity = {itemsIndex: entityIndex for entityIndex, itemsIndex in problem.entityIdToItemId.items()
+                       if itemsIndex is not None}
+
+        # Location variables, in variables order
+        locationVarNames = set(problem.locationVarNames)
+        self.locationVarIndexes = tuple(varIndex for name, varIndex in problem.varPositions.items()
+                                        if name in locationVarNames)
+
+        # Vehicle entity index -> slot of its location
+        vehicleLocationSlots = {}
+        for name, varIndex in problem.varPositions.items():
+            if name in locationVarNames and entityOf.get(name) in problem.vehicleEntities:
+                vehicleLocationSlots.setdefault(entityOf[name], (ACCESS_VARIABLE, varIndex))
+        for itemsIndex, keyIndex in problem.locationBaseItemsKeysPosition.items():
+            entityIndex = itemsEntity.get(itemsIndex)
+            if entityIndex in problem.vehicleEntities:
+                vehicleLocationSlots.setdefault(entityIndex, (ACCESS_ITEM, itemsIndex, keyIndex))
+        self.vehicleLocationSlots: Dict[int, Tuple] = vehicleLocationSlots
+
+        # Entity index per vehicle, vehicle types in order; item vehicles by their initial ids
+        vehicleTypes = []
+        for entityIndex in problem.vehicleEntities:
+            entityRange = problem.ranges[entityIndex]
+            if entityRange is None:
+                entityRange = problem.get_entity_ids(problem.initState, entityIndex)
+            vehicleTypes.extend([entityIndex] * len(entityRange))
+        self.vehicleTypes = tuple(vehicleTypes)
+
+        # Items index -> {key base: key index}, for packages and requests
+        self.packageKeySlots = {itemsIndex: self.key_slots(problem, itemsIndex)
+                                for itemsIndex in problem.packagesIndexes}
+        self.requestKeySlots = {itemsIndex: self.key_slots(problem, itemsIndex)
+                                for itemsIndex in problem.requestsIndexes}
+        # (items index, key index) of the items keys holding the entity an item is on
+        self.onEntitySlots = tuple(sorted(problem.entityBaseItemsKeysPosition.items()))
+
+        # Location types: per location its type (None if the problem has none), and per non-zero type its locations
+        locationTypes = problem.constants.get(LOC_TYPE_NAME)
+        self.locationTypes = None if locationTypes is None else tuple(locationTypes)
+        locationsByType = {}
+        for location, locationType in enumerate(self.locationTypes or ()):
+            if locationType != 0:
+                locationsByType.setdefault(locationType, []).append(location)
+        self.locationsByType = {locationType: tuple(locations) for locationType, locations in locationsByType.items()}
+
+    @staticmethod
+    def key_slots(problem, itemsIndex: int) -> Dict[str, int]:
+        """Return {key base: key index} of an items' type, location and entity keys."""
+        slots = {}
+        for base, positions in zip(KEY_BASES, (problem.typeBaseItemsKeysPosition,
+                                               problem.locationBaseItemsKeysPosition,
+                                               problem.entityBaseItemsKeysPosition)):
+            if itemsIndex in positions:
+                slots[base] = positions[itemsIndex]
+        return slots
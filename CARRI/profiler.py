@@ -0,0 +1,310 @@
+from typing import Callable, Dict, List, Optional
+from time import perf_counter
+import re
+import numpy as np
+from CARRI.expression import ExpressionNode, Update, CostExpression
+from CARRI.action import Step, EnvStep
+
+# Longest expression shown in a report line - longer ones are cut.
+REPORT_LABEL_WIDTH = 100
+# A parameter in an expression's text, with the value it was last assigned (see ParameterNode.__str__).
+PARAMETER_TEXT = re.compile(r"par: .*? at (\d+) ")
+
+
+class ProfileEntry:
+    """
+    Counters of one profiled precondition, check, effect or cost: its calls and their total time,
+    and for checks the number of checked values and how many passed.
+    """
+    __slots__ = ('owner', 'label', 'isCheck', 'calls', 'time', 'checks', 'passed')
+
+    def __init__(self, owner: str, label: str, isCheck: bool):
+        """
+        Initialize a ProfileEntry.
+
+        Args:
+            owner (str): The action generator or step the entry belongs to.
+            label (str): What the entry profiles.
+            isCheck (bool): Whether the entry profiles a check, counting its passes.
+        """
+        self.owner = owner
+        self.label = label
+        self.isCheck = isCheck
+        self.calls = 0
+        self.time = 0.0
+        self.checks = 0
+        self.passed = 0
+
+    def record(self, elapsed: float, result):
+        """Count a call which took elapsed seconds and returned result."""
+        self.calls += 1
+        self.time += elapsed
+        if self.isCheck:
+            if isinstance(result, np.ndarray):
+                # A batch check: one value per state or candidate
+                self.checks += result.size
+                self.passed += int(np.count_nonzero(result))
+            else:
+                self.checks += 1
+                self.passed += bool(result)
+
+    def wrap(self, function: Callable) -> Callable:
+        """Return a function calling function and recording its calls in the entry."""
+        def profiled(*args):
+            start = perf_counter()
+            result = None
+            try:
+                result = function(*args)
+                return result
+            finally:
+                self.record(perf_counter() - start, result)
+        profiled.wrapped = function
+        return profiled
+
+
+class ProfiledNode(ExpressionNode):
+    """An expression recording its evaluations in a ProfileEntry. Its copies share the entry."""
+    __slots__ = ('node', 'entry')
+
+    def __init__(self, node: ExpressionNode, entry: ProfileEntry):
+        self.node = node
+        self.entry = entry
+
+    def __str__(self):
+        return str(self.node)
+
+    def evaluate(self, problem, state, *slots):
+        start = perf_counter()
+        result = None
+        try:
+            result = self.node.evaluate(problem, state, *slots)
+            return result
+        finally:
+            self.entry.record(perf_counter() - start, result)
+
+    def copies(self, params: List):
+        return ProfiledNode(self.node.copies(params), self.entry)
+
+    def applicable(self) -> bool:
+        return self.node.applicable()
+
+
+class ProfiledUpdate(Update):
+    """An update recording its applications in a ProfileEntry. Its copies share the entry."""
+    __slots__ = ('update', 'entry')
+
+    def __init__(self, update: Update, entry: ProfileEntry):
+        self.update = update
+        self.entry = entry
+
+    def __str__(self):
+        return str(self.update)
+
+    def apply(self, problem, state):
+        start = perf_counter()
+        try:
+            self.update.apply(problem, state)
+        finally:
+            self.entry.record(perf_counter() - start, None)
+
+    def copies(self, params: List):
+        return ProfiledUpdate(self.update.copies(params), self.entry)
+
+
+class ExpressionProfiler:
+    """
+    Opt-in profiler of a simulator's expressions: counts the calls, time and pass rates of every
+    action generator's precondition lines and checks, and the time of the generators' and steps' effects
+    and costs.
+
+    Usage:
+        with ExpressionProfiler(simulator) as profiler:
+            ...  # produce, validate and apply actions, step the environment
+        print(profiler.report())
+
+    While enabled, the simulator's expressions are replaced by profiled ones: interpreted preconditions,
+    effects and costs are wrapped by ProfiledNode / ProfiledUpdate (see ExpressionNode.evaluate, Update.apply),
+    and their compiled forms (see Simulator.compile_expressions) by timing functions. Disabling restores
+    the originals, so profiling costs nothing when it's off. Actions generated while enabled keep recording.
+
+    Compiled and interpreted expressions are recorded alike, but compiled actions check their preconditions
+    all at once (validate, reValidate) while interpreted ones evaluate them line by line.
+    Batch checks (see CARRI.batchEvaluation) count one check per state or candidate, and include
+    the time of their fallbacks.
+    """
+    def __init__(self, simulator):
+        """
+        Initialize an ExpressionProfiler. It should be enabled after the simulator's expressions are compiled.
+
+        Args:
+            simulator (Simulator): The simulator whose expressions are profiled.
+        """
+        self.simulator = simulator
+        # (owner, kind, index) -> the entry
+        self.entries = {}
+        # (container, key, original) per replaced attribute or list item, restored by disable
+        self.replaced = []
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.disable()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replaced)
+
+    def entry(self, owner: str, kind: str, index: int = None, node=None, isCheck: bool = False) -> ProfileEntry:
+        """
+        Return the entry of what an owner profiles, created on first use - so counters keep accumulating
+        across enables.
+
+        Args:
+            owner (str): The action generator or step.
+            kind (str): What is profiled, e.g. "precondition", "cost".
+            index (int, optional): The position of the profiled line, for preconditions and effects.
+            node (ExpressionNode | Update, optional): The profiled line, shown in the report.
+            isCheck (bool): Whether the entry profiles a check, counting its passes.
+
+        Returns:
+            ProfileEntry: The entry.
+        """
+        key = (owner, kind, index)
+        entry = self.entries.get(key)
+        if entry is None:
+            label = kind if index is None else "{} {}".format(kind, index)
+            if node is not None:
+                label += ": " + format_line(node)
+            entry = self.entries[key] = ProfileEntry(owner, label, isCheck)
+        return entry
+
+    def replace(self, container, key, value):
+        """Replace container's attribute (str key) or list item (int key) by value, until disable."""
+        if isinstance(key, str):
+            self.replaced.append((container, key, getattr(container, key)))
+            setattr(container, key, value)
+        else:
+            self.replaced.append((container, key, container[key]))
+            container[key] = value
+
+    def wrap_function(self, container, key, entry: ProfileEntry):
+        """Wrap the compiled function at container's attribute or item key, if there is one."""
+        function = getattr(container, key) if isinstance(key, str) else container[key]
+        if function is not None:
+            self.replace(container, key, entry.wrap(function))
+
+    def enable(self):
+        """Install the profiled expressions. Counters keep accumulating across enables."""
+        if self.enabled:
+            return
+        simulator = self.simulator
+        for actionGenerator in simulator.action_generators:
+            self.profile_action_generator(actionGenerator)
+        for envStep in simulator.envSteps:
+            self.profile_step(envStep, envStep.name)
+        self.profile_step(simulator.iterStep, "iteration step")
+
+    def disable(self):
+        """Restore the simulator's original expressions."""
+        for container, key, original in reversed(self.replaced):
+            if isinstance(key, str):
+                setattr(container, key, original)
+            else:
+                container[key] = original
+        self.replaced = []
+
+    def profile_action_generator(self, actionGenerator):
+        """Profile an action generator's precondition lines, checks, effects and cost."""
+        name = actionGenerator.name
+        for listName, compiledName, kind in (('preconditions', 'compiledPreconditions', "precondition"),
+                                             ('conflictingPreconditions', 'compiledConflictingPreconditions',
+                                              "conflicting precondition")):
+            nodes = getattr(actionGenerator, listName)
+            entries = [self.entry(name, kind, index, node, True) for index, node in enumerate(nodes)]
+            for index, (node, entry) in enumerate(zip(nodes, entries)):
+                self.replace(nodes, index, ProfiledNode(node, entry))
+            compiled = getattr(actionGenerator, compiledName)
+            if compiled is not None:
+                self.replace(actionGenerator, compiledName,
+                             tuple(entry.wrap(function) for function, entry in zip(compiled, entries)))
+        for attribute, label in (('compiledValidate', "validate"), ('compiledReValidate', "reValidate"),
+                                 ('compiledBatchValidate', "batch validate"),
+                                 ('compiledBatchReValidate', "batch reValidate")):
+            self.wrap_function(actionGenerator, attribute, self.entry(name, label, isCheck=True))
+        if any(domainFilter is not None for domainFilter in actionGenerator.compiledDomainFilters):
+            self.replace(actionGenerator, 'compiledDomainFilters', [
+                None if domainFilter is None
+                else self.entry(name, "batch filter of parameter", paramIndex, isCheck=True).wrap(domainFilter)
+                for paramIndex, domainFilter in enumerate(actionGenerator.compiledDomainFilters)])
+        self.profile_effects(actionGenerator, 'compiledEffects', name)
+        self.profile_cost(actionGenerator, name)
+
+    def profile_step(self, step: Step, name: str):
+        """Profile a step's effects, and an environment step's cost."""
+        self.profile_effects(step, 'compiled', name)
+        if isinstance(step, EnvStep):
+            self.profile_cost(step, name)
+
+    def profile_effects(self, owner, compiledName: str, name: str):
+        """Profile an action generator's or step's effects, one by one and fused."""
+        effects = owner.effects
+        for index, effect in enumerate(effects):
+            self.replace(effects, index, ProfiledUpdate(effect, self.entry(name, "effect", index, effect)))
+        self.wrap_function(owner, compiledName, self.entry(name, "effects (compiled)"))
+
+    def profile_cost(self, owner, name: str):
+        """Profile an action generator's or environment step's cost."""
+        cost = owner.cost
+        entry = self.entry(name, "cost")
+        if isinstance(cost, CostExpression) and cost.compiled is not None:
+            # Actions pass their parameters' values to compiled costs, so the cost itself stays in place
+            self.wrap_function(cost, 'compiled', entry)
+        else:
+            self.replace(owner, 'cost', ProfiledNode(cost, entry))
+
+    def owner_times(self) -> Dict[str, float]:
+        """Return the total time recorded per action generator or step that was called."""
+        times = {}
+        for entry in self.entries.values():
+            if entry.calls:
+                times[entry.owner] = times.get(entry.owner, 0.0) + entry.time
+        return times
+
+    def report(self, limit: Optional[int] = None) -> str:
+        """
+        Format the recorded counters, sorted by cumulative time: totals per action generator and step,
+        then the entries that were called.
+
+        Args:
+            limit (int, optional): The number of entries listed, all if None.
+
+        Returns:
+            str: The report.
+        """
+        total = sum(entry.time for entry in self.entries.values()) or 1.0
+        lines = ["{:<32}{:>12}{:>8}".format("owner", "time ms", "%")]
+        for owner, time in sorted(self.owner_times().items(), key=lambda item: item[1], reverse=True):
+            lines.append("{:<32}{:>12.3f}{:>7.1f}%".format(owner, time * 1e3, time / total * 100))
+        lines.append("")
+        lines.append("{:>12}{:>8}{:>10}{:>10}{:>8}  {:<24}{}".format(
+            "time ms", "%", "calls", "us/call", "pass", "owner", "expression"))
+        entries = sorted((entry for entry in self.entries.values() if entry.calls),
+                         key=lambda entry: entry.time, reverse=True)
+        for entry in entries[:limit]:
+            passRate = "{:.0%}".format(entry.passed / entry.checks) if entry.checks else ""
+            lines.append("{:>12.3f}{:>7.1f}%{:>10}{:>10.2f}{:>8}  {:<24}{}".format(
+                entry.time * 1e3, entry.time / total * 100, entry.calls, entry.time / entry.calls * 1e6,
+                passRate, entry.owner, shorten(entry.label)))
+        return "\n".join(lines)
+
+
+def shorten(label: str) -> str:
+    """Cut a label to REPORT_LABEL_WIDTH characters."""
+    return label if len(label) <= REPORT_LABEL_WIDTH else label[:REPORT_LABEL_WIDTH - 3] + "..."
+
+
+def format_line(node) -> str:
+    """Return the text of a precondition or effect, with its parameters by position (paramN) instead of values."""
+    return PARAMETER_TEXT.sub(lambda match: "param{} ".format(match.group(1)), str(node)).strip()
@@ -2,6 +2,12 @@ from copy import copy
 from CARRI.action import ActionProducer, ActionStringRepresentor, ActionGenerator, Action, EnvStep, Step
 from CARRI.problem import Problem
 from CARRI.state import State
+from CARRI.expression import (AllUpdate, CostExpression, iter_tree, resolve_index_probe, bind_accessors,
+                              fold_constants)
+from CARRI.itemAggregates import ItemAggregateNode, find_item_aggregate
+from CARRI.compiler import compile_updates
+from CARRI.batchEvaluation import StateBatch, MIN_BATCH_STATES
+from CARRI.accessSets import AccessSets, GroundAccessSets, analyze_step
 from collections import deque
 from typing import List, Tuple, Dict
 
@@ -13,7 +19,8 @@ class Simulator:
     """
 
     def __init__(self, problem: Problem, actionGenerators: List[ActionGenerator],
-                 envSteps: List[EnvStep], iterStep: Step, entities: Dict[str, Tuple]):
+                 envSteps: List[EnvStep], iterStep: Step, entities: Dict[str, Tuple],
+                 autoItemIndexes: bool = True, compileExpressions: bool = True, itemAggregates: bool = True):
         """
         Initialize the Simulator with the given problem definition, action generators,
         environment steps, iteration step, and entities.
@@ -24,6 +31,12 @@ class Simulator:
             envSteps (List[EnvStep]): List of environment steps to apply at each iteration.
             iterStep (Step): The iteration step to apply during simulation.
             entities (Dict[str, Tuple]): Dictionary of entity names to their corresponding tuples.
+            autoItemIndexes (bool): Index the item keys that preconditions and `all` conditions
+                                    compare to a value (see add_probed_item_indexes).
+            compileExpressions (bool): Compile preconditions, effects and costs into Python functions
+                                       (see compile_expressions).
+            itemAggregates (bool): Keep the sums environment step costs take over all items in the states
+                                   (see add_item_aggregates).
         """
         self.problem = problem
         self.ActionProducer = ActionProducer(actionGenerators)
@@ -32,6 +45,18 @@ class Simulator:
         self.envSteps = envSteps
         self.iterStep = iterStep
         self.entities = entities
+        self.compileExpressions = compileExpressions
+        self.bind_accessors()
+        self.fold_constants()
+        if itemAggregates:
+            self.add_item_aggregates()
+        self.analyze_accesses()
+        if compileExpressions:
+            self.compile_expressions()
+        for actionGenerator in actionGenerators:
+            actionGenerator.find_adjacency_probes(problem)
+        if autoItemIndexes:
+            self.add_probed_item_indexes()
         self.current_state = problem.copyState(problem.initState)
         self.vehicle_keys = self.problem.vehicleEntities
 
@@ -57,6 +82,160 @@ class Simulator:
         new_simulator.vehicle_keys = copy(self.vehicle_keys)  # Shallow copy if it's a list or similar
         return new_simulator
 
+    def __getstate__(self):
+        """Pickle without the access sets - functions generated by compile() (their grounders) can't be pickled."""
+        state = self.__dict__.copy()
+        for name in ('generatorAccessSets', 'envStepAccessSets', 'iterStepAccessSets'):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        """
+        Unpickle, then rebuild what pickling dropped: the access sets, and the compiled expressions
+        if the simulator compiled them. A simulator sent to a spawned process (see Manager.execute_iteration)
+        thus plans with its compiled expressions there too.
+        """
+        self.__dict__.update(state)
+        self.analyze_accesses()
+        if self.compileExpressions:
+            self.compile_expressions()
+
+    def expression_roots(self) -> List:
+        """
+        Get the roots of all expression trees of the domain.
+
+        Returns:
+            List: The preconditions, effects and costs of the action generators and environment steps,
+                  and the iteration step's effects.
+        """
+        roots = list(self.iterStep.effects)
+        for actionGenerator in self.action_generators:
+            roots.extend(actionGenerator.preconditions)
+            roots.extend(actionGenerator.conflictingPreconditions)
+            roots.extend(actionGenerator.effects)
+            roots.append(actionGenerator.cost)
+        for envStep in self.envSteps:
+            roots.extend(envStep.effects)
+            roots.append(envStep.cost)
+        return roots
+
+    def bind_accessors(self):
+        """Resolve the variable names of all expressions into direct accessors (see expression.bind_accessors)."""
+        for root in self.expression_roots():
+            bind_accessors(root, self.problem)
+
+    def fold_constants(self):
+        """
+        Replace the constant subtrees of all expressions by their values (see expression.fold_constants).
+        Should be called after bind_accessors, and before compile_expressions and finding probes.
+        """
+        for actionGenerator in self.action_generators:
+            actionGenerator.preconditions = [fold_constants(root) for root in actionGenerator.preconditions]
+            actionGenerator.conflictingPreconditions = [fold_constants(root)
+                                                        for root in actionGenerator.conflictingPreconditions]
+        for step in self.action_generators + self.envSteps + [self.iterStep]:
+            step.effects = [fold_constants(root) for root in step.effects]
+        for step in self.action_generators + self.envSteps:
+            step.cost = fold_constants(step.cost)
+
+    def add_item_aggregates(self):
+        """
+        Turn the environment step costs that sum a term over all items of an entity (see find_item_aggregate)
+        into ItemAggregateNodes, reading the sum the states keep up to date as items change
+        (see Problem.add_item_aggregate) instead of looping over the items.
+        """
+        problem = self.problem
+        for envStep in self.envSteps:
+            aggregate = find_item_aggregate(envStep.cost, problem)
+            if aggregate is not None:
+                itemsIndex, initial, term = aggregate
+                problem.add_item_aggregate(itemsIndex, term)
+                envStep.cost = ItemAggregateNode(itemsIndex, initial, term, envStep.cost)
+
+    def analyze_accesses(self):
+        """
+        Collect the symbolic read and write sets of the action generators, environment steps and iteration step
+        (see CARRI.accessSets), into generatorAccessSets (by generator name), envStepAccessSets (in order)
+        and iterStepAccessSets.
+        """
+        problem = self.problem
+        self.generatorAccessSets: Dict[str, AccessSets] = {
+            actionGenerator.name: analyze_step(problem, actionGenerator.preconditions
+                                               + actionGenerator.conflictingPreconditions,
+                                               actionGenerator.effects, actionGenerator.cost,
+                                               actionGenerator.paramExpressions)
+            for actionGenerator in self.action_generators}
+        self.envStepAccessSets: List[AccessSets] = [analyze_step(problem, updates=envStep.effects, cost=envStep.cost)
+                                                    for envStep in self.envSteps]
+        self.iterStepAccessSets: AccessSets = analyze_step(problem, updates=self.iterStep.effects)
+
+    def action_access_sets(self, action: Action, state: State = None) -> GroundAccessSets:
+        """
+        Get the concrete read and write sets of a grounded action.
+
+        Args:
+            action (Action): The action.
+            state (State, optional): The state the action is checked in. Indexes reading the state
+                                     are grounded in it, and may be any index without it.
+
+        Returns:
+            GroundAccessSets: The action's accesses.
+        """
+        return self.generatorAccessSets[action.name].ground(self.problem, [param.value for param in action.params],
+                                                            state)
+
+    def interferes(self, action1: Action, action2: Action, state: State = None) -> bool:
+        """
+        Check if two grounded actions may interfere - one writes a variable, items key or entity
+        the other reads or writes - without applying them.
+
+        Args:
+            action1 (Action): The first action.
+            action2 (Action): The second action.
+            state (State, optional): The state the actions are checked in, see action_access_sets.
+
+        Returns:
+            bool: True if they may interfere, False if applying them in either order gives the same.
+        """
+        return self.action_access_sets(action1, state).interferes(self.action_access_sets(action2, state))
+
+    def compile_expressions(self):
+        """
+        Compile the action generators' preconditions, and fuse the effects and costs of the action generators,
+        environment steps and iteration step into Python functions (see CARRI.compiler).
+        Evaluating and applying them then skips walking the expression and update trees.
+        """
+        for actionGenerator in self.action_generators:
+            actionGenerator.compile_expressions(self.problem)
+        for envStep in self.envSteps:
+            envStep.compiled = compile_updates(envStep.effects, self.problem)
+            # Aggregated costs fall back to their original cost in states without the aggregate.
+            cost = envStep.cost.cost if isinstance(envStep.cost, ItemAggregateNode) else envStep.cost
+            if isinstance(cost, CostExpression):
+                cost.compiled = compile_updates(cost.updates, self.problem, result=cost.costExpression)
+        self.iterStep.compiled = compile_updates(self.iterStep.effects, self.problem)
+
+    def add_probed_item_indexes(self):
+        """
+        Index the item keys whose values are looked up while producing actions and applying steps.
+
+        These are the keys of `Items key ?param = expression` preconditions, found per parameter
+        by ActionGenerator.find_index_probes, and of such conjuncts in `all` update conditions.
+        """
+        problem = self.problem
+        for actionGenerator in self.action_generators:
+            actionGenerator.find_index_probes(problem)
+            for indexProbe in actionGenerator.indexProbes:
+                if indexProbe is not None:
+                    problem.add_item_index(indexProbe[0])
+        for root in self.expression_roots():
+            for node in iter_tree(root):
+                if isinstance(node, AllUpdate) and node.indexProbe:
+                    keyNode, _ = resolve_index_probe(node.condition, node.indexProbe)
+                    itemKey = problem.itemKeysPositions.get(keyNode.variableName)
+                    if itemKey is not None and itemKey[0] == problem.entityIdToItemId[node.entityIndex]:
+                        problem.add_item_index(keyNode.variableName)
+
     def get_state(self):
         """
         Get a copy of the current state.
@@ -263,10 +442,12 @@ class Simulator:
 
         for vehicleId, vehicleIdActions in validSeperates.items():
             nextQueue = deque()
-            while currentQueue:
-                currentState, transition, cost = currentQueue.pop()
-                for action in vehicleIdActions:
-                    if action.reValidate(self.problem, currentState):
+            # Expanded in pop order, with the actions checked in all the queue's states at once
+            entries = list(reversed(currentQueue))
+            valid = self.revalidate_batch(vehicleIdActions, [entry[0] for entry in entries])
+            for stateIndex, (currentState, transition, cost) in enumerate(entries):
+                for actionIndex, action in enumerate(vehicleIdActions):
+                    if valid[actionIndex][stateIndex]:
                         nextState = currentState.__copy__()
                         action.apply(self.problem, nextState)
                         nextTransition = transition + [action]
@@ -276,6 +457,24 @@ class Simulator:
             currentQueue = nextQueue
         return currentQueue
 
+    def revalidate_batch(self, actions: List[Action], states: List[State]) -> List:
+        """
+        Re-validate actions in states - per action in one vectorised pass over the states
+        (see CARRI.batchEvaluation), if there are at least MIN_BATCH_STATES states.
+
+        Args:
+            actions (List[Action]): The actions.
+            states (List[State]): The states.
+
+        Returns:
+            List: Per action, a sequence of whether it's valid, per state.
+        """
+        problem = self.problem
+        if len(states) < MIN_BATCH_STATES:
+            return [[action.reValidate(problem, state) for state in states] for action in actions]
+        batch = StateBatch(states)
+        return [action.reValidate_batch(problem, batch) for action in actions]
+
     def applyEnvSteps(self, queue):
         """
         Apply environment steps to each state in the queue.
@@ -323,10 +522,11 @@ class Simulator:
             for vehicleId, vehicleIdActions in vehicleTypeActions.items():
 
                 nextQueue = deque()
-                while currentQueue:
-                    currentState, transition, cost = currentQueue.pop()
-                    for action in vehicleIdActions:
-                        if action.reValidate(self.problem, currentState):
+                entries = list(reversed(currentQueue))
+                valid = self.revalidate_batch(vehicleIdActions, [entry[0] for entry in entries])
+                for stateIndex, (currentState, transition, cost) in enumerate(entries):
+                    for actionIndex, action in enumerate(vehicleIdActions):
+                        if valid[actionIndex][stateIndex]:
                             nextState = currentState.__copy__()
                             action.apply(self.problem, nextState)
                             nextTransition = transition + [action]
@@ -349,6 +549,61 @@ class Simulator:
 
         return currentQueue
 
+    def generate_successors_in_place(self, state: State):
+        """
+        Generate all successors of a state in place, without copying it.
+
+        Each successor is produced by applying a transition (and the environment steps)
+        directly to the given state, which is rolled back before the next one is produced.
+        Successors come in the same order as in generate_successors.
+
+        Args:
+            state (State): The current state, mutated while iterating and restored afterwards.
+
+        Yields:
+            Tuple[List[Action], float]: The transition and its cost, while state holds the successor.
+        """
+        vehicleActions = [vehicleIdActions
+                          for vehicleTypeActions in self.generate_all_valid_seperate_actions(state).values()
+                          for vehicleIdActions in vehicleTypeActions.values()]
+        yield from self._successors_in_place(state, vehicleActions, 0, [], 0)
+
+    def _successors_in_place(self, state: State, vehicleActions: List[List[Action]], depth: int,
+                             transition: List[Action], cost: float):
+        """
+        Recursively assign actions to vehicles from depth on, yielding complete transitions.
+
+        Args:
+            state (State): The state holding the partial transition's effects.
+            vehicleActions (List[List[Action]]): Valid actions per vehicle.
+            depth (int): The index of the vehicle to assign.
+            transition (List[Action]): The actions assigned so far.
+            cost (float): The cost of the actions assigned so far.
+
+        Yields:
+            Tuple[List[Action], float]: The transition and its cost, while state holds the successor.
+        """
+        mark = state.mark()
+        try:
+            if depth == len(vehicleActions):
+                for envStep in self.envSteps:
+                    envStep.apply(self.problem, state)
+                    cost += envStep.get_cost(self.problem, state)
+                yield transition, cost
+                return
+            actions = vehicleActions[depth]
+            # generate_successors pops its queue from the end, reversing every other vehicle.
+            if (len(vehicleActions) - 1 - depth) % 2:
+                actions = reversed(actions)
+            for action in actions:
+                if action.reValidate(self.problem, state):
+                    action.apply(self.problem, state)
+                    yield from self._successors_in_place(state, vehicleActions, depth + 1, transition + [action],
+                                                         cost + action.get_cost(self.problem, state))
+                    state.rollback(mark)
+        finally:
+            state.rollback(mark)
+
     def advance_state(self, action: Action):
         """
         Advance the state by applying the given action, updating the current state.
@@ -1,21 +1,203 @@
 from typing import Tuple, List, Dict, Iterable
-from copy import copy
+from itertools import islice
+
+# Fingerprints are kept as unsigned 64-bit integers.
+FINGERPRINT_MASK = 0xFFFFFFFFFFFFFFFF
+
+# Undo log record kinds, see State.mark and State.rollback.
+UNDO_VARIABLE = 0  # (UNDO_VARIABLE, varIndex, index, oldValue)
+UNDO_ITEM_VALUE = 1  # (UNDO_ITEM_VALUE, entityIndex, keyIndex, itemId, oldValue)
+UNDO_ADD = 2  # (UNDO_ADD, entityIndex, itemId, overwrittenValues or None)
+UNDO_REMOVE = 3  # (UNDO_REMOVE, entityIndex, itemId, removedValues, position)
+UNDO_REPLACE = 4  # (UNDO_REPLACE, entityIndex, itemId, oldValues)
+UNDO_NEXT_ID = 5  # (UNDO_NEXT_ID, entityIndex, oldNextId)
+
+# Item indexes of states without any, shared (never modified - replaced when indexes are added).
+NO_ITEM_INDEXES = {}
+# Item aggregates map of states without item aggregates, shared and never modified.
+NO_ITEM_AGGREGATES = {}
+
+
+def item_fingerprint(entityIndex, itemId, values) -> int:
+    """
+    Compute the fingerprint contribution of a single item.
+
+    The contribution XORs a presence term with one term per key, so that a single key
+    can be updated without rehashing the whole item.
+
+    Args:
+        entityIndex (int): The index of the entity in the items tuple.
+        itemId (int): The ID of the item.
+        values (Iterable): The item's values.
+
+    Returns:
+        int: The item's fingerprint contribution.
+    """
+    entityKey = -1 - entityIndex
+    fingerprint = hash((entityKey, itemId))
+    for keyIndex, value in enumerate(values):
+        fingerprint ^= hash((entityKey, itemId, keyIndex, value))
+    return fingerprint & FINGERPRINT_MASK
+
+
+def compute_fingerprint(variables, items) -> int:
+    """
+    Compute the fingerprint of state contents from scratch.
+
+    Every variable slot and every item key contributes an independent term (Zobrist style),
+    which lets State mutators update the fingerprint in O(1).
+
+    Args:
+        variables (Iterable[List]): Variable lists.
+        items (Iterable[Dict]): Items dictionaries.
+
+    Returns:
+        int: The 64-bit fingerprint.
+    """
+    fingerprint = 0
+    for varIndex, variable in enumerate(variables):
+        for index, value in enumerate(variable):
+            fingerprint ^= hash((varIndex, index, value))
+    for entityIndex, entity in enumerate(items):
+        for itemId, values in entity.items():
+            fingerprint ^= item_fingerprint(entityIndex, itemId, values)
+    return fingerprint & FINGERPRINT_MASK
+
+
+def initial_next_ids(items) -> Tuple[int]:
+    """
+    Compute the ids to allocate next for items: one past the largest existing id (0 for no items).
+
+    Args:
+        items (Iterable[Dict | Iterable[int]]): Per items, its ids (or a dictionary keyed by them).
+
+    Returns:
+        Tuple[int]: The next id per items.
+    """
+    return tuple(max(entity, default=-1) + 1 for entity in items)
+
+
+def key_position(entries: Dict, key) -> int:
+    """Return the position of a key in a dictionary's iteration order. The last key is found without a scan."""
+    if key == next(reversed(entries)):
+        return len(entries) - 1
+    for position, currentKey in enumerate(entries):
+        if currentKey == key:
+            return position
+
+
+def move_last_key(entries: Dict, position: int):
+    """Move a dictionary's last key to a position of its iteration order, reinserting only the keys after it."""
+    for key in list(islice(entries, position, len(entries) - 1)):
+        entries[key] = entries.pop(key)
+
+
+def _same_values(values, otherValues) -> bool:
+    """Check if two sequences hold equal values of the same types."""
+    return (len(values) == len(otherValues)
+            and all(value == otherValue and type(value) is type(otherValue)
+                    for value, otherValue in zip(values, otherValues)))
+
+
+class StateDelta:
+    """
+    The changes turning one State into another, as produced by State.diff and applied by State.patch.
+
+    Attributes:
+        variables (List[Tuple]): (varIndex, index, value) per changed variable value.
+        itemValues (List[Tuple]): (entityIndex, keyIndex, itemId, value) per changed item value.
+        addedItems (List[Tuple]): (entityIndex, itemId, values) per added item.
+        removedItems (List[Tuple]): (entityIndex, itemId) per removed item.
+        nextIds (List[Tuple]): (entityIndex, nextId) per changed next id to allocate.
+    """
+    __slots__ = ('variables', 'itemValues', 'addedItems', 'removedItems', 'nextIds')
+
+    def __init__(self, variables: List[Tuple] = None, itemValues: List[Tuple] = None,
+                 addedItems: List[Tuple] = None, removedItems: List[Tuple] = None, nextIds: List[Tuple] = None):
+        self.variables = variables if variables is not None else []
+        self.itemValues = itemValues if itemValues is not None else []
+        self.addedItems = addedItems if addedItems is not None else []
+        self.removedItems = removedItems if removedItems is not None else []
+        self.nextIds = nextIds if nextIds is not None else []
+
+    def __len__(self):
+        """Return the number of changes."""
+        return (len(self.variables) + len(self.itemValues) + len(self.addedItems) + len(self.removedItems)
+                + len(self.nextIds))
+
+    def __repr__(self):
+        return ("StateDelta(variables={}, itemValues={}, addedItems={}, removedItems={}, nextIds={})"
+                .format(self.variables, self.itemValues, self.addedItems, self.removedItems, self.nextIds))
+
 
 class State:
     """
     Represents the state of the problem, including variables and items.
-    Variables are stored as tuples of lists, and items are stored as tuples of dictionaries.
+    Variables are stored as lists of values, and items are stored as dictionaries of id -> values.
+
+    States are copy-on-write: a copy shares every variable list and items dictionary with
+    its source, and a collection is only duplicated on the first write through one of the
+    mutators (set_variable_value, set_item_value, add_entity, remove_entity, ...).
+
+    The mutators also keep a 64-bit fingerprint of the full contents up to date,
+    which is used for hashing and as a fast inequality check.
+
+    Mutations can be undone: after mark() every mutation appends an undo record to the
+    state's undo log, and rollback(mark) restores the state as it was at the mark.
+    This lets depth-first search expand children in place instead of copying states.
+
+    Item keys can be indexed (add_item_index): the state then keeps a value -> item ids
+    index for the key up to date, so items with a given value are found without a scan.
+    Indexes are copy-on-write as well, per index and per value.
+
+    Sums of a term over all items of an entity can be kept as well (add_item_aggregate): the state then
+    updates the running total as items are added, removed, replaced or have their values set.
+
+    Each state allocates the ids of its new items itself (allocate_id), so ids taken by
+    one branch of a search don't affect its siblings or other processes. The next ids
+    aren't part of the state's contents - they're ignored by equality and the fingerprint.
     """
-    def __init__(self, variables: Tuple[List], items: Tuple[Dict]):
+    __slots__ = ('variables', 'items', 'fingerprint', '_ownedVariables', '_ownedItems', 'undoLog',
+                 'itemIndexes', 'indexes', '_ownedIndexes', 'itemAggregates', 'aggregates', 'nextIds',
+                 '__weakref__')
+
+    def __init__(self, variables: Tuple[List], items: Tuple[Dict], fingerprint: int = None,
+                 nextIds: Tuple[int] = None):
         """
         Initialize the State with variables and items.
 
+        The given collections are treated as shared - they are copied before the first write.
+
         Args:
             variables (Tuple[List]): A tuple containing lists of variable values.
             items (Tuple[Dict]): A tuple containing dictionaries of items/entities.
-        """
-        self.variables = variables
-        self.items = items
+            fingerprint (int, optional): The contents' fingerprint, computed if not given.
+            nextIds (Tuple[int], optional): Per items, the id to allocate next.
+                                            Defaults to one past the largest id.
+        """
+        self.variables = list(variables)
+        self.items = list(items)
+        if fingerprint is None:
+            fingerprint = compute_fingerprint(self.variables, self.items)
+        self.fingerprint = fingerprint
+        # Immutable, so copies share it until one of them allocates an id.
+        self.nextIds = tuple(nextIds) if nextIds is not None else initial_next_ids(self.items)
+        # Per variable: whether this state holds the only reference to the list.
+        self._ownedVariables = [False] * len(self.variables)
+        # Per items: None if the dict is shared, else the set of ids whose values this state owns.
+        self._ownedItems = [None] * len(self.items)
+        # List of undo records while mutations are logged, else None.
+        self.undoLog = None
+        # Per indexed or aggregated items: keyIndex -> position in indexes. Shared by copies.
+        self.itemIndexes = NO_ITEM_INDEXES
+        # Per index: value -> set of item ids.
+        self.indexes = []
+        # Per index: None if the index is shared, else the set of values whose ids set this state owns.
+        self._ownedIndexes = []
+        # Per aggregated items: tuple of (position in aggregates, term). Shared by copies.
+        self.itemAggregates = NO_ITEM_AGGREGATES
+        # Per aggregate: the sum of its term over the items.
+        self.aggregates = []
 
     def __repr__(self):
         """Return the string representation of the State."""
@@ -29,41 +211,337 @@ class State:
         """
         Check if two State instances are equal.
 
+        Fingerprints are compared first, contents only when the fingerprints match.
+
         Args:
             other (State): Another State instance to compare with.
 
         Returns:
             bool: True if variables and items are equal, False otherwise.
         """
+        if self is other:
+            return True
+        if not isinstance(other, State):
+            return NotImplemented
+        if self.fingerprint != other.fingerprint:
+            return False
         return self.variables == other.variables and self.items == other.items
 
     def __hash__(self):
         """
-        Compute a hash value for the State.
+        Return the hash value of the State - its incrementally maintained fingerprint.
 
         Returns:
             int: The hash value of the State.
         """
-        return hash((
-            tuple(tuple(var) for var in self.variables),
-            tuple(frozenset(item) for item in self.items)
-        ))
+        return self.fingerprint
 
-    # It works.
     def __copy__(self):
         """
-        Create a shallow copy of the State.
+        Create a copy-on-write copy of the State.
+
+        Both states keep referencing the same collections, so after copying neither of them
+        owns any collection - whichever writes first copies the touched collection.
+
+        Returns:
+            State: A new State instance sharing variables and items with this one.
+        """
+        self._ownedVariables = [False] * len(self.variables)
+        self._ownedItems = [None] * len(self.items)
+        state = State(self.variables, self.items, self.fingerprint, self.nextIds)
+        self._copy_indexes_to(state)
+        return state
+
+    def _copy_indexes_to(self, state):
+        """Share this state's item indexes and aggregates with a copy of it."""
+        if self.itemIndexes:
+            self._ownedIndexes = [None] * len(self.indexes)
+            state.itemIndexes = self.itemIndexes
+            state.indexes = self.indexes.copy()
+            state._ownedIndexes = [None] * len(self.indexes)
+            state.itemAggregates = self.itemAggregates
+            state.aggregates = self.aggregates.copy()
+
+    def _own_variable(self, varIndex) -> List:
+        """
+        Return a variable list that is safe to write, copying the shared list if needed.
+
+        Args:
+            varIndex (int): The index of the variable in the variables tuple.
+
+        Returns:
+            List: The variable list owned by this state.
+        """
+        if self._ownedVariables[varIndex]:
+            return self.variables[varIndex]
+        variable = self.variables[varIndex].copy()
+        self.variables[varIndex] = variable
+        self._ownedVariables[varIndex] = True
+        return variable
+
+    def _own_items(self, entityIndex) -> Tuple[Dict, set]:
+        """
+        Return an items dictionary that is safe to write, copying the shared dictionary if needed.
 
-        It works.
-        Manual copy instead of deepcopy - hopefully it's faster.
+        Only the dictionary is copied, the items' values stay shared until written.
+
+        Args:
+            entityIndex (int): The index of the entity in the items tuple.
 
         Returns:
-            State: A new State instance with copied variables and items.
+            Tuple[Dict, set]: The items dictionary and the set of item ids whose values are owned.
+        """
+        ownedIds = self._ownedItems[entityIndex]
+        if ownedIds is not None:
+            return self.items[entityIndex], ownedIds
+        entity = self.items[entityIndex].copy()
+        self.items[entityIndex] = entity
+        ownedIds = self._ownedItems[entityIndex] = set()
+        return entity, ownedIds
+
+    def add_item_index(self, entityIndex, keyIndex):
         """
-        return State(
-            tuple(var.copy() for var in self.variables),
-            tuple({id: copy(item) for id, item in entity.items()} for entity in self.items)
-        )
+        Index an item key, building the index from the current items. Does nothing if it's already indexed.
+
+        Args:
+            entityIndex (int): The index of the entity in the items tuple.
+            keyIndex (int): The index of the key in the item.
+        """
+        entityIndexes = self.itemIndexes.get(entityIndex, {})
+        if keyIndex in entityIndexes:
+            return
+        index = {}
+        for itemId, values in self.items_dict(entityIndex).items():
+            index.setdefault(values[keyIndex], set()).add(itemId)
+        # The indexes map may be shared with other states, so it's replaced rather than modified.
+        itemIndexes = self.itemIndexes.copy()
+        itemIndexes[entityIndex] = {**entityIndexes, keyIndex: len(self.indexes)}
+        self.itemIndexes = itemIndexes
+        self.indexes.append(index)
+        self._ownedIndexes.append(set(index))
+
+    def get_item_index(self, entityIndex, keyIndex):
+        """
+        Get the index of an item key.
+
+        Args:
+            entityIndex (int): The index of the entity in the items tuple.
+            keyIndex (int): The index of the key in the item.
+
+        Returns:
+            Dict | None: value -> set of item ids (read only), or None if the key isn't indexed.
+        """
+        slot = self.itemIndexes.get(entityIndex, {}).get(keyIndex)
+        if slot is None:
+            return None
+        return self.indexes[slot]
+
+    def add_item_aggregate(self, entityIndex, term):
+        """
+        Keep the sum of a term over all items of an entity, starting from the current items.
+        Does nothing if the term is already aggregated.
+
+        Args:
+            entityIndex (int): The index of the entity in the items tuple.
+            term (Callable): Item values -> a number. Its keys attribute holds the key indexes it reads.
+        """
+        entityAggregates = self.itemAggregates.get(entityIndex, ())
+        if any(aggregated is term for _, aggregated in entityAggregates):
+            return
+        total = sum(term(values) for values in self.items_dict(entityIndex).values())
+        # Like the indexes map, the aggregates map may be shared, so it's replaced rather than modified.
+        # Aggregated items are in the indexes map too (maybe without indexed keys), so the mutators' index hooks
+        # keep the totals up to date.
+        itemAggregates = self.itemAggregates.copy()
+        itemAggregates[entityIndex] = entityAggregates + ((len(self.aggregates), term),)
+        self.itemAggregates = itemAggregates
+        if entityIndex not in self.itemIndexes:
+            itemIndexes = self.itemIndexes.copy()
+            itemIndexes[entityIndex] = {}
+            self.itemIndexes = itemIndexes
+        self.aggregates.append(total)
+
+    def get_item_aggregate(self, entityIndex, term):
+        """
+        Get the sum of an aggregated term over the items of an entity.
+
+        Args:
+            entityIndex (int): The index of the entity in the items tuple.
+            term (Callable): The term, as given to add_item_aggregate.
+
+        Returns:
+            int | float | None: The sum, or None if the term isn't aggregated.
+        """
+        for slot, aggregated in self.itemAggregates.get(entityIndex, ()):
+            if aggregated is term:
+                return self.aggregates[slot]
+        return None
+
+    def _item_values(self, entityIndex, itemId):
+        """Return the values of an item (read only)."""
+        return self.items[entityIndex][itemId]
+
+    def _own_index_ids(self, slot, value) -> set:
+        """
+        Return an index's ids set of a value that is safe to write, copying the shared index and set if needed.
+
+        Args:
+            slot (int): The index's position in indexes.
+            value (Any): The indexed value.
+
+        Returns:
+            set: The ids of the items with the value, owned by this state.
+        """
+        ownedValues = self._ownedIndexes[slot]
+        if ownedValues is None:
+            index = self.indexes[slot] = self.indexes[slot].copy()
+            ownedValues = self._ownedIndexes[slot] = set()
+        else:
+            index = self.indexes[slot]
+        if value in ownedValues:
+            return index[value]
+        ids = index.get(value)
+        ids = set() if ids is None else ids.copy()
+        index[value] = ids
+        ownedValues.add(value)
+        return ids
+
+    def _reindex_value(self, entityIndex, keyIndex, itemId, oldValue, value):
+        """
+        Move an item between the ids sets of an indexed key's old and new value, and update the aggregates
+        whose term reads the key. Must be called before the new value is written.
+        """
+        if oldValue == value:
+            return
+        slot = self.itemIndexes[entityIndex].get(keyIndex)
+        if slot is not None:
+            self._own_index_ids(slot, oldValue).discard(itemId)
+            self._own_index_ids(slot, value).add(itemId)
+        entityAggregates = self.itemAggregates.get(entityIndex)
+        if entityAggregates:
+            values = self._item_values(entityIndex, itemId)
+            newValues = list(values)
+            newValues[keyIndex] = value
+            aggregates = self.aggregates
+            for slot, term in entityAggregates:
+                if keyIndex in term.keys:
+                    aggregates[slot] = aggregates[slot] - term(values) + term(newValues)
+
+    def _index_item(self, entityIndex, itemId, values, add=True):
+        """Add an item to (or remove it from, if add is False) its entity's indexes and aggregates."""
+        for keyIndex, slot in self.itemIndexes[entityIndex].items():
+            ids = self._own_index_ids(slot, values[keyIndex])
+            if add:
+                ids.add(itemId)
+            else:
+                ids.discard(itemId)
+        entityAggregates = self.itemAggregates.get(entityIndex)
+        if entityAggregates:
+            aggregates = self.aggregates
+            for slot, term in entityAggregates:
+                if add:
+                    aggregates[slot] += term(values)
+                else:
+                    aggregates[slot] -= term(values)
+
+    def mark(self) -> int:
+        """
+        Start logging mutations (if not already logging) and return the current log position.
+
+        Returns:
+            int: A mark to pass to rollback.
+        """
+        if self.undoLog is None:
+            self.undoLog = []
+        return len(self.undoLog)
+
+    def rollback(self, mark: int):
+        """
+        Undo all mutations logged after the given mark.
+
+        Args:
+            mark (int): A mark returned by mark().
+        """
+        undoLog = self.undoLog
+        # Restoring goes through the mutators, which must not log meanwhile.
+        self.undoLog = None
+        try:
+            # Records are dropped as they are undone, so an interrupted rollback can be resumed.
+            while len(undoLog) > mark:
+                record = undoLog[-1]
+                kind = record[0]
+                if kind == UNDO_VARIABLE:
+                    self.set_variable_value(record[1], record[2], record[3])
+                elif kind == UNDO_ITEM_VALUE:
+                    self.set_item_value(record[1], record[2], record[3], record[4])
+                elif kind == UNDO_ADD:
+                    if record[3] is None:
+                        self.remove_entity(record[1], record[2])
+                    else:
+                        self._restore_item(record[1], record[2], record[3])
+                elif kind == UNDO_REMOVE:
+                    self._restore_item(record[1], record[2], record[3], record[4])
+                elif kind == UNDO_REPLACE:
+                    self._restore_item(record[1], record[2], record[3])
+                else:
+                    self.set_next_id(record[1], record[2])
+                undoLog.pop()
+        finally:
+            self.undoLog = undoLog
+
+    def stop_undo_log(self):
+        """Stop logging mutations and drop the undo log."""
+        self.undoLog = None
+
+    def _restore_item(self, entityIndex, itemId, values, position=None):
+        """
+        Put back an item's values as they were logged, without logging.
+
+        Args:
+            entityIndex (int): The index of the entity in the items tuple.
+            itemId (int): The ID of the item.
+            values (List | Tuple): The logged values.
+            position (int, optional): The item's position in iteration order, for removed items.
+        """
+        entity, ownedIds = self._own_items(entityIndex)
+        indexed = entityIndex in self.itemIndexes
+        if itemId in entity:
+            self.fingerprint ^= item_fingerprint(entityIndex, itemId, entity[itemId])
+            if indexed:
+                self._index_item(entityIndex, itemId, entity[itemId], False)
+        # The logged values may be shared with other states.
+        entity[itemId] = values
+        ownedIds.discard(itemId)
+        self.fingerprint ^= item_fingerprint(entityIndex, itemId, values)
+        if indexed:
+            self._index_item(entityIndex, itemId, values)
+        if position is not None and position < len(entity) - 1:
+            # Back to the original position, so iteration order is restored too.
+            move_last_key(entity, position)
+
+    def variable_values(self, varIndex) -> List:
+        """
+        Get all values of a variable.
+
+        Args:
+            varIndex (int): The index of the variable in the variables tuple.
+
+        Returns:
+            List: The variable's values.
+        """
+        return self.variables[varIndex]
+
+    def items_dict(self, entityIndex) -> Dict:
+        """
+        Get the items of an entity as a dictionary of id -> values.
+
+        Args:
+            entityIndex (int): The index of the entity in the items tuple.
+
+        Returns:
+            Dict: The items' values.
+        """
+        return self.items[entityIndex]
 
     def get_variable_value(self, varIndex, index):
         """
@@ -104,7 +582,12 @@ class State:
             index (int): The index within the variable list.
             value (Any): The new value to set.
         """
-        self.variables[varIndex][index] = value
+        variable = self._own_variable(varIndex)
+        if self.undoLog is not None:
+            self.undoLog.append((UNDO_VARIABLE, varIndex, index, variable[index]))
+        self.fingerprint = (self.fingerprint ^ hash((varIndex, index, variable[index]))
+                            ^ hash((varIndex, index, value))) & FINGERPRINT_MASK
+        variable[index] = value
 
     def set_item_value(self, entityIndex, keyIndex, index, value):
         """
@@ -119,19 +602,35 @@ class State:
             value (Any): The new value to set.
         """
         # Pay attention: item -> entity -> key Package[pack][type]
-        self.items[entityIndex][index][keyIndex] = value
+        entity, ownedIds = self._own_items(entityIndex)
+        item = entity[index]
+        if index not in ownedIds:
+            item = item.copy()
+            entity[index] = item
+            ownedIds.add(index)
+        if self.undoLog is not None:
+            self.undoLog.append((UNDO_ITEM_VALUE, entityIndex, keyIndex, index, item[keyIndex]))
+        entityKey = -1 - entityIndex
+        self.fingerprint = (self.fingerprint ^ hash((entityKey, index, keyIndex, item[keyIndex]))
+                            ^ hash((entityKey, index, keyIndex, value))) & FINGERPRINT_MASK
+        if entityIndex in self.itemIndexes:
+            self._reindex_value(entityIndex, keyIndex, index, item[keyIndex], value)
+        item[keyIndex] = value
 
     def get_items_ids(self, entityIndex) -> Iterable[int]:
         """
         Get the IDs of all items for a given entity.
 
+        The ids are a live view: adding or removing items of the entity while iterating over it
+        is an error - iterate over a snapshot (tuple) of the ids instead.
+
         Args:
             entityIndex (int): The index of the entity in the items tuple.
 
         Returns:
-            Iterable[int]: A tuple of item IDs.
+            Iterable[int]: A view of the item IDs, supporting len and fast membership tests.
         """
-        return tuple(self.items[entityIndex].keys())
+        return self.items[entityIndex].keys()
 
     def get_len_items(self, entityIndex) -> int:
         """
@@ -145,6 +644,42 @@ class State:
         """
         return len(self.items[entityIndex])
 
+    def get_len_entities(self) -> int:
+        """
+        Get the number of items collections (entities with items) in the state.
+
+        Returns:
+            int: The number of items collections.
+        """
+        return len(self.items)
+
+    def allocate_id(self, entityIndex) -> int:
+        """
+        Allocate an id for a new item.
+
+        Args:
+            entityIndex (int): The index of the entity in the items tuple.
+
+        Returns:
+            int: The allocated id, never used before by this state or the states it was copied from.
+        """
+        itemId = self.nextIds[entityIndex]
+        self.set_next_id(entityIndex, itemId + 1)
+        return itemId
+
+    def set_next_id(self, entityIndex, nextId):
+        """
+        Set the id to allocate next for an entity's items.
+
+        Args:
+            entityIndex (int): The index of the entity in the items tuple.
+            nextId (int): The id to allocate next.
+        """
+        nextIds = self.nextIds
+        if self.undoLog is not None:
+            self.undoLog.append((UNDO_NEXT_ID, entityIndex, nextIds[entityIndex]))
+        self.nextIds = nextIds[:entityIndex] + (nextId,) + nextIds[entityIndex + 1:]
+
     def add_entity_list(self, entityIndex, maxId, *params):
         """
         Add a new entity with parameters as a list.
@@ -155,7 +690,19 @@ class State:
             *params: Parameters of the new entity.
         """
         # Add new item (list) with the max id
-        self.items[entityIndex][maxId] = list(params)
+        entity, ownedIds = self._own_items(entityIndex)
+        if self.undoLog is not None:
+            self.undoLog.append((UNDO_ADD, entityIndex, maxId, entity.get(maxId)))
+        indexed = entityIndex in self.itemIndexes
+        if maxId in entity:
+            self.fingerprint ^= item_fingerprint(entityIndex, maxId, entity[maxId])
+            if indexed:
+                self._index_item(entityIndex, maxId, entity[maxId], False)
+        entity[maxId] = list(params)
+        ownedIds.add(maxId)
+        self.fingerprint ^= item_fingerprint(entityIndex, maxId, params)
+        if indexed:
+            self._index_item(entityIndex, maxId, params)
 
     def add_entity(self, entityIndex, maxId, *params):
         """
@@ -167,7 +714,19 @@ class State:
             *params: Parameters of the new entity.
         """
         # Add new item (tuple) with the max id
-        self.items[entityIndex][maxId] = params
+        entity, ownedIds = self._own_items(entityIndex)
+        if self.undoLog is not None:
+            self.undoLog.append((UNDO_ADD, entityIndex, maxId, entity.get(maxId)))
+        indexed = entityIndex in self.itemIndexes
+        if maxId in entity:
+            self.fingerprint ^= item_fingerprint(entityIndex, maxId, entity[maxId])
+            ownedIds.discard(maxId)
+            if indexed:
+                self._index_item(entityIndex, maxId, entity[maxId], False)
+        entity[maxId] = params
+        self.fingerprint ^= item_fingerprint(entityIndex, maxId, params)
+        if indexed:
+            self._index_item(entityIndex, maxId, params)
 
     def remove_entity(self, entityIndex, removeId):
         """
@@ -177,7 +736,15 @@ class State:
             entityIndex (int): The index of the entity in the items tuple.
             removeId (int): The ID of the entity to remove.
         """
-        self.items[entityIndex].pop(removeId)
+        entity, ownedIds = self._own_items(entityIndex)
+        if self.undoLog is not None:
+            self.undoLog.append((UNDO_REMOVE, entityIndex, removeId, entity[removeId],
+                                 key_position(entity, removeId)))
+        values = entity.pop(removeId)
+        self.fingerprint ^= item_fingerprint(entityIndex, removeId, values)
+        ownedIds.discard(removeId)
+        if entityIndex in self.itemIndexes:
+            self._index_item(entityIndex, removeId, values, False)
 
     def replace_entity(self, entityIndex, replaceId, *newVals):
         """
@@ -188,7 +755,16 @@ class State:
             replaceId (int): The ID of the entity to replace.
             *newVals: New values for the entity.
         """
-        self.items[entityIndex][replaceId] = newVals
+        entity, ownedIds = self._own_items(entityIndex)
+        if self.undoLog is not None:
+            self.undoLog.append((UNDO_REPLACE, entityIndex, replaceId, entity[replaceId]))
+        self.fingerprint ^= (item_fingerprint(entityIndex, replaceId, entity[replaceId])
+                             ^ item_fingerprint(entityIndex, replaceId, newVals))
+        if entityIndex in self.itemIndexes:
+            self._index_item(entityIndex, replaceId, entity[replaceId], False)
+            self._index_item(entityIndex, replaceId, newVals)
+        entity[replaceId] = newVals
+        ownedIds.discard(replaceId)
 
     def replace_entity_list(self, entityIndex, replaceId, *newVals):
         """
@@ -199,7 +775,89 @@ class State:
             replaceId (int): The ID of the entity to replace.
             *newVals: New values for the entity.
         """
-        self.items[entityIndex][replaceId] = list(newVals)
+        entity, ownedIds = self._own_items(entityIndex)
+        if self.undoLog is not None:
+            self.undoLog.append((UNDO_REPLACE, entityIndex, replaceId, entity[replaceId]))
+        self.fingerprint ^= (item_fingerprint(entityIndex, replaceId, entity[replaceId])
+                             ^ item_fingerprint(entityIndex, replaceId, newVals))
+        if entityIndex in self.itemIndexes:
+            self._index_item(entityIndex, replaceId, entity[replaceId], False)
+            self._index_item(entityIndex, replaceId, newVals)
+        entity[replaceId] = list(newVals)
+        ownedIds.add(replaceId)
+
+    def diff(self, other) -> StateDelta:
+        """
+        Compute the changes turning this state into another state of the same problem.
+
+        Collections shared by the two states (copy-on-write) are skipped without comparing them.
+
+        Args:
+            other (State): The target state.
+
+        Returns:
+            StateDelta: The changes - patching this state with them makes it equal to other.
+        """
+        delta = StateDelta()
+        for varIndex in range(len(self.variables)):
+            values = self.variable_values(varIndex)
+            otherValues = other.variable_values(varIndex)
+            if values is otherValues:
+                continue
+            for index, (value, otherValue) in enumerate(zip(values, otherValues)):
+                if value != otherValue or type(value) is not type(otherValue):
+                    delta.variables.append((varIndex, index, otherValue))
+        for entityIndex in range(self.get_len_entities()):
+            entity = self.items_dict(entityIndex)
+            otherEntity = other.items_dict(entityIndex)
+            if entity is otherEntity:
+                continue
+            for itemId, values in entity.items():
+                if itemId not in otherEntity:
+                    delta.removedItems.append((entityIndex, itemId))
+                    continue
+                otherValues = otherEntity[itemId]
+                if values is otherValues:
+                    continue
+                if (type(values) is not type(otherValues) or not isinstance(values, list)
+                        or len(values) != len(otherValues)):
+                    if type(values) is type(otherValues) and _same_values(values, otherValues):
+                        continue
+                    # Not settable key by key - replace the whole item
+                    delta.removedItems.append((entityIndex, itemId))
+                    delta.addedItems.append((entityIndex, itemId, otherValues))
+                    continue
+                for keyIndex, (value, otherValue) in enumerate(zip(values, otherValues)):
+                    if value != otherValue or type(value) is not type(otherValue):
+                        delta.itemValues.append((entityIndex, keyIndex, itemId, otherValue))
+            for itemId, otherValues in otherEntity.items():
+                if itemId not in entity:
+                    delta.addedItems.append((entityIndex, itemId, otherValues))
+        if self.nextIds != other.nextIds:
+            delta.nextIds.extend((entityIndex, nextId) for entityIndex, (ownNextId, nextId)
+                                 in enumerate(zip(self.nextIds, other.nextIds)) if ownNextId != nextId)
+        return delta
+
+    def patch(self, delta: StateDelta):
+        """
+        Apply a delta produced by diff, through the regular mutators.
+
+        Args:
+            delta (StateDelta): The changes to apply.
+        """
+        for varIndex, index, value in delta.variables:
+            self.set_variable_value(varIndex, index, value)
+        for entityIndex, itemId in delta.removedItems:
+            self.remove_entity(entityIndex, itemId)
+        for entityIndex, keyIndex, itemId, value in delta.itemValues:
+            self.set_item_value(entityIndex, keyIndex, itemId, value)
+        for entityIndex, itemId, values in delta.addedItems:
+            if isinstance(values, list):
+                self.add_entity_list(entityIndex, itemId, *values)
+            else:
+                self.add_entity(entityIndex, itemId, *values)
+        for entityIndex, nextId in delta.nextIds:
+            self.set_next_id(entityIndex, nextId)
 
     def __lt__(self, other):
         """
@@ -0,0 +1,82 @@
+from array import array
+from CARRI.state import State
+from CARRI.codec import encode_state, decode_state
+
+# Initial arena buffer size, in bytes.
+DEFAULT_ARENA_CAPACITY = 1 << 20
+
+
+class StateArena:
+    """
+    Stores states encoded (see CARRI.codec) in one preallocated, contiguous buffer, addressed by integer handles.
+
+    Stored states are plain bytes - they don't add objects for the garbage collector to track,
+    and the arena's memory use is its buffer plus 8 bytes per state. The arena is append only:
+    states are freed all at once by clear(), in O(1). Handles returned before a clear are invalid after it.
+    """
+    def __init__(self, problem=None, capacity: int = DEFAULT_ARENA_CAPACITY):
+        """
+        Initialize an empty StateArena.
+
+        Args:
+            problem (Problem, optional): If given, loaded states are built with the problem's State backend.
+            capacity (int): The initial buffer size in bytes. The buffer doubles when it's full.
+        """
+        self.problem = problem
+        self.buffer = bytearray(max(capacity, 1))
+        # Start offset of each stored state - a state ends where the next one starts.
+        self.offsets = array('q')
+        # Number of bytes in use.
+        self.size = 0
+
+    def __len__(self):
+        """Return the number of stored states."""
+        return len(self.offsets)
+
+    @property
+    def capacity(self) -> int:
+        """The buffer size in bytes."""
+        return len(self.buffer)
+
+    def store(self, state: State) -> int:
+        """
+        Store a state.
+
+        Args:
+            state (State): The state to store. It's encoded, so later changes to it don't affect the arena.
+
+        Returns:
+            int: The state's handle.
+        """
+        data = encode_state(state)
+        start = self.size
+        end = start + len(data)
+        if end > len(self.buffer):
+            capacity = len(self.buffer)
+            while capacity < end:
+                capacity *= 2
+            self.buffer.extend(bytes(capacity - len(self.buffer)))
+        self.buffer[start:end] = data
+        self.size = end
+        self.offsets.append(start)
+        return len(self.offsets) - 1
+
+    def load(self, handle: int) -> State:
+        """
+        Load a stored state.
+
+        Args:
+            handle (int): A handle returned by store.
+
+        Returns:
+            State: A new, mutable copy of the stored state.
+        """
+        offsets = self.offsets
+        end = offsets[handle + 1] if handle + 1 < len(offsets) else self.size
+        with memoryview(self.buffer) as view:
+            return decode_state(view[offsets[handle]:end], self.problem)
+
+    def clear(self):
+        """Free all stored states. The buffer is kept for reuse."""
+        self.offsets = array('q')
+        self.size = 0
@@ -0,0 +1,120 @@
+import weakref
+from CARRI.state import State
+from CARRI.columnarState import ColumnarState
+
+
+class FrozenStateError(TypeError):
+    """Raised when trying to modify a frozen (interned) State."""
+
+
+class Frozen:
+    """
+    Mixin blocking every State mutator.
+
+    A frozen state is shared - to modify it, copy it first; copies are regular, mutable states.
+    """
+    __slots__ = ()
+
+    def _frozen(self, *args):
+        raise FrozenStateError("Frozen states can't be modified, copy them first")
+
+    set_variable_value = _frozen
+    set_item_value = _frozen
+    add_entity = _frozen
+    add_entity_list = _frozen
+    remove_entity = _frozen
+    replace_entity = _frozen
+    replace_entity_list = _frozen
+    add_item_index = _frozen
+    add_item_aggregate = _frozen
+    allocate_id = _frozen
+    set_next_id = _frozen
+    mark = _frozen
+    rollback = _frozen
+
+
+class FrozenState(Frozen, State):
+    """A frozen State."""
+    __slots__ = ()
+
+
+class FrozenColumnarState(Frozen, ColumnarState):
+    """A frozen ColumnarState."""
+    __slots__ = ()
+
+
+# Frozen class per State class.
+FROZEN_CLASSES = {State: FrozenState, ColumnarState: FrozenColumnarState,
+                  FrozenState: FrozenState, FrozenColumnarState: FrozenColumnarState}
+
+
+def freeze(state: State) -> State:
+    """
+    Freeze a State in place, making its mutators raise FrozenStateError.
+
+    Args:
+        state (State): The state to freeze.
+
+    Returns:
+        State: The same state, frozen.
+    """
+    state.undoLog = None
+    state.__class__ = FROZEN_CLASSES[type(state)]
+    return state
+
+
+class StatePool:
+    """
+    Intern pool (hash-consing) of States, keyed by their fingerprint.
+
+    Interning a state returns the canonical, frozen instance of its contents, so structurally
+    identical states reached by different transitions are stored once and can be compared by identity.
+    The pool only holds weak references - states no longer used elsewhere drop out of it.
+    """
+    def __init__(self):
+        """Initialize an empty StatePool."""
+        self.states = weakref.WeakValueDictionary()
+
+    def __len__(self):
+        return len(self.states)
+
+    def __contains__(self, state: State):
+        return self.find(state) is not None
+
+    def find(self, state: State):
+        """
+        Find the canonical instance of a state, without interning it.
+
+        Args:
+            state (State): The state to look up.
+
+        Returns:
+            State: The canonical state, or None if no equal state is interned.
+        """
+        canonical = self.states.get(state.fingerprint)
+        if canonical is not None and canonical == state:
+            return canonical
+        return None
+
+    def intern(self, state: State) -> State:
+        """
+        Return the canonical instance of a state, interning (and freezing) it if it's new.
+
+        The given state must not be modified afterward: it's either frozen, or
+        equal to the returned canonical state which should be used instead.
+
+        Args:
+            state (State): The state to intern.
+
+        Returns:
+            State: The canonical, frozen state - `state` itself if it wasn't interned before.
+        """
+        fingerprint = state.fingerprint
+        canonical = self.states.get(fingerprint)
+        if canonical is not None:
+            if canonical is state or canonical == state:
+                return canonical
+            # A fingerprint collision: keep the first state as canonical, the new one stays unique.
+            return freeze(state)
+        self.states[fingerprint] = freeze(state)
+        return state
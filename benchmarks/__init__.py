@@ -0,0 +1,31 @@
+"""
+Benchmarks for the CARRI framework.
+
+Each module is runnable from the repository root, e.g.: python -m benchmarks.objectLayout
+"""
+import os
+from CARRI.Parser.parser import Parser
+
+FOLDER_DOMAINS = os.path.join("Examples", "Domains")
+FOLDER_PROBLEMS = os.path.join("Examples", "Problems")
+
+# (domain, problem) pairs covering the implemented domains.
+EXAMPLE_PROBLEMS = (("Trucks and Drones", "Trucks and Drones 1"),
+                    ("Cars", "Cars 1"),
+                    ("MotorCycles and Letters", "MotorCycles and Letters 1"),
+                    ("Rail System Factory", "Rail System Factory 1"))
+
+
+def load_problem(domainName: str, problemName: str):
+    """
+    Parse an example problem.
+
+    Args:
+        domainName (str): The domain file name, without extension.
+        problemName (str): The problem file name, without extension.
+
+    Returns:
+        Tuple[Simulator, List]: The simulator and the problem's iterations.
+    """
+    return Parser().parse(os.path.join(FOLDER_DOMAINS, domainName + ".CARRI"),
+                          os.path.join(FOLDER_PROBLEMS, problemName + ".CARRI"))
@@ -0,0 +1,120 @@
+"""
+Batch evaluation benchmark (see CARRI.batchEvaluation):
+- re-validating actions in a beam of states one state at a time versus in one vectorised pass over
+  the beam per action (Simulator.revalidate_batch),
+- filtering a parameter's candidate values one by one versus in one vectorised pass
+  (ActionProducer.filter_parameter_values).
+
+The beam's states are random successors of the initial state, and the actions are the valid actions
+of the initial state - as when a search re-validates a parent's actions in the states of its beam.
+Measures, per example problem and beam size, the time to re-validate all the actions in the beam's states,
+per action and state. Batch times include gathering the states' values into arrays.
+
+Candidate values are all the ids of a parameter's entity in the initial state, with the earlier parameters
+assigned as in the generator's first valid action. Measures, per action generator parameter with
+a vectorised filter, the time to filter them, per value - regardless of MIN_BATCH_CANDIDATES.
+Filters falling back to the loop for these values (see filter_candidates) are skipped.
+
+Run from the repository root: python -m benchmarks.batchEvaluation
+"""
+import random
+import numpy as np
+from benchmarks import EXAMPLE_PROBLEMS, load_problem
+from benchmarks.expressionCompiler import best_time
+from benchmarks.shortCircuit import random_walk, SEED
+from CARRI.action import ActionProducer
+from CARRI.batchEvaluation import StateBatch, CandidateBatch, BATCH_FALLBACK_ERRORS
+
+# Beam sizes measured, and the length of the walks ending in the beam's states (the initial state and one step).
+BEAM_SIZES = (8, 32, 128)
+WALK_LENGTH = 2
+# Problems whose domain filters are measured - the example problems and a larger one.
+FILTER_PROBLEMS = EXAMPLE_PROBLEMS + (("Trucks and Drones", "Trucks and Drones 3"),)
+
+
+def revalidate_scalar(simulator, actions, states):
+    """Re-validate the actions state by state."""
+    problem = simulator.problem
+    return [[action.reValidate(problem, state) for state in states] for action in actions]
+
+
+def revalidate_batch(simulator, actions, states):
+    """Re-validate the actions in one pass over the states per action."""
+    problem = simulator.problem
+    batch = StateBatch(states)
+    return [action.reValidate_batch(problem, batch) for action in actions]
+
+
+def benchmark_revalidation():
+    print("{:<28}{:>6}{:>9}{:>10}{:>15}{:>15}{:>10}".format(
+        "problem", "beam", "actions", "batched", "ns/check loop", "ns/check batch", "speedup"))
+    for domainName, problemName in EXAMPLE_PROBLEMS:
+        simulator, _ = load_problem(domainName, problemName)
+        initialState = simulator.get_state()
+        actions = [action for entityActions in simulator.generate_all_valid_seperate_actions(initialState).values()
+                   for vehicleActions in entityActions.values() for action in vehicleActions]
+        batched = sum(action.compiledBatchReValidate is not None for action in actions)
+        rng = random.Random(SEED)
+        for beamSize in BEAM_SIZES:
+            states = [random_walk(simulator, WALK_LENGTH, rng)[-1] for _ in range(beamSize)]
+            checks = max(len(actions) * beamSize, 1)
+            times = [best_time(lambda: revalidate(simulator, actions, states)) / checks
+                     for revalidate in (revalidate_scalar, revalidate_batch)]
+            print("{:<28}{:>6}{:>9}{:>10}{:>15.0f}{:>15.0f}{:>9.2f}x".format(
+                problemName, beamSize, len(actions), batched, times[0] * 1e9, times[1] * 1e9,
+                times[0] / times[1]))
+
+
+def benchmark_domain_filters():
+    print("{:<28}{:<24}{:>6}{:>8}{:>15}{:>15}{:>10}".format(
+        "problem", "generator", "param", "values", "ns/value loop", "ns/value batch", "speedup"))
+    for domainName, problemName in FILTER_PROBLEMS:
+        simulator, _ = load_problem(domainName, problemName)
+        problem = simulator.problem
+        state = simulator.get_state()
+        producer = ActionProducer(simulator.action_generators)
+        actions = {}
+        for entityActions in simulator.generate_all_valid_seperate_actions(state).values():
+            for vehicleActions in entityActions.values():
+                for action in vehicleActions:
+                    actions.setdefault(action.name, action)
+        for actionGenerator in simulator.action_generators:
+            action = actions.get(actionGenerator.name)
+            if action is None:
+                continue
+            domainFilters = actionGenerator.compiledDomainFilters
+            for paramIndex, domainFilter in enumerate(domainFilters):
+                if domainFilter is None:
+                    continue
+                for index in range(paramIndex):
+                    actionGenerator.paramExpressions[index].updateParam(action.params[index].value)
+                    actionGenerator.slots[index] = action.params[index].value
+                values = list(problem.get_entity_ids(state, actionGenerator.entities[paramIndex]))
+                candidates = np.array(values)
+                actionGenerator.compiledDomainFilters = []
+                loopTime = best_time(lambda: producer.filter_parameter_values(actionGenerator, problem, state,
+                                                                              paramIndex, values))
+                actionGenerator.compiledDomainFilters = domainFilters
+                filterBatch = lambda: candidates[domainFilter(problem, CandidateBatch(state, candidates),
+                                                              actionGenerator.slots)].tolist()
+                try:
+                    filterBatch()
+                except BATCH_FALLBACK_ERRORS:
+                    # Filtered one by one
+                    continue
+                batchTime = best_time(filterBatch)
+                print("{:<28}{:<24}{:>6}{:>8}{:>15.0f}{:>15.0f}{:>9.2f}x".format(
+                    problemName, actionGenerator.name, paramIndex, len(values),
+                    loopTime / len(values) * 1e9, batchTime / len(values) * 1e9, loopTime / batchTime))
+            actionGenerator.resetParams()
+            actionGenerator.slots[:] = [None] * len(actionGenerator.slots)
+
+
+def main():
+    benchmark_revalidation()
+    print()
+    benchmark_domain_filters()
+
+
+if __name__ == "__main__":
+    main()
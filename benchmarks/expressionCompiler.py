@@ -0,0 +1,111 @@
+"""
+Expression compiler benchmark: interpreted expression and update trees versus compiled functions
+(see CARRI.compiler).
+
+Measures, per example problem, with the trees interpreted and compiled:
+- the time of an expansion (producing the actions of all vehicles, which evaluates preconditions
+  while assigning parameters),
+- the time to validate, re-validate and cost every action of the initial state,
+- the time to step every action of the initial state: applying its effects and cost,
+  then the environment steps' effects and costs and the iteration step, on a copy of the state.
+
+Run from the repository root: python -m benchmarks.expressionCompiler
+"""
+import time
+from benchmarks import EXAMPLE_PROBLEMS, load_problem
+from CARRI.expression import CostExpression
+from CARRI.itemAggregates import ItemAggregateNode
+
+# Number of repetitions to time per problem and mode, and the number of timing rounds (the best is kept).
+REPEATS = 100
+ROUNDS = 5
+
+
+def set_compiled(simulator, compiled: bool):
+    """Compile the simulator's expressions, or drop the compiled forms so they are interpreted."""
+    if compiled:
+        simulator.compile_expressions()
+        return
+    for actionGenerator in simulator.action_generators:
+        actionGenerator.compiledPreconditions = None
+        actionGenerator.compiledConflictingPreconditions = None
+        actionGenerator.compiledEffects = None
+        actionGenerator.compiledValidate = None
+        actionGenerator.compiledReValidate = None
+        actionGenerator.compiledBatchValidate = None
+        actionGenerator.compiledBatchReValidate = None
+        actionGenerator.compiledDomainFilters = []
+    for step in simulator.action_generators + simulator.envSteps:
+        cost = step.cost.cost if isinstance(step.cost, ItemAggregateNode) else step.cost
+        if isinstance(cost, CostExpression):
+            cost.compiled = None
+    for step in simulator.envSteps + [simulator.iterStep]:
+        step.compiled = None
+
+
+def best_time(function) -> float:
+    """Return the mean seconds per call of function, of the fastest round of REPEATS calls."""
+    best = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            function()
+        elapsed = (time.perf_counter() - start) / REPEATS
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def check_actions(simulator, state, actions):
+    """Validate, re-validate and cost actions, like evaluating a transition does."""
+    problem = simulator.problem
+    for action in actions:
+        action.validate(problem, state)
+        action.reValidate(problem, state)
+        action.get_cost(problem, state)
+
+
+def step_actions(simulator, state, actions):
+    """Apply each action, then the environment and iteration steps, to a copy of state - a successor each."""
+    problem = simulator.problem
+    for action in actions:
+        successor = state.__copy__()
+        action.apply(problem, successor)
+        action.get_cost(problem, successor)
+        for envStep in simulator.envSteps:
+            envStep.apply(problem, successor)
+            envStep.get_cost(problem, successor)
+        simulator.iterStep.apply(problem, successor)
+
+
+def main():
+    print("{:<28}{:>9}{:>16}{:>16}{:>10}".format("problem", "actions", "us/exp interp", "us/exp compiled",
+                                                 "speedup"))
+    checks = []
+    for domainName, problemName in EXAMPLE_PROBLEMS:
+        simulator, _ = load_problem(domainName, problemName)
+        state = simulator.get_state()
+        times = {}
+        for compiled in (False, True):
+            set_compiled(simulator, compiled)
+            actions = [action for entityActions in simulator.generate_all_valid_seperate_actions(state).values()
+                       for vehicleActions in entityActions.values() for action in vehicleActions]
+            times[compiled] = (best_time(lambda: simulator.generate_all_valid_seperate_actions(state)),
+                               best_time(lambda: check_actions(simulator, state, actions)),
+                               best_time(lambda: step_actions(simulator, state, actions)))
+        print("{:<28}{:>9}{:>16.1f}{:>16.1f}{:>9.2f}x".format(
+            problemName, len(actions), times[False][0] * 1e6, times[True][0] * 1e6, times[False][0] / times[True][0]))
+        checks.append((problemName, times))
+    print()
+    print("{:<28}{:>20}{:>20}{:>10}".format("problem", "us/check interp", "us/check compiled", "speedup"))
+    for problemName, times in checks:
+        print("{:<28}{:>20.1f}{:>20.1f}{:>9.2f}x".format(
+            problemName, times[False][1] * 1e6, times[True][1] * 1e6, times[False][1] / times[True][1]))
+    print()
+    print("{:<28}{:>20}{:>20}{:>10}".format("problem", "us/steps interp", "us/steps compiled", "speedup"))
+    for problemName, times in checks:
+        print("{:<28}{:>20.1f}{:>20.1f}{:>9.2f}x".format(
+            problemName, times[False][2] * 1e6, times[True][2] * 1e6, times[False][2] / times[True][2]))
+
+
+if __name__ == "__main__":
+    main()
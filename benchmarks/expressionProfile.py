@@ -0,0 +1,41 @@
+"""
+Expression profile: which preconditions, effects and costs the time goes to (see CARRI.profiler).
+
+Profiles, per example problem, over the states of a random walk: expanding the state, then checking
+and stepping its actions, as evaluating its transitions does. Lists the most expensive entries.
+
+Pass `interpreted` to profile the interpreted expressions, line by line, instead of the compiled ones.
+
+Run from the repository root: python -m benchmarks.expressionProfile [interpreted]
+"""
+import random
+import sys
+from benchmarks import EXAMPLE_PROBLEMS, load_problem
+from benchmarks.expressionCompiler import set_compiled, check_actions, step_actions
+from benchmarks.shortCircuit import random_walk, WALK_LENGTH, SEED
+from CARRI.profiler import ExpressionProfiler
+
+# Number of entries listed per problem.
+TOP_ENTRIES = 15
+
+
+def main():
+    interpreted = "interpreted" in sys.argv[1:]
+    for domainName, problemName in EXAMPLE_PROBLEMS:
+        simulator, _ = load_problem(domainName, problemName)
+        if interpreted:
+            set_compiled(simulator, False)
+        states = random_walk(simulator, WALK_LENGTH, random.Random(SEED))
+        with ExpressionProfiler(simulator) as profiler:
+            for state in states:
+                actions = [action for entityActions in simulator.generate_all_valid_seperate_actions(state).values()
+                           for vehicleActions in entityActions.values() for action in vehicleActions]
+                check_actions(simulator, state, actions)
+                step_actions(simulator, state, actions)
+        print("== {} ({} states)".format(problemName, len(states)))
+        print(profiler.report(TOP_ENTRIES))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Item ids benchmark: ids views versus tuple materialisation during action production.
+
+Every expansion (producing the actions of all vehicles, ActionProducer.produce_actions)
+asks for item ids once per parameter candidate set and per existence check. This measures,
+per expansion, how many ids collections are requested, the bytes the former tuple copies
+allocated for them, and the expansion time with tuples and with views.
+Each problem is measured with the item index probes (see ActionGenerator.find_index_probes)
+and without them, when every candidate set is a full scan of the ids.
+
+Run from the repository root: python -m benchmarks.idViews
+"""
+import sys
+import time
+from contextlib import contextmanager
+from benchmarks import EXAMPLE_PROBLEMS, load_problem
+from CARRI.state import State
+from CARRI.columnarState import ColumnarState
+
+# Number of expansions to time per problem and mode, and the number of timing rounds (the best is kept).
+EXPANSIONS = 100
+ROUNDS = 5
+
+
+@contextmanager
+def counted_ids(materialise):
+    """
+    Count the get_items_ids calls of both State backends, optionally materialising tuples like before.
+
+    Yields:
+        List[int]: [calls, bytes allocated by tuple copies], updated while the context is active.
+    """
+    counters = [0, 0]
+    originals = {cls: cls.__dict__["get_items_ids"] for cls in (State, ColumnarState)}
+
+    def wrap(getItemsIds):
+        def get_items_ids(self, entityIndex):
+            ids = getItemsIds(self, entityIndex)
+            counters[0] += 1
+            if materialise:
+                ids = tuple(ids)
+                counters[1] += sys.getsizeof(ids)
+            return ids
+        return get_items_ids
+
+    for cls, getItemsIds in originals.items():
+        cls.get_items_ids = wrap(getItemsIds)
+    try:
+        yield counters
+    finally:
+        for cls, getItemsIds in originals.items():
+            cls.get_items_ids = getItemsIds
+
+
+def time_expansions(simulator, state) -> float:
+    """Return the mean seconds per expansion, of the fastest round."""
+    best = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for _ in range(EXPANSIONS):
+            simulator.generate_all_valid_seperate_actions(state)
+        elapsed = (time.perf_counter() - start) / EXPANSIONS
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    print("{:<28}{:>9}{:>12}{:>14}{:>16}{:>14}".format(
+        "problem", "probes", "ids calls", "tuple B/exp", "us/exp tuples", "us/exp views"))
+    for domainName, problemName in EXAMPLE_PROBLEMS:
+        simulator, _ = load_problem(domainName, problemName)
+        state = simulator.get_state()
+        for probes in (True, False):
+            if not probes:
+                for actionGenerator in simulator.action_generators:
+                    actionGenerator.indexProbes = [None] * len(actionGenerator.indexProbes)
+            with counted_ids(True) as counters:
+                simulator.generate_all_valid_seperate_actions(state)
+                calls, tupleBytes = counters
+            with counted_ids(True):
+                tuplesTime = time_expansions(simulator, state)
+            with counted_ids(False):
+                viewsTime = time_expansions(simulator, state)
+            print("{:<28}{:>9}{:>12}{:>14}{:>16.1f}{:>14.1f}".format(
+                problemName, "on" if probes else "off", calls, tupleBytes, tuplesTime * 1e6, viewsTime * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Item aggregates benchmark: environment step costs summing a term over all items, looping over the items
+versus reading the running sums the states keep (see CARRI.itemAggregates).
+
+Measures, per example problem, over the states of a random walk:
+- the time to evaluate the environment steps' costs of a state,
+- the time of a successor step: applying an action, then the environment steps' effects and costs
+  and the iteration step, on a copy of the state - including keeping the sums up to date.
+
+States without the sums are decoded copies of the walk's states, built while the problem registers no
+aggregates; the aggregated costs fall back to their loops in them.
+
+Run from the repository root: python -m benchmarks.itemAggregates
+"""
+import random
+from benchmarks import EXAMPLE_PROBLEMS, load_problem
+from benchmarks.expressionCompiler import best_time, step_actions
+from benchmarks.shortCircuit import random_walk, WALK_LENGTH, SEED
+from CARRI.codec import encode_state, decode_state
+from CARRI.itemAggregates import ItemAggregateNode
+
+
+def without_aggregates(simulator, states):
+    """Return copies of states that don't keep the problem's item aggregates."""
+    problem = simulator.problem
+    terms, problem.itemAggregateTerms = problem.itemAggregateTerms, ()
+    try:
+        return [decode_state(encode_state(state), problem) for state in states]
+    finally:
+        problem.itemAggregateTerms = terms
+
+
+def env_costs(simulator, states):
+    """Evaluate the environment steps' costs in every state."""
+    problem = simulator.problem
+    for state in states:
+        for envStep in simulator.envSteps:
+            envStep.get_cost(problem, state)
+
+
+def step_all(simulator, states, actions):
+    """Step the actions of every state (see step_actions)."""
+    for state, stateActions in zip(states, actions):
+        step_actions(simulator, state, stateActions)
+
+
+def main():
+    print("{:<28}{:>8}{:>12}{:>16}{:>16}{:>10}".format(
+        "problem", "states", "aggregated", "us/costs loop", "us/costs aggr", "speedup"))
+    steps = []
+    for domainName, problemName in EXAMPLE_PROBLEMS:
+        simulator, _ = load_problem(domainName, problemName)
+        aggregated = sum(isinstance(envStep.cost, ItemAggregateNode) for envStep in simulator.envSteps)
+        states = random_walk(simulator, WALK_LENGTH, random.Random(SEED))
+        plainStates = without_aggregates(simulator, states)
+        actions = [[action for entityActions in simulator.generate_all_valid_seperate_actions(state).values()
+                    for vehicleActions in entityActions.values() for action in vehicleActions]
+                   for state in states]
+        successors = sum(len(stateActions) for stateActions in actions)
+        costTimes = [best_time(lambda: env_costs(simulator, modeStates)) / len(states)
+                     for modeStates in (plainStates, states)]
+        stepTimes = [best_time(lambda: step_all(simulator, modeStates, actions)) / max(successors, 1)
+                     for modeStates in (plainStates, states)]
+        print("{:<28}{:>8}{:>12}{:>16.2f}{:>16.2f}{:>9.2f}x".format(
+            problemName, len(states), aggregated, costTimes[0] * 1e6, costTimes[1] * 1e6,
+            costTimes[0] / costTimes[1]))
+        steps.append((problemName, successors, stepTimes))
+    print()
+    print("{:<28}{:>12}{:>16}{:>16}{:>10}".format("problem", "successors", "us/step loop", "us/step aggr",
+                                                  "speedup"))
+    for problemName, successors, stepTimes in steps:
+        print("{:<28}{:>12}{:>16.1f}{:>16.1f}{:>9.2f}x".format(
+            problemName, successors, stepTimes[0] * 1e6, stepTimes[1] * 1e6, stepTimes[0] / stepTimes[1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Memory layout benchmark: bytes per grounded action and per UCT search node.
+
+The current layout is measured with tracemalloc. The equivalent __dict__ based layout is
+estimated by mirroring every object into an instance of a plain class with the same attributes,
+set in the same order, so the numbers before and after a layout change are comparable.
+
+Run from the repository root: python -m benchmarks.objectLayout
+"""
+import gc
+import tracemalloc
+from benchmarks import EXAMPLE_PROBLEMS, load_problem
+from search.UCTSearchEngine import Node
+
+# Number of UCT nodes to build per problem.
+NODES = 10000
+
+
+def ground_actions(simulator, state):
+    """Ground all valid actions of all vehicles in the state."""
+    actions = []
+    for entityActions in simulator.generate_all_valid_seperate_actions(state).values():
+        for vehicleActions in entityActions.values():
+            actions.extend(vehicleActions)
+    return actions
+
+
+def measure(build):
+    """
+    Measure the memory retained by the result of build().
+
+    Returns:
+        Tuple[Any, int]: The result and the retained bytes.
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def attribute_names(obj):
+    """Return an object's attribute names, slots (in declaration order) first."""
+    names = []
+    for cls in reversed(type(obj).__mro__):
+        for name in cls.__dict__.get("__slots__", ()):
+            if name not in ("__weakref__", "__dict__") and hasattr(obj, name):
+                names.append(name)
+    if hasattr(obj, "__dict__"):
+        names.extend(vars(obj))
+    return names
+
+
+# Plain class mirroring each class, shared by all mirrors.
+_plainClasses = {}
+
+
+class DictLayoutMirror:
+    """
+    Mirrors object graphs into plain __dict__ based objects.
+
+    A dry mirror walks the graph with the same bookkeeping but allocates no mirrors,
+    which lets the bookkeeping's own memory be subtracted.
+    """
+    def __init__(self, dry=False):
+        self.dry = dry
+        self.memo = {}
+        # Keeps mirrored sources alive, so their ids are not reused.
+        self.sources = []
+
+    def mirror(self, obj):
+        """Return the dict layout mirror of obj, sharing mirrors of shared objects."""
+        key = id(obj)
+        if key in self.memo:
+            return self.memo[key]
+        if isinstance(obj, (list, tuple)):
+            if self.dry:
+                result = obj
+                self.memo[key] = result
+                for value in obj:
+                    self.mirror(value)
+            elif isinstance(obj, list):
+                result = []
+                self.memo[key] = result
+                result.extend(self.mirror(value) for value in obj)
+            else:
+                result = tuple(self.mirror(value) for value in obj)
+                self.memo[key] = result
+        else:
+            names = attribute_names(obj)
+            if not names or type(obj).__module__ == "builtins" or isinstance(obj, type):
+                return obj
+            cls = type(obj)
+            plainClass = _plainClasses.get(cls)
+            if plainClass is None:
+                plainClass = _plainClasses[cls] = type(cls.__name__, (), {})
+            result = obj if self.dry else plainClass()
+            self.memo[key] = result
+            for name in names:
+                value = self.mirror(getattr(obj, name))
+                if not self.dry:
+                    setattr(result, name, value)
+        self.sources.append(obj)
+        return result
+
+
+def dict_layout_size(obj, shared) -> int:
+    """
+    Estimate the bytes obj's graph would take with __dict__ based objects.
+
+    Args:
+        obj (Any): The object graph to measure.
+        shared (Any): Objects obj may reference that aren't part of its cost.
+
+    Returns:
+        int: The estimated bytes.
+    """
+    # A first full mirror creates the plain classes.
+    DictLayoutMirror().mirror((shared, obj))
+    sizes = []
+    for dry in (True, False):
+        mirror = DictLayoutMirror(dry)
+        mirror.mirror(shared)
+        sizes.append(measure(lambda: mirror.mirror(obj))[1])
+    return sizes[1] - sizes[0]
+
+
+def main():
+    print("{:<28}{:>9}{:>15}{:>15}{:>13}{:>13}".format(
+        "problem", "actions", "B/action", "B/action dict", "B/node", "B/node dict"))
+    for domainName, problemName in EXAMPLE_PROBLEMS:
+        simulator, _ = load_problem(domainName, problemName)
+        state = simulator.get_state()
+
+        actions, actionsSize = measure(lambda: ground_actions(simulator, state))
+        # Objects shared with the generators aren't part of the grounded actions' cost.
+        actionsDictSize = dict_layout_size(actions, simulator.action_generators)
+
+        transition = actions[:1]
+
+        def build_nodes():
+            root = Node(state)
+            for _ in range(NODES - 1):
+                root.children.append(Node(state, parent=root, action=transition, g=1))
+            return root
+        root, nodesSize = measure(build_nodes)
+        nodesDictSize = dict_layout_size(root, (state, transition))
+
+        print("{:<28}{:>9}{:>15.0f}{:>15.0f}{:>13.0f}{:>13.0f}".format(
+            problemName, len(actions), actionsSize / len(actions), actionsDictSize / len(actions),
+            nodesSize / NODES, nodesDictSize / NODES))
+
+
+if __name__ == "__main__":
+    main()
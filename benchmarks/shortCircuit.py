@@ -0,0 +1,127 @@
+"""
+Short-circuit benchmark: eager operator nodes versus the short-circuiting and specialised nodes
+the expression parser produces (see CARRI.expression.make_operator_node).
+
+Preconditions are interpreted (not compiled) in both modes. Eager mode turns every operator node of the
+action generators' preconditions back into a plain OperatorNode, which evaluates all its operands
+before applying the operator, as the parser's nodes used to.
+
+Measures, per example problem, over the states of a random walk:
+- the number of expression node evaluations per precondition check (one check being a candidate parameter
+  value tested against the preconditions applicable to it, while expanding a state),
+- the time of the expansions.
+
+Run from the repository root: python -m benchmarks.shortCircuit
+"""
+import random
+from functools import wraps
+from benchmarks import EXAMPLE_PROBLEMS, load_problem
+from benchmarks.expressionCompiler import set_compiled, best_time
+from CARRI import expression
+from CARRI.action import ActionProducer
+from CARRI.expression import ExpressionNode, OperatorNode, iter_tree
+
+# Number of states of the random walk expanded per problem, and the walk's seed.
+WALK_LENGTH = 10
+SEED = 0
+
+
+class EvaluationCounter:
+    """Counts expression node evaluations and precondition checks, by wrapping the classes' methods."""
+    def __init__(self):
+        self.evaluations = 0
+        self.checks = 0
+        self.originals = []
+
+    def __enter__(self):
+        for cls in vars(expression).values():
+            if isinstance(cls, type) and issubclass(cls, ExpressionNode) and 'evaluate' in cls.__dict__:
+                self.wrap(cls, 'evaluate', 'evaluations')
+        self.wrap(ActionProducer, 'evaluate_partial_preconditions', 'checks')
+        return self
+
+    def __exit__(self, *exc):
+        for cls, name, method in self.originals:
+            setattr(cls, name, method)
+        self.originals = []
+
+    def wrap(self, cls, name: str, counterName: str):
+        """Replace a method of cls by one incrementing the counter counterName before calling it."""
+        method = cls.__dict__[name]
+        counter = self
+
+        @wraps(method)
+        def counted(*args, **kwargs):
+            setattr(counter, counterName, getattr(counter, counterName) + 1)
+            return method(*args, **kwargs)
+        self.originals.append((cls, name, method))
+        setattr(cls, name, counted)
+
+
+def set_eager(simulator, eager: bool, specialised: dict):
+    """
+    Make the action generators' operator nodes eager plain OperatorNodes, or restore their classes.
+
+    Args:
+        simulator (Simulator): The simulator.
+        eager (bool): True to make the nodes eager, False to restore them.
+        specialised (dict): Node -> its class, filled on the first call.
+    """
+    if not specialised:
+        for actionGenerator in simulator.action_generators:
+            for precondition in actionGenerator.preconditions + actionGenerator.conflictingPreconditions:
+                for node in iter_tree(precondition):
+                    if isinstance(node, OperatorNode) and type(node) is not OperatorNode:
+                        specialised[node] = type(node)
+    for node, cls in specialised.items():
+        node.__class__ = OperatorNode if eager else cls
+
+
+def random_walk(simulator, length: int, rng: random.Random):
+    """Return the states of a random walk of up to length states, from the initial state."""
+    problem = simulator.problem
+    state = simulator.get_state()
+    states = [state]
+    while len(states) < length:
+        actions = [action for entityActions in simulator.generate_all_valid_seperate_actions(state).values()
+                   for vehicleActions in entityActions.values() for action in vehicleActions]
+        if not actions:
+            break
+        state = state.__copy__()
+        rng.choice(actions).apply(problem, state)
+        for envStep in simulator.envSteps:
+            envStep.apply(problem, state)
+        simulator.iterStep.apply(problem, state)
+        states.append(state)
+    return states
+
+
+def expand(simulator, states):
+    """Expand every state - produce the actions of all vehicles."""
+    for state in states:
+        simulator.generate_all_valid_seperate_actions(state)
+
+
+def main():
+    print("{:<28}{:>8}{:>10}{:>14}{:>14}{:>14}{:>14}{:>10}".format(
+        "problem", "states", "checks", "evals eager", "evals short", "us/exp eager", "us/exp short", "speedup"))
+    for domainName, problemName in EXAMPLE_PROBLEMS:
+        simulator, _ = load_problem(domainName, problemName)
+        set_compiled(simulator, False)
+        states = random_walk(simulator, WALK_LENGTH, random.Random(SEED))
+        specialised = {}
+        results = {}
+        for eager in (True, False):
+            set_eager(simulator, eager, specialised)
+            with EvaluationCounter() as counter:
+                expand(simulator, states)
+            results[eager] = (counter.evaluations / max(counter.checks, 1), counter.checks,
+                              best_time(lambda: expand(simulator, states)) / len(states))
+        set_eager(simulator, False, specialised)
+        print("{:<28}{:>8}{:>10}{:>14.2f}{:>14.2f}{:>14.1f}{:>14.1f}{:>9.2f}x".format(
+            problemName, len(states), results[False][1], results[True][0], results[False][0],
+            results[True][2] * 1e6, results[False][2] * 1e6, results[True][2] / results[False][2]))
+
+
+if __name__ == "__main__":
+    main()
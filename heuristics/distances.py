@@ -1,40 +1,27 @@
-from typing import Dict, Set
-from queue import PriorityQueue
+from typing import Dict
+from math import inf
 from CARRI import Problem, State
 from .heuristic import Heuristic
 
-#Assumes problem has locAdj constant
-def location_map(problem: Problem, startingLocation: int) -> Dict[int, int]:
+def location_map(problem: Problem, startingLocation: int, vehicleType: int = None) -> Dict[int, float]:
     """
-    Unfinished
+    Get the shortest distances from a location, from the problem's distance oracle.
+
     Args:
-        problem:
-        startingLocation:
+        problem (Problem): The problem.
+        startingLocation (int): The location to measure from.
+        vehicleType (int, optional): Entity index of the vehicle type moving - restricts the
+                                     locations passed through by locType. None for no restriction.
 
     Returns:
-
+        Dict[int, float]: Reachable location -> its distance from startingLocation,
+                          empty if the problem has no adjacency constant.
     """
-    queue = PriorityQueue()
-    queue.put((startingLocation, 0))
-    map = dict()
-    if problem.get_adjacency_status() == Dict:
-        while queue:
-            currentLocation, currentDistance = queue.get()
-            map[currentLocation] = currentDistance
-            adjacentLocations = problem.get_adjacency_status()[currentLocation]
-            for location, distance in adjacentLocations.items():
-                if location not in map:
-                    queue.put((currentLocation, currentDistance + distance))
-
-    elif problem.get_adjacency_status() == Set:
-        while queue:
-            currentLocation, currentDistance = queue.get()
-            map[currentLocation] = currentDistance
-            adjacentLocations = problem.get_adjacency_status()[currentLocation]
-            for location in adjacentLocations:
-                if location not in map:
-                    queue.put((currentLocation, currentDistance + 1))
-    return map
+    oracle = problem.get_distance_oracle()
+    if oracle is None:
+        return {}
+    row = oracle.distances(vehicleType)[startingLocation]
+    return {location: float(distance) for location, distance in enumerate(row) if distance != inf}
 
 class DistanceHeuristic(Heuristic):
     """
@@ -42,11 +29,6 @@ class DistanceHeuristic(Heuristic):
     """
     def __init__(self, problem: Problem):
         super().__init__(problem)
-        maps={}
-        if problem.get_adjacency_status() != None:
-            for location in problem.locationRanges():
-                maps[location] = location_map(problem, location)
 
     def evaluate(self, state: State) -> int:
         return 1
-
@@ -5,6 +5,7 @@ import traceback
 from planner.planner import Planner
 from business import Business
 from CARRI import Simulator
+from CARRI.codec import encode_state, decode_state, PlanCodec, EncodedPlanDict
 
 class Manager:
     def __init__(self, simulator: Simulator, iterations, iterTime: int, transitionsPerIteration, **kwargs):
@@ -23,6 +24,8 @@ class Manager:
         plannerClass = kwargs.get("planner", Planner)
         # Initialize the planner
         self.planner = plannerClass(simulator, iterTime, transitionsPerIteration, **kwargs)
+        # States and plans cross the process boundary encoded
+        self.planCodec = PlanCodec(simulator.action_generators)
         self.totalPlan = []  # Accumulate the total plan
 
     def run(self, printPlan=False):
@@ -30,6 +33,8 @@ class Manager:
         print(f"Start")
         print(self.business)
         print("----------")
+        problem = self.business.simulator.problem
+        previousState = self.business.getState()
         # Execute iterations as long as possible
         while self.business.canAdvanceIteration():
             try:
@@ -37,8 +42,13 @@ class Manager:
             except Exception as e:
                 print(e)
                 break
-            print(self.business)
+            # Print only what changed since the previous iteration
+            state = self.business.getState()
+            print(f"Iteration: {self.business.getIteration()}")
+            print(problem.representDelta(previousState.diff(state)), end="")
+            print(f"Cost: {self.business.getCost()}")
             print("----------")
+            previousState = state
 
         pick_count, deliver_count = self.count_pick_deliver()
 
@@ -81,19 +91,21 @@ class Manager:
             'deliver counts': deliverCounts
         }
 
-    def planner_process(self, state, return_dict):
-        # Generate a plan using the planner
-        self.planner.generate_plan(state, return_dict)
+    def planner_process(self, encodedState, return_dict):
+        # Generate a plan using the planner, publishing encoded plans
+        state = decode_state(encodedState, self.planner.simulator.problem)
+        self.planner.generate_plan(state, EncodedPlanDict(return_dict, self.planCodec))
 
     def execute_iteration(self):
         # Execute a single iteration
         # Create a Manager to handle shared data between processes
         plan_manager = MPManager()
-        return_dict = plan_manager.dict()
+        return_dict = EncodedPlanDict(plan_manager.dict(), self.planCodec)
         return_dict['plan'] = []
 
         # Start the planner process
-        p = Process(target=self.planner_process, args=(self.business.getState(), return_dict))
+        p = Process(target=self.planner_process,
+                    args=(encode_state(self.business.getState()), return_dict.planDict))
         p.start()
 
         # Wait for the process to finish within the time limit
@@ -2,7 +2,6 @@ from .planner import *
 import random
 import numpy as np
 from collections import Counter
-from collections import defaultdict
 
 class GeneticPlanner(AssigningPlanner):
     def __init__(self, simulator, iterTime: float, transitionsPerIteration: int, **kwargs):
@@ -22,151 +21,13 @@ class GeneticPlanner(AssigningPlanner):
         self.avg_cost = 0
         self.vehicle_types = self.simulator.problem.get_vehicle_types()
 
-        try:
-            self.loc_type, adjacency_tuple = self.simulator.problem.get_consts()
-            # Compute type-based distances and sinks
-            type_distances, self.type_sinks = self.compute_type_based_distances(
-                self.loc_type, adjacency_tuple, set(self.vehicle_types)
-            )
-        except:
-            self.type_sinks = {}
-            self.loc_type = []
-
-    def detect_dynamic_sinks(self, loc_type, adjacency_tuple, vehicle_types):
-        """
-        Identify sinks for each vehicle type dynamically by analyzing reachability.
-        """
-        num_locations = len(adjacency_tuple)
-        sinks = {v_type: set() for v_type in vehicle_types}
-
-        for v_type in vehicle_types:
-            accessible_nodes = {i for i, t in enumerate(loc_type) if t == 0 or t == v_type}
-
-            for start_loc in range(num_locations):
-                if start_loc not in accessible_nodes:
-                    continue  # Skip locations not accessible to the current vehicle type
-
-                visited = set()
-                stack = [start_loc]
-                is_sink = True
-
-                while stack:
-                    current = stack.pop()
-                    if current in visited:
-                        continue
-                    visited.add(current)
-
-                    neighbors = adjacency_tuple[current]
-                    if isinstance(neighbors, dict):  # Weighted graph
-                        neighbors = neighbors.keys()
-
-                    valid_neighbors = [
-                        n for n in neighbors if n in accessible_nodes and n not in visited
-                    ]
-
-                    if valid_neighbors:
-                        is_sink = False  # Found a valid exit, not a sink
-                        break
-                    stack.extend(valid_neighbors)
-
-                if is_sink:
-                    sinks[v_type].add(start_loc)
-
-        return sinks
-
-    def compute_all_pairs_shortest_distances(self, adjacency_tuple):
-        num_nodes = len(adjacency_tuple)
-
-        if num_nodes == 0:
-            return {}, set()  # Return an empty dictionary and no sinks
-
-        first_entry = adjacency_tuple[0]
-        is_weighted = isinstance(first_entry, dict)
-
-        # Initialize distance matrix
-        distance = defaultdict(lambda: defaultdict(lambda: float('inf')))
-        outgoing_edges = {node: 0 for node in range(num_nodes)}  # Track outgoing edges
-
-        for from_node in range(num_nodes):
-            distance[from_node][from_node] = 0  # Distance to self is zero
-            neighbors = adjacency_tuple[from_node]
-
-            if is_weighted:
-                for to_node, weight in neighbors.items():
-                    distance[from_node][to_node] = weight
-                    outgoing_edges[from_node] += 1
-            else:
-                for to_node in neighbors:
-                    distance[from_node][to_node] = 1  # Unweighted edge has weight 1
-                    outgoing_edges[from_node] += 1
-
-        # Apply Floyd-Warshall Algorithm
-        for k in range(num_nodes):
-            for i in range(num_nodes):
-                # Skip if there's no path from i to k
-                if distance[i][k] == float('inf'):
-                    continue
-                for j in range(num_nodes):
-                    # Skip if there's no path from k to j
-                    if distance[k][j] == float('inf'):
-                        continue
-                    if distance[i][j] > distance[i][k] + distance[k][j]:
-                        distance[i][j] = distance[i][k] + distance[k][j]
-
-        # Identify sinks (nodes with no outgoing edges)
-        sinks = {node for node, out_degree in outgoing_edges.items() if out_degree == 0}
-
-        # Construct the result dictionary
-        distance_dict = {}
-        for from_node in range(num_nodes):
-            for to_node in range(num_nodes):
-                dist = distance[from_node][to_node]
-                if dist != float('inf'):
-                    distance_dict[(from_node, to_node)] = dist
-                else:
-                    distance_dict[(from_node, to_node)] = None  # or use sys.maxsize or another indicator
-
-        return distance_dict, sinks
-
-    def compute_type_based_distances(self, locType, adjacency_tuple, vehicle_types):
-        type_distance_dicts = {}
-        type_sinks = {}
-
-        num_nodes = len(adjacency_tuple)
-
-        # Dynamic sinks detection
-        dynamic_sinks = self.detect_dynamic_sinks(locType, adjacency_tuple, vehicle_types)
-
-        for v_type in vehicle_types:
-            # Determine accessible nodes: type 0 and the current vehicle type
-            accessible_nodes = {node for node, t in enumerate(locType) if t == 0 or t == v_type}
-
-            # Create a filtered adjacency tuple for the current vehicle type
-            filtered_adjacency = []
-            for from_node in range(num_nodes):
-                if from_node not in accessible_nodes:
-                    filtered_adjacency.append({})
-                    continue  # Skip inaccessible nodes
-                neighbors = adjacency_tuple[from_node]
-                if isinstance(neighbors, dict):
-                    # Weighted graph
-                    filtered_neighbors = {to_node: weight for to_node, weight in neighbors.items() if to_node in accessible_nodes}
-                else:
-                    # Unweighted graph
-                    filtered_neighbors = {to_node for to_node in neighbors if to_node in accessible_nodes}
-                filtered_adjacency.append(filtered_neighbors)
-
-            # Compute all pair shortest distances and static sinks for the filtered adjacency
-            distance_dict, static_sinks = self.compute_all_pairs_shortest_distances(filtered_adjacency)
-
-            # Merge static and dynamic sinks
-            combined_sinks = static_sinks.union(dynamic_sinks[v_type])
-
-            # Store in the result dictionaries
-            type_distance_dicts[v_type] = distance_dict
-            type_sinks[v_type] = combined_sinks
-
-        return type_distance_dicts, type_sinks
+        schema = self.simulator.problem.schema
+        self.loc_type = schema.locationTypes or ()
+        # Locations per non-zero location type
+        self.special_locations = schema.locationsByType
+        # Sinks per vehicle type, from the problem's shared distance oracle
+        oracle = self.simulator.problem.get_distance_oracle()
+        self.type_sinks = {} if oracle is None else {v_type: oracle.sinks(v_type) for v_type in set(self.vehicle_types)}
 
     def initialize_population(self, initial_state, **kwargs):
         self.prev_state_chrom = initial_state
@@ -205,7 +66,7 @@ class GeneticPlanner(AssigningPlanner):
                 elif action.baseAction == 'Wait':
                     total_waits += 1
                 elif action.baseAction == 'Travel':
-                    if len(self.type_sinks.values()) == 0:
+                    if len(self.type_sinks.values()) == 0 or vehicle_idx >= len(self.vehicle_types):
                         continue
                     destinations = [action.params[j].value for j in range(len(action.params))]
                     vehicle_type = self.vehicle_types[vehicle_idx]
@@ -242,13 +103,7 @@ class GeneticPlanner(AssigningPlanner):
                     duplicate_locations_reward += reward
 
         # Special locations
-        special_dict = {}
-        keys = [special for special in self.loc_type if special != 0]
-        special_dict = {key: [] for key in keys}
-        for key in keys:
-            for i, type in enumerate(self.loc_type):
-                if type == key:
-                    special_dict[key].append(i)
+        special_dict = self.special_locations
 
         if len(special_dict) > 0:
             for j, vehicle_loc in enumerate(locations):
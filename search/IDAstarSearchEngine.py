@@ -26,6 +26,9 @@ class IDAStarSearchEngine(SearchEngine):
         # Initialize the bound with heuristic value
         bound = self.heuristic.evaluate(state)
         path = []
+        # Children are expanded in place on a private copy, undoing their effects on the way back.
+        state = state.__copy__()
+        state.mark()
 
         while True:
             result = self._search(state, path, 0, bound)
@@ -50,28 +53,29 @@ class IDAStarSearchEngine(SearchEngine):
             # Continue searching for better plans
 
         min_bound = float('inf')
-        successors = self.simulator.generate_successors(state)
-        if not successors:
-            return float('inf')  # Dead-end reached
-
-        # Evaluate successors and sort them
+        # Evaluate successors in place and sort them
         successor_list = []
-        for successor_state, actions, cost in successors:
-            h = self.heuristic.evaluate(successor_state)
+        for actions, cost in self.simulator.generate_successors_in_place(state):
+            h = self.heuristic.evaluate(state)
             total_cost = g + cost + h
-            successor_list.append((successor_state, actions, cost, total_cost))
+            successor_list.append((actions, cost, total_cost))
+        if not successor_list:
+            return float('inf')  # Dead-end reached
 
         # Sort successors by total estimated cost (g + h)
-        successor_list.sort(key=lambda x: x[3])
+        successor_list.sort(key=lambda x: x[2])
 
         # Prune successors to consider only the best ones
         pruned_successors = successor_list[:self.max_successors]
 
-        for successor_state, actions, cost, _ in pruned_successors:
+        for actions, cost, _ in pruned_successors:
+            mark = state.mark()
+            self.simulator.apply_full_transition(state, 0, actions)
             path.append(actions)
-            temp = self._search(successor_state, path, g + cost, bound)
+            temp = self._search(state, path, g + cost, bound)
             if temp < min_bound:
                 min_bound = temp
             path.pop()
+            state.rollback(mark)
 
-        return min_bound
\ No newline at end of file
+        return min_bound
@@ -1,13 +1,17 @@
 from .searchEngine import *
 from .partialAssigner import PartialAssigner
 from CARRI import Simulator, State
+from CARRI.stateArena import StateArena
 import random
 import math
 from typing import List, Tuple
 
 class Node:
-    def __init__(self, state, parent=None, action=None, g=0):
-        self.state = state
+    __slots__ = ('state', 'parent', 'action', 'children', 'visits', 'total_cost', 'g', 'untried_actions', 'handle')
+
+    def __init__(self, state, parent=None, action=None, g=0, handle=None):
+        self.state = state  # None when the state is kept in a StateArena
+        self.handle = handle  # The state's handle in the StateArena, if kept there
         self.parent = parent
         self.action = action  # List of actions that led to this node from parent
         self.children = []
@@ -26,9 +30,21 @@ class UCTSearchEngine(SearchEngine):
         self.bestPlan = None
         self.best_avg_cost = float('inf')
         self.exploration_constant = kwargs.get('exploration_constant', 1.0)
+        # Optional StatePool - nodes then hold canonical states and duplicate successors are merged
+        self.statePool = kwargs.get('statePool', None)
+        # Optional StateArena (True for a new one) - nodes then hold handles to states stored in it
+        self.stateArena = kwargs.get('stateArena', None)
+        if self.stateArena is True:
+            self.stateArena = StateArena(simulator.problem)
 
     def search(self, state: State, planDict: Dict, **kwargs):
-        self.rootNode = Node(state)
+        if self.statePool is not None:
+            # Interning freezes the state, so the caller's state is left mutable
+            state = self.statePool.intern(state.__copy__())
+        if self.stateArena is not None:
+            # States of a previous search are all freed at once
+            self.stateArena.clear()
+        self.rootNode = self.new_node(self.store_state(state))
         self.planDict = planDict
         self.node_map = {self.state_key(state): self.rootNode}
 
@@ -72,7 +88,7 @@ class UCTSearchEngine(SearchEngine):
             if node.untried_actions:
                 # Expand a new child with an untried action
                 actions, action_cost, next_state = node.untried_actions.pop()
-                child_node = Node(next_state, parent=node, action=actions, g=node.g + action_cost)
+                child_node = self.new_node(next_state, parent=node, action=actions, g=node.g + action_cost)
                 node.children.append(child_node)
                 path.append(child_node)
                 node = child_node
@@ -88,16 +104,30 @@ class UCTSearchEngine(SearchEngine):
     def get_untried_actions(self, node):
         # Use partialAssigner to generate possible actions from this node
         # Generate a few possible next steps
-        paths = self.partialAssigner.produce_paths(node.state, steps=1, maxStates=10)
+        paths = self.partialAssigner.produce_paths(self.node_state(node), steps=1, maxStates=10)
         untried_actions = []
         if not paths:
             return untried_actions
+        # Canonical state: index in untried_actions, with a pool
+        seen = {}
         for path in paths:
             # Each path is a tuple: ([state2[0], state], [transitions], [costs per action], [env costs per action])
             next_state = path[0][1]  # The resulting state after the action
             actions = path[1][0]      # Actions at step 0
             action_cost = path[2][0] + path[3][0]  # Sum of action cost and environment cost at step 0
+            if self.statePool is not None:
+                next_state = self.statePool.intern(next_state)
+                index = seen.get(id(next_state))
+                if index is not None:
+                    # Duplicate successor - keep the cheaper transition to it
+                    if action_cost < untried_actions[index][1]:
+                        untried_actions[index] = (actions, action_cost, next_state)
+                    continue
+                seen[id(next_state)] = len(untried_actions)
             untried_actions.append((actions, action_cost, next_state))
+        if self.stateArena is not None:
+            untried_actions = [(actions, action_cost, self.store_state(next_state))
+                               for actions, action_cost, next_state in untried_actions]
         return untried_actions
 
     def best_child(self, node) -> Node:
@@ -121,7 +151,7 @@ class UCTSearchEngine(SearchEngine):
 
     def rollout(self, node) -> Tuple[List[List[Action]], float]:
         # Perform a simulation from the given node using partialAssigner
-        plan, cost = self.partialAssigner.provideTransitionsAndCost(node.state, steps=self.maxSteps)
+        plan, cost = self.partialAssigner.provideTransitionsAndCost(self.node_state(node), steps=self.maxSteps)
         return plan, cost
 
     def backup(self, path: List[Node], total_cost: float):
@@ -140,6 +170,24 @@ class UCTSearchEngine(SearchEngine):
         full_plan.extend(rollout_plan)
         return full_plan
 
+    def store_state(self, state: State):
+        """Return what nodes keep of a state: the state, or its handle when a StateArena is used."""
+        if self.stateArena is None:
+            return state
+        return self.stateArena.store(state)
+
+    def new_node(self, stored, parent=None, action=None, g=0) -> Node:
+        """Create a node for a state as returned by store_state."""
+        if self.stateArena is None:
+            return Node(stored, parent=parent, action=action, g=g)
+        return Node(None, parent=parent, action=action, g=g, handle=stored)
+
+    def node_state(self, node: Node) -> State:
+        """Return a node's state - loaded from the StateArena if it's kept there."""
+        if node.state is not None:
+            return node.state
+        return self.stateArena.load(node.handle)
+
     def state_key(self, state: State) -> int:
-        # Generate a unique key for the state (ensure State has __hash__ and __eq__ methods)
-        return hash(state)
+        # The state's fingerprint is maintained incrementally, so no rehashing is needed
+        return state.fingerprint